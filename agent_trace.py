@@ -0,0 +1,218 @@
+"""
+Tracing for the agent CLI: spans for each turn, model request, tool call, MCP call and HA HTTP
+call, with durations, payload sizes and cache hits.
+
+Off unless AGENT_TRACE names a file; the spans of each turn are appended to it when the turn ends.
+The default format is Chrome trace JSON, which chrome://tracing and ui.perfetto.dev open: one
+lane per asyncio task, so a model step's concurrent tool calls sit side by side. With
+AGENT_TRACE_FORMAT=otlp the file holds OTLP/JSON lines instead, one export request per turn, like
+the OpenTelemetry collector's file exporter writes.
+"""
+import asyncio
+import atexit
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+from pydantic_ai.models.wrapper import WrapperModel
+
+TRACE_PATH = os.environ.get("AGENT_TRACE")
+TRACE_FORMAT = os.environ.get("AGENT_TRACE_FORMAT", "chrome").lower()
+ENABLED = bool(TRACE_PATH)
+MAX_ATTRIBUTE = 200  # characters kept of string attributes such as prompts and arguments
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    lane: int
+    start_ns: int
+    end_ns: int = 0
+    attributes: dict = field(default_factory=dict)
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("agent_trace_span", default=None)
+
+
+class Tracer:
+    """Collects finished spans and appends them to `path` on flush()."""
+
+    def __init__(self, path: str, fmt: str = "chrome"):
+        self.path = path
+        self.format = fmt
+        self.finished: list[Span] = []
+        self.lanes: dict[int, int] = {}
+        self.opened = False
+        self.lock = threading.Lock()
+
+    def _lane(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        return self.lanes.setdefault(id(task), len(self.lanes) + 1)
+
+    def start(self, name: str, start_ns: Optional[int] = None, **attributes) -> Span:
+        parent = _current.get()
+        return Span(name, parent.trace_id if parent else secrets.token_hex(16), secrets.token_hex(8),
+                    parent.span_id if parent else None, self._lane(), start_ns or time.time_ns(),
+                    attributes={k: _attribute(v) for k, v in attributes.items()})
+
+    def finish(self, span: Span, end_ns: Optional[int] = None):
+        span.end_ns = end_ns or time.time_ns()
+        with self.lock:
+            self.finished.append(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = self.start(name, **attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attributes["error"] = _attribute(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current.reset(token)
+            self.finish(span)
+
+    def flush(self):
+        with self.lock:
+            spans, self.finished = self.finished, []
+        if not spans:
+            return
+        with open(self.path, "a" if self.opened else "w") as f:
+            if self.format == "otlp":
+                f.write(json.dumps(_otlp(spans)) + "\n")
+            else:
+                # The JSON array format allows a missing "]", so each flush can simply append.
+                f.write(("[\n" if not self.opened else ",\n") + ",\n".join(json.dumps(_chrome(s)) for s in spans))
+        self.opened = True
+
+    def close(self):
+        self.flush()
+        if self.opened and self.format != "otlp":
+            with open(self.path, "a") as f:
+                f.write("\n]\n")
+
+
+def _attribute(value):
+    if isinstance(value, (bool, int, float)) or value is None:
+        return value
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    return text if len(text) <= MAX_ATTRIBUTE else text[:MAX_ATTRIBUTE] + "..."
+
+
+def _chrome(span: Span) -> dict:
+    return {"name": span.name, "cat": span.name.split(" ", 1)[0], "ph": "X", "pid": os.getpid(),
+            "tid": span.lane, "ts": span.start_ns / 1000, "dur": (span.end_ns - span.start_ns) / 1000,
+            "args": dict(span.attributes, span_id=span.span_id, parent_id=span.parent_id)}
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": "" if value is None else str(value)}
+
+
+def _otlp(spans: list[Span]) -> dict:
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "aspire-agent"}},
+                                    {"key": "process.pid", "value": {"intValue": str(os.getpid())}}]},
+        "scopeSpans": [{"scope": {"name": "agent_trace"}, "spans": [{
+            "traceId": s.trace_id, "spanId": s.span_id, "parentSpanId": s.parent_id or "",
+            "name": s.name, "kind": 1, "startTimeUnixNano": str(s.start_ns), "endTimeUnixNano": str(s.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items() if k != "error"],
+            "status": {"code": 2, "message": s.attributes["error"]} if "error" in s.attributes else {"code": 0},
+        } for s in spans]}],
+    }]}
+
+
+TRACER = Tracer(TRACE_PATH, TRACE_FORMAT) if ENABLED else None
+if TRACER:
+    atexit.register(TRACER.close)
+
+
+# --- Instrumentation ---
+def span(name: str, **attributes):
+    """A span around a block; a no-op context when tracing is off."""
+    return TRACER.span(name, **attributes) if TRACER else nullcontext()
+
+
+def annotate(**attributes):
+    """Add attributes to the current span, if any."""
+    current = _current.get() if TRACER else None
+    if current is not None:
+        current.attributes.update({k: _attribute(v) for k, v in attributes.items()})
+
+
+def flush():
+    if TRACER:
+        TRACER.flush()
+
+
+def payload_size(value) -> int:
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return len(json.dumps(value, default=str))
+
+
+def traced_tool(tool):
+    """Wrap an async tool in a `tool <name>` span with its arguments and result size."""
+    if not ENABLED:
+        return tool
+
+    @functools.wraps(tool)
+    async def wrapper(*args, **kwargs):
+        with span(f"tool {tool.__name__}", arguments=kwargs or list(args)):
+            result = await tool(*args, **kwargs)
+            annotate(result_bytes=payload_size(result))
+            return result
+    return wrapper
+
+
+def http_hooks() -> Optional[dict]:
+    """httpx event hooks recording one `http` span per request, body download included."""
+    if not ENABLED:
+        return None
+
+    async def on_request(request):
+        request.extensions["agent_trace_start"] = time.time_ns()
+
+    async def on_response(response):
+        await response.aread()
+        request = response.request
+        try:
+            sent = len(request.content)
+        except Exception:  # a streamed request body
+            sent = None
+        TRACER.finish(TRACER.start(f"http {request.method} {request.url.path}",
+                                   request.extensions.get("agent_trace_start"), method=request.method,
+                                   path=request.url.path, status=response.status_code,
+                                   request_bytes=sent, response_bytes=len(response.content)))
+    return {"request": [on_request], "response": [on_response]}
+
+
+class TracedModel(WrapperModel):
+    """A `model.request` span per model step, with its token usage and the tool calls it asked for."""
+
+    async def request(self, messages, *args, **kwargs):
+        with span("model.request", model=self.model_name, messages=len(messages)):
+            response = await super().request(messages, *args, **kwargs)
+            tool_calls = [p.tool_name for p in response.parts if p.part_kind == "tool-call"]
+            annotate(request_tokens=response.usage.request_tokens, response_tokens=response.usage.response_tokens,
+                     tool_calls=len(tool_calls), tools=",".join(tool_calls))
+            return response
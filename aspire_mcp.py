@@ -0,0 +1,138 @@
+"""
+MCP servers for the agent CLI: SSE clients that cache the tool list per session and report a
+dropped session as MCPConnectionLost, so the CLI can reconnect (see pydantic_al_aspire_agent).
+"""
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+import anyio
+import httpx
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+from pydantic_ai.exceptions import ModelRetry
+from pydantic_ai.mcp import MCPServerHTTP
+import agent_trace
+
+with open(Path(__file__).parent / "mcp_config.json") as f:
+    MCP_CONFIG = json.load(f)["mcpServers"]
+
+# Seconds a cached MCP tool list stays valid; 0 keeps it until the session reconnects.
+MCP_TOOLS_TTL = float(os.environ.get("MCP_TOOLS_TTL", "0"))
+
+# Raised by a dropped MCP session (e.g. the SSE stream ends when HA restarts).
+CONNECTION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, httpx.TransportError)
+
+class MCPConnectionLost(Exception):
+    """The MCP session is gone; re-entering agent.run_mcp_servers() reconnects."""
+
+def connection_lost(e: BaseException) -> bool:
+    if isinstance(e, BaseExceptionGroup):
+        return any(connection_lost(inner) for inner in e.exceptions)
+    return isinstance(e, (MCPConnectionLost, *CONNECTION_ERRORS))
+
+@dataclass
+class CachedMCPServerHTTP(MCPServerHTTP):
+    """MCPServerHTTP that lists tools once per session instead of on every model request."""
+
+    tools_ttl: float = 0
+
+    async def __aenter__(self):
+        self._tools = None
+        return await super().__aenter__()
+
+    async def list_tools(self):
+        with agent_trace.span("mcp.list_tools", url=self.url):
+            tools = getattr(self, "_tools", None)
+            hit = not (tools is None or (self.tools_ttl and time.monotonic() - self._tools_at > self.tools_ttl))
+            if not hit:
+                try:
+                    self._tools = tools = await super().list_tools()
+                except McpError as e:
+                    if e.error.code == CONNECTION_CLOSED:
+                        raise MCPConnectionLost(e.error.message) from e
+                    raise
+                self._tools_at = time.monotonic()
+            agent_trace.annotate(cache_hit=hit, tools=len(tools))
+            return tools
+
+    async def call_tool(self, tool_name, arguments, *args, **kwargs):
+        with agent_trace.span(f"mcp.call_tool {tool_name}", tool=tool_name, arguments=arguments,
+                              request_bytes=agent_trace.payload_size(arguments) if agent_trace.ENABLED else None):
+            try:
+                result = await super().call_tool(tool_name, arguments, *args, **kwargs)
+            except ModelRetry as e:
+                # pydantic-ai turns every McpError into a retry, a closed session included.
+                if e.message == "Connection closed":
+                    raise MCPConnectionLost(e.message) from e
+                raise
+            except CONNECTION_ERRORS as e:
+                raise MCPConnectionLost(repr(e)) from e
+            if agent_trace.ENABLED:
+                agent_trace.annotate(result_bytes=agent_trace.payload_size(result))
+            return result
+
+def debug_mcp_events():
+    import sseclient
+    import requests
+    print("[DEBUG] Connecting to MCP SSE endpoint for event debug...")
+    resp = requests.get(
+        MCP_CONFIG["Aspire New"]["env"]["SSE_URL"],
+        headers={
+            "Authorization": f"Bearer {os.environ.get('ASPIRE_MCP_TOKEN')}",
+            "Accept": "text/event-stream"
+        },
+        stream=True,
+        timeout=15,
+    )
+    resp.encoding = 'utf-8'
+    try:
+        client = sseclient.SSEClient(resp.iter_content(decode_unicode=True))
+        for i, event in enumerate(client.events()):
+            print(f"[DEBUG] SSE event {i}: type={event.event!r} data={event.data!r}")
+            if i >= 3:
+                break
+    except Exception as e:
+        print("[DEBUG] Exception while reading SSE events:", repr(e))
+    finally:
+        resp.close()
+
+def get_aspire_mcp_server():
+    """Return an MCPServerHTTP instance for Aspire New MCP (SSE transport)."""
+    cfg = MCP_CONFIG["Aspire New"]["env"]
+    token = os.environ.get("ASPIRE_MCP_TOKEN")
+    headers = {"Accept": "text/event-stream"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    print("[DEBUG] Attempting MCPServerHTTP connection with:")
+    print(f"  URL: {cfg['SSE_URL']}")
+    print(f"  Headers: {headers}")
+    try:
+        server = CachedMCPServerHTTP(
+            url=cfg["SSE_URL"],
+            headers=headers,
+            timeout=15,
+            sse_read_timeout=300,
+            tools_ttl=MCP_TOOLS_TTL,
+        )
+        print("[DEBUG] MCPServerHTTP instance created successfully.")
+        return server
+    except Exception as e:
+        print("[DEBUG] MCPServerHTTP connection failed:", repr(e), type(e), e.args)
+        raise
+
+def get_context7_mcp_server():
+    """Return an MCPServerHTTP instance for context7 MCP (SSE transport), configurable via .env or mcp_config.json."""
+    url = os.environ.get("CONTEXT7_MCP_SSE_URL")
+    token = os.environ.get("CONTEXT7_MCP_TOKEN")
+    if not url:
+        cfg = MCP_CONFIG.get("context7", {}).get("env", {})
+        url = cfg.get("SSE_URL")
+        token = cfg.get("API_ACCESS_TOKEN")
+    if url:
+        headers = {"Accept": "text/event-stream"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return CachedMCPServerHTTP(url=url, headers=headers, timeout=15, sse_read_timeout=300, tools_ttl=MCP_TOOLS_TTL)
+    return None
@@ -0,0 +1,279 @@
+"""
+Aspire Home Assistant tool functions for the pydantic-ai agent.
+All tools are async and share one pooled httpx client, so the tool calls a model
+issues in a single step run concurrently instead of queueing behind each other.
+"""
+import asyncio
+import functools
+import inspect
+import json
+import os
+from pathlib import Path
+from typing import Optional
+import httpx
+from pydantic_ai.tools import Tool
+from agent_trace import annotate, http_hooks, traced_tool
+from ha_bulk import ACTIONS, PROTECTED_DOMAINS, execute, plan, select, summarize
+from ha_client import build_client
+from ha_coalesce import ServiceCoalescer
+from ha_entity_store import EntityStore
+from ha_instance import config_url
+from intent_router import IntentRouter, parse_macros
+from response_cache import LRUCache
+from tool_shaping import compact_attributes, compact_state, entity_page, fit
+
+# Defaults to the "Aspire New" Home Assistant in mcp_config.json.
+API_URL = os.environ.get("ASPIRE_API_URL") or f"{config_url(Path(__file__).parent / 'mcp_config.json', 'Aspire New') or 'http://localhost:8123'}/api"
+API_TOKEN = os.environ.get("ASPIRE_MCP_TOKEN")
+
+# --- Shared client ---
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_client() -> httpx.AsyncClient:
+    """The pooled client for the running event loop (pooled connections can't cross loops)."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client = build_client(API_URL, API_TOKEN, event_hooks=http_hooks())
+        _client_loop = loop
+    return _client
+
+async def close_client():
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client = _client_loop = None
+
+async def fetch_states() -> list[dict]:
+    resp = await get_client().get("/states")
+    resp.raise_for_status()
+    return resp.json()
+
+# One /api/states snapshot shared by every listing tool for HA_ENTITY_TTL seconds.
+STORE = EntityStore(fetch_states, ttl=float(os.environ.get("HA_ENTITY_TTL", "5")))
+
+def warm_entities() -> asyncio.Task:
+    """Load the entity snapshot in the background (no-op if it is still fresh)."""
+    task = asyncio.ensure_future(STORE.index())
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
+async def _post_service(domain: str, service: str, data: dict):
+    resp = await get_client().post(f"/services/{domain}/{service}", json=data)
+    resp.raise_for_status()
+    return resp.json()
+
+# Parallel turn_on/turn_off calls from one model step become one multi-entity HA call.
+COALESCER = ServiceCoalescer(_post_service, window=float(os.environ.get("HA_COALESCE_WINDOW_MS", "10")) / 1000)
+
+# Read-only tool results, keyed by tool, arguments and the state fingerprint they were computed at,
+# and answers to read-only prompts, keyed by normalized prompt and fingerprint (see the agent CLI).
+CACHE_ENABLED = os.environ.get("AGENT_CACHE", "1").lower() not in {"0", "false", "no", "off"}
+TOOL_CACHE = LRUCache(
+    max_entries=int(os.environ.get("AGENT_TOOL_CACHE_ENTRIES", "512")),
+    max_bytes=int(os.environ.get("AGENT_TOOL_CACHE_BYTES", str(8 * 1024 * 1024))),
+)
+
+PROMPT_CACHE = LRUCache(
+    max_entries=int(os.environ.get("AGENT_PROMPT_CACHE_ENTRIES", "128")),
+    max_bytes=int(os.environ.get("AGENT_PROMPT_CACHE_BYTES", str(1024 * 1024))),
+)
+READ_ONLY_TOOLS: set[str] = set()
+_MISS = object()
+
+def invalidate_caches():
+    STORE.invalidate()
+    TOOL_CACHE.clear()
+    PROMPT_CACHE.clear()
+
+def memoize(tool):
+    """Serve repeated calls of a read-only tool from TOOL_CACHE while the states are unchanged."""
+    signature = inspect.signature(tool)
+
+    @functools.wraps(tool)
+    async def wrapper(*args, **kwargs):
+        if not CACHE_ENABLED:
+            return await tool(*args, **kwargs)
+        arguments = tuple(signature.bind(*args, **kwargs).arguments.items())
+        key = (tool.__name__, arguments, await STORE.fingerprint())
+        result = TOOL_CACHE.get(key, _MISS)
+        annotate(cache_hit=result is not _MISS)
+        if result is _MISS:
+            result = await tool(*args, **kwargs)
+            TOOL_CACHE.put(key, result)
+        return result
+    return read_only(wrapper)
+
+def read_only(tool):
+    """Mark a tool as not changing HA, so prompts that only used such tools can be cached."""
+    READ_ONLY_TOOLS.add(tool.__name__)
+    return tool
+
+async def call_service(domain: str, service: str, data: dict):
+    try:
+        return await COALESCER.call(domain, service, data)
+    finally:
+        invalidate_caches()
+
+# --- Fast path ---
+# Unambiguous simple commands are executed here without a model round trip.
+INTENT_ROUTER_ENABLED = os.environ.get("INTENT_ROUTER", "1").lower() not in {"0", "false", "no", "off"}
+# e.g. "good night=script.bedtime, movie time=scene.movie"; none are built in.
+INTENT_MACROS = parse_macros(os.environ.get("INTENT_MACROS", ""))
+_router: Optional[IntentRouter] = None
+_router_index = None
+
+async def fast_path(utterance: str) -> Optional[str]:
+    """Execute `utterance` directly if the intent router resolves it, else return None."""
+    global _router, _router_index
+    if not INTENT_ROUTER_ENABLED:
+        return None
+    # Names don't change with states, so any snapshot will do and the router is rebuilt only
+    # when a newer one has been loaded anyway.
+    try:
+        index = await STORE.latest()
+    except (httpx.HTTPError, OSError) as e:
+        # HA unreachable: let the model answer (it may not need HA at all).
+        print(f"[WARN] Intent router skipped, no entity snapshot: {e!r}")
+        return None
+    if index is not _router_index:
+        _router, _router_index = IntentRouter(index, INTENT_MACROS), index
+    intent = _router.match(utterance)
+    if intent is None:
+        return None
+    await call_service(intent.domain, intent.service, dict(intent.data, entity_id=intent.entity_ids))
+    return intent.describe()
+
+# Approximate token budget for one tool result; listings are paginated to fit.
+TOOL_TOKEN_BUDGET = int(os.environ.get("AGENT_TOOL_TOKEN_BUDGET", "800"))
+# bulk_action: service calls in flight at once, and entities per service call.
+BULK_CONCURRENCY = int(os.environ.get("AGENT_BULK_CONCURRENCY", "4"))
+BULK_MAX_ENTITIES = int(os.environ.get("AGENT_BULK_MAX_ENTITIES", "50"))
+
+# --- Tools ---
+@traced_tool
+@memoize
+async def list_entities(cursor: Optional[str] = None) -> dict:
+    """Entity counts per domain and a page of entity ids; pass `next_cursor` back for more."""
+    return entity_page(await STORE.entity_ids(), TOOL_TOKEN_BUDGET, cursor)
+
+@traced_tool
+@memoize
+async def list_entities_by_domain(domain: str, cursor: Optional[str] = None) -> dict:
+    return entity_page(await STORE.by_domain(domain), TOOL_TOKEN_BUDGET, cursor)
+
+@traced_tool
+@memoize
+async def filter_entities_by_state(domain: str, state: str, cursor: Optional[str] = None) -> dict:
+    return entity_page(await STORE.by_state(domain, state), TOOL_TOKEN_BUDGET, cursor)
+
+@traced_tool
+async def refresh_entities() -> dict:
+    """Force a fresh /api/states download and return entity cache statistics."""
+    invalidate_caches()
+    await STORE.refresh()
+    return dict(STORE.stats(), tool_cache=TOOL_CACHE.stats())
+
+# Single-entity reads always GET the entity itself: keying them on the whole-house fingerprint
+# would download /api/states first and could serve a state up to HA_ENTITY_TTL seconds old.
+@traced_tool
+@read_only
+async def show_entity_attributes(entity_id: str) -> dict:
+    resp = await get_client().get(f"/states/{entity_id}")
+    if resp.status_code != 200:
+        print(f"Entity {entity_id} not found.")
+        return {}
+    attributes = resp.json().get("attributes", {})
+    print(json.dumps(attributes, indent=2, sort_keys=True))
+    shaped = {"entity_id": entity_id}
+    # friendly_name is dropped from the attributes as noise; keep it as `name`, like get_state.
+    if attributes.get("friendly_name"):
+        shaped["name"] = attributes["friendly_name"]
+    shaped["attributes"] = compact_attributes(attributes)
+    return fit(shaped, TOOL_TOKEN_BUDGET)
+
+@traced_tool
+@memoize
+async def list_lights(cursor: Optional[str] = None) -> dict:
+    """Return a page of Home Assistant light entities (entity_ids starting with 'light.')."""
+    print("[DEBUG] list_lights tool called")
+    return entity_page(await STORE.by_domain("light"), TOOL_TOKEN_BUDGET, cursor)
+
+@traced_tool
+@read_only
+async def get_state(entity_id: str) -> dict:
+    resp = await get_client().get(f"/states/{entity_id}")
+    resp.raise_for_status()
+    return compact_state(resp.json(), TOOL_TOKEN_BUDGET)
+
+@traced_tool
+async def turn_on(entity_id: str) -> str:
+    domain = entity_id.split(".")[0]
+    await call_service(domain, "turn_on", {"entity_id": entity_id})
+    return f"Turned on {entity_id}"
+
+@traced_tool
+async def turn_off(entity_id: str) -> str:
+    domain = entity_id.split(".")[0]
+    await call_service(domain, "turn_off", {"entity_id": entity_id})
+    return f"Turned off {entity_id}"
+
+@traced_tool
+async def set_value(entity_id: str, value: float) -> str:
+    domain = entity_id.split(".")[0]
+    # This example targets input_number; extend for other domains as needed
+    if domain == "input_number":
+        await call_service("input_number", "set_value", {"entity_id": entity_id, "value": value})
+        return f"Set {entity_id} to {value}"
+    return f"Setting value for domain {domain} is not implemented."
+
+@traced_tool
+async def bulk_action(action: str, entity_ids: Optional[list[str]] = None, domain: Optional[str] = None,
+                      area: Optional[str] = None, state: Optional[str] = None,
+                      value: Optional[float] = None) -> dict:
+    """Run one action on many entities at once.
+
+    Args:
+        action: turn_on, turn_off, toggle or set_value.
+        entity_ids: the targets; or leave empty and select them with domain, area and state.
+        domain: select entities of this domain, e.g. light.
+        area: select entities whose name contains these words, e.g. living room; without a
+            domain only lights, switches, fans and input booleans are selected.
+        state: select entities currently in this state, e.g. on.
+        value: for set_value: number, temperature, fan percentage, brightness or position.
+    """
+    if action not in ACTIONS:
+        return {"error": f"unknown action {action!r}; use one of {', '.join(ACTIONS)}"}
+    if action == "set_value" and value is None:
+        return {"error": "set_value needs a value"}
+    if not (entity_ids or domain or area):
+        return {"error": "give entity_ids, or a domain and/or area to select the targets"}
+    if domain in PROTECTED_DOMAINS and not entity_ids:
+        return {"error": f"{domain} entities are only changed when named; pass their entity_ids"}
+    index = await STORE.index()
+    targets = entity_ids or select(index, domain, area, state)
+    calls, skipped = plan(targets, action, value, index, BULK_MAX_ENTITIES)
+    if not entity_ids:
+        # Selected entities that can't take the action (sensors in an area, say) are just not targets.
+        skipped = {e: reason for e, reason in skipped.items() if reason == "unknown entity"}
+    try:
+        outcomes = await execute(calls, _post_service, BULK_CONCURRENCY)
+    finally:
+        if calls:
+            invalidate_caches()
+    return summarize(action, outcomes, skipped, len(calls), TOOL_TOKEN_BUDGET)
+
+HA_TOOLS = [
+    Tool(list_entities, name="list_entities", description="Count Home Assistant entities per domain and list a page of entity ids (pass next_cursor as cursor for more)."),
+    Tool(list_lights, name="list_lights", description="List a page of Home Assistant light entities (pass next_cursor as cursor for more)."),
+    Tool(get_state, name="get_state", description="Get the state of a Home Assistant entity."),
+    Tool(turn_on, name="turn_on", description="Turn on a Home Assistant entity (e.g., light, switch, etc.)."),
+    Tool(turn_off, name="turn_off", description="Turn off a Home Assistant entity (e.g., light, switch, etc.)."),
+    Tool(set_value, name="set_value", description="Set a value for a Home Assistant entity (e.g., input_number, climate, etc.)"),
+    Tool(list_entities_by_domain, name="list_entities_by_domain", description="List a page of entities of a given domain (e.g., sensor, light, switch); pass next_cursor as cursor for more."),
+    Tool(filter_entities_by_state, name="filter_entities_by_state", description="List a page of entities of a domain in a given state (e.g., all lights that are on); pass next_cursor as cursor for more."),
+    Tool(show_entity_attributes, name="show_entity_attributes", description="Show the attributes of a given entity (noisy display attributes omitted)."),
+    Tool(bulk_action, name="bulk_action", description="Turn on/off, toggle or set many entities in one call: pass entity_ids, or select them by domain, area words and/or current state (e.g. all lights on in the kitchen). Prefer this over one turn_on/turn_off call per entity."),
+    Tool(refresh_entities, name="refresh_entities", description="Force a refresh of the cached Home Assistant entity list and return cache statistics."),
+]
@@ -0,0 +1,86 @@
+"""
+Benchmark one agent step in which the model issues N tool calls at once:
+the old blocking `requests` tools versus the async pooled tools in aspire_tools.
+The model is a pydantic-ai FunctionModel and HA is the local simulator, so no
+network or API key is needed.
+
+Usage:
+    python bench_agent_tools.py --calls 20 --latency-ms 50
+"""
+import argparse
+import asyncio
+import os
+import time
+import requests
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart
+from pydantic_ai.models.function import FunctionModel
+from pydantic_ai.tools import Tool
+from ha_fixtures import make_states
+from ha_simulator import SimulatorProcess
+
+
+def blocking_tools(api_url):
+    """The pre-async tool implementations: one blocking request (and connection) per call."""
+    headers = {"Content-Type": "application/json"}
+
+    def get_state(entity_id: str) -> dict:
+        resp = requests.get(f"{api_url}/states/{entity_id}", headers=headers, timeout=10)
+        resp.raise_for_status()
+        return resp.json()
+
+    def turn_on(entity_id: str) -> str:
+        domain = entity_id.split(".")[0]
+        resp = requests.post(f"{api_url}/services/{domain}/turn_on", headers=headers, json={"entity_id": entity_id}, timeout=10)
+        resp.raise_for_status()
+        return f"Turned on {entity_id}"
+
+    return [Tool(get_state, name="get_state"), Tool(turn_on, name="turn_on")]
+
+
+def step_model(entity_ids):
+    """Model that asks for get_state + turn_on on every entity in one step, then answers."""
+    def respond(messages, info):
+        if len(messages) == 1:
+            calls = [ToolCallPart("get_state", {"entity_id": e}) for e in entity_ids]
+            calls += [ToolCallPart("turn_on", {"entity_id": e}) for e in entity_ids]
+            return ModelResponse(parts=calls)
+        return ModelResponse(parts=[TextPart("done")])
+    return FunctionModel(respond)
+
+
+async def run_step(tools, entity_ids, repeat):
+    agent = Agent(step_model(entity_ids), tools=tools)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await agent.run("turn everything on")
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000, sum(timings) / len(timings) * 1000
+
+
+async def main(args):
+    entities = max(args.calls * 10, 100)
+    server = SimulatorProcess(entities=entities, latency_ms=args.latency_ms)
+    api_url = f"{server.url}/api"
+    os.environ["ASPIRE_API_URL"] = api_url
+    import aspire_tools
+    entity_ids = [s["entity_id"] for s in make_states(entities) if s["entity_id"].startswith("light.")][:args.calls // 2]
+    try:
+        print(f"{args.calls} tool calls per step, HA latency {args.latency_ms}ms")
+        best, mean = await run_step(blocking_tools(api_url), entity_ids, args.repeat)
+        print(f"{'blocking requests':<20} best={best:8.1f}ms  mean={mean:8.1f}ms")
+        tools = [t for t in aspire_tools.HA_TOOLS if t.name in {"get_state", "turn_on"}]
+        best, mean = await run_step(tools, entity_ids, args.repeat)
+        print(f"{'async pooled':<20} best={best:8.1f}ms  mean={mean:8.1f}ms")
+        await aspire_tools.close_client()
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
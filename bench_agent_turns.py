@@ -0,0 +1,204 @@
+"""
+Replay a corpus of agent turns (agent_turns.json) through the agent CLI's turn handling
+(pydantic_al_aspire_agent.turn: intent router, prompt cache, model and tools). The model is
+stub_openai.py, an OpenAI-compatible server that replays each turn's scripted steps, and HA is
+ha_simulator.py, so no API key or live HA is needed. The HA MCP server is not part of the replay;
+only the agent's own HA tools are.
+
+For every turn it records wall time, model steps, tool calls, HA calls, bytes to and from the
+model and HA, and prompt/completion tokens. Results are written as JSON, so runs from different
+versions can be compared:
+
+Usage:
+    python bench_agent_turns.py --repeat 3 --json after.json
+    python bench_agent_turns.py --compare before.json after.json
+    python bench_agent_turns.py --repeat 1 --trace turns.trace.json   # open in ui.perfetto.dev
+    OPENAI_MODEL=gpt-4o python bench_agent_turns.py --record agent_turns.json  # re-record the steps with a real model
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+import httpx
+from ha_simulator import SimulatorProcess
+from stub_openai import StubModelProcess
+
+CORPUS = Path(__file__).parent / "agent_turns.json"
+COUNTS = ("model_steps", "tool_calls", "ha_calls", "model_bytes_in", "model_bytes_out",
+          "ha_bytes_in", "ha_bytes_out", "prompt_tokens", "completion_tokens")
+
+
+def load_corpus(path) -> list[dict]:
+    with open(path) as f:
+        return json.load(f)["turns"]
+
+
+async def counters(client: httpx.AsyncClient, sim: SimulatorProcess, stub: StubModelProcess) -> dict:
+    model = (await client.get(stub.stats_url)).json()
+    calls = [c for c in (await client.get(f"{sim.url}/_sim/stats")).json()["calls"] if c["method"] != "injected"]
+    return {"model_steps": model["requests"], "tool_calls": model["tool_calls"],
+            "model_bytes_in": model["bytes_out"], "model_bytes_out": model["bytes_in"],
+            "prompt_tokens": model["prompt_tokens"], "completion_tokens": model["completion_tokens"],
+            "unscripted": model["unscripted"], "ha_calls": sum(c["count"] for c in calls),
+            "ha_bytes_in": sum(c["bytes_out"] for c in calls), "ha_bytes_out": sum(c["bytes_in"] for c in calls)}
+
+
+def git_version() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, cwd=Path(__file__).parent).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def summarize(records: list[dict]) -> dict:
+    """Per turn name: wall time min/median/max over the repeats and the mean of every count."""
+    summary = {}
+    for name in dict.fromkeys(r["name"] for r in records):
+        runs = [r for r in records if r["name"] == name]
+        walls = [r["wall_ms"] for r in runs]
+        summary[name] = {"runs": len(runs), "errors": sum(bool(r["error"]) for r in runs),
+                         "wall_ms": {"min": min(walls), "median": round(statistics.median(walls), 2), "max": max(walls)},
+                         **{k: round(statistics.fmean(r[k] for r in runs), 2) for k in COUNTS}}
+    return summary
+
+
+async def replay(args, turn, agent, sim, stub) -> list[dict]:
+    records = []
+    async with httpx.AsyncClient(timeout=10) as client:
+        for iteration in range(args.repeat):
+            for entry in load_corpus(args.corpus):
+                before = await counters(client, sim, stub)
+                output, error = None, None
+                quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+                start = time.perf_counter()
+                try:
+                    with quiet:  # the tools print debug output
+                        output = await turn(agent, entry["prompt"])
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                wall_ms = round((time.perf_counter() - start) * 1000, 2)
+                after = await counters(client, sim, stub)
+                record = {"iteration": iteration, "name": entry["name"], "prompt": entry["prompt"], "wall_ms": wall_ms,
+                          **{k: after[k] - before[k] for k in (*COUNTS, "unscripted")},
+                          "output": (output or "")[:200], "error": error}
+                records.append(record)
+                print(f"{iteration:>3} {entry['name']:<24} {wall_ms:>9.1f} {record['model_steps']:>6} "
+                      f"{record['tool_calls']:>6} {record['ha_calls']:>6} "
+                      f"{record['prompt_tokens'] + record['completion_tokens']:>8}  {error or ''}")
+    return records
+
+
+async def record_fixtures(args, agent, fast_path, warm_entities):
+    """Run the corpus through a real model and store the steps it took as the new fixtures."""
+    from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart
+    corpus = load_corpus(args.corpus)
+    for entry in corpus:
+        warm_entities()
+        with contextlib.redirect_stdout(io.StringIO()):
+            if await fast_path(entry["prompt"]) is not None:
+                entry["steps"] = []
+                continue
+            result = await agent.run(entry["prompt"])
+        steps = []
+        for message in result.new_messages():
+            if not isinstance(message, ModelResponse):
+                continue
+            calls = [{"name": p.tool_name, "args": p.args_as_dict()} for p in message.parts if isinstance(p, ToolCallPart)]
+            text = "".join(p.content for p in message.parts if isinstance(p, TextPart))
+            steps.append({"tool_calls": calls} if calls else {"content": text})
+        entry["steps"] = steps
+        print(f"{entry['name']:<24} {len(steps)} steps")
+    with open(args.corpus) as f:
+        fixtures = json.load(f)
+    fixtures["turns"] = corpus
+    Path(args.record).write_text(json.dumps(fixtures, indent=2, ensure_ascii=False) + "\n")
+
+
+def compare(before_path: str, after_path: str):
+    before, after = (json.loads(Path(p).read_text()) for p in (before_path, after_path))
+    print(f"{before['meta']['version']} -> {after['meta']['version']}")
+    print(f"{'turn':<24} {'median ms':>19} {'change':>8} {'steps':>9} {'tools':>9} {'HA calls':>10} {'tokens':>15}")
+    for name, new in after["summary"].items():
+        old = before["summary"].get(name)
+        if old is None:
+            print(f"{name:<24} {'(new)':>19}")
+            continue
+        a, b = old["wall_ms"]["median"], new["wall_ms"]["median"]
+        change = f"{(b - a) / a * 100:+.1f}%" if a else "-"
+        pair = lambda k: f"{old[k]:g}>{new[k]:g}"
+        tokens = f"{old['prompt_tokens'] + old['completion_tokens']:g}>{new['prompt_tokens'] + new['completion_tokens']:g}"
+        print(f"{name:<24} {f'{a:.1f}>{b:.1f}':>19} {change:>8} {pair('model_steps'):>9} {pair('tool_calls'):>9} "
+              f"{pair('ha_calls'):>10} {tokens:>15}")
+
+
+async def main(args):
+    sim = SimulatorProcess(entities=args.entities, latency_ms=args.ha_latency_ms)
+    stub = None if args.record else StubModelProcess(str(args.corpus), args.model_latency_ms, args.token_ms)
+    os.environ["ASPIRE_API_URL"] = f"{sim.url}/api"
+    if args.trace:
+        os.environ["AGENT_TRACE"] = args.trace
+    # Imported once the simulator's URL (and the trace file) is set: both are read at import time.
+    import pydantic_al_aspire_agent as cli
+    try:
+        if args.record:
+            await record_fixtures(args, cli.build_agent(cli.get_openai_model()), cli.fast_path, cli.warm_entities)
+            return
+        from pydantic_ai.models.openai import OpenAIModel
+        from pydantic_ai.providers.openai import OpenAIProvider
+        agent = cli.build_agent(OpenAIModel("stub", provider=OpenAIProvider(base_url=stub.url, api_key="bench")))
+        print(f"{len(load_corpus(args.corpus))} turns x {args.repeat}, HA latency {args.ha_latency_ms}ms, "
+              f"model latency {args.model_latency_ms}ms + {args.token_ms}ms/token")
+        print(f"{'it':>3} {'turn':<24} {'wall ms':>9} {'steps':>6} {'tools':>6} {'HA':>6} {'tokens':>8}")
+        records = await replay(args, cli.turn, agent, sim, stub)
+        await cli.close_client()
+    finally:
+        if stub:
+            stub.stop()
+        sim.stop()
+    summary = summarize(records)
+    result = {"meta": {"version": git_version(), "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                       "python": platform.python_version(), "corpus": str(args.corpus), "repeat": args.repeat,
+                       "entities": args.entities, "ha_latency_ms": args.ha_latency_ms,
+                       "model_latency_ms": args.model_latency_ms, "token_ms": args.token_ms},
+              "totals": {"wall_ms": round(sum(r["wall_ms"] for r in records), 2),
+                         "errors": sum(bool(r["error"]) for r in records),
+                         "unscripted": sum(r["unscripted"] for r in records),
+                         **{k: sum(r[k] for r in records) for k in COUNTS}},
+              "summary": summary, "turns": records}
+    print(f"total {result['totals']['wall_ms']:.1f}ms, {result['totals']['model_steps']} model steps, "
+          f"{result['totals']['ha_calls']} HA calls, {result['totals']['errors']} errors, "
+          f"{result['totals']['unscripted']} unscripted model requests")
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=str(CORPUS))
+    parser.add_argument("--repeat", type=int, default=3, help="replays of the whole corpus")
+    parser.add_argument("--entities", type=int, default=200)
+    parser.add_argument("--ha-latency-ms", type=float, default=5.0)
+    parser.add_argument("--model-latency-ms", type=float, default=0.0, help="stub delay per model request")
+    parser.add_argument("--token-ms", type=float, default=0.0, help="stub delay per completion token")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files and exit")
+    parser.add_argument("--record", metavar="FIXTURES", help="record the corpus' steps with the real OPENAI_MODEL")
+    parser.add_argument("--trace", help="write agent trace spans to this file (see agent_trace.py)")
+    parser.add_argument("--verbose", action="store_true", help="show the tools' output")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        asyncio.run(main(args))
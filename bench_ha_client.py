@@ -0,0 +1,66 @@
+"""
+Benchmark HAInstance.rest_call (ha_mcp_proxy's upstream calls): a new AsyncClient per request (old behaviour)
+versus the shared pooled client, against a local simulated HA.
+
+Usage:
+    python bench_ha_client.py --requests 1000 --concurrency 10 --path /api/states/light.kitchen_light_0
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+import httpx
+from ha_simulator import create_app, free_port, serve_in_thread
+
+
+async def per_request_client(url, headers):
+    async with httpx.AsyncClient() as client:
+        resp = await client.get(url, headers=headers)
+        resp.raise_for_status()
+        return resp.json()
+
+
+async def run(label, call, requests, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with sem:
+            start = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{label:<22} p50={p50:7.2f}ms  p99={p99:7.2f}ms  rps={requests / elapsed:8.1f}")
+
+
+async def main(args):
+    port = free_port()
+    server = serve_in_thread(create_app(entities=args.entities), port)
+    from ha_instance import HAInstance
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    ha = HAInstance("bench", f"http://127.0.0.1:{port}", "bench")
+    headers = {"Authorization": "Bearer bench", "Content-Type": "application/json"}
+    try:
+        url = f"{ha.url}{args.path}"
+        await run("client per request", lambda: per_request_client(url, headers), args.requests, args.concurrency)
+        ha.get_client()
+        await run("shared pooled client", lambda: ha.rest_call(args.path), args.requests, args.concurrency)
+        await ha.close_client()
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--entities", type=int, default=200)
+    parser.add_argument("--path", default="/api/states/light.kitchen_light_0")
+    asyncio.run(main(parser.parse_args()))
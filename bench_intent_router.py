@@ -0,0 +1,87 @@
+"""
+Replay an utterance corpus through the intent router fast path against the local simulator:
+how many utterances skip the LLM, the fast path's latency, and the model requests saved.
+
+A routed utterance would otherwise cost at least one tool-calling model request plus the
+final answer, so `--model-requests-per-turn` defaults to 2.
+
+Usage:
+    python bench_intent_router.py --corpus intent_corpus.txt --entities 500 --latency-ms 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from pathlib import Path
+from ha_fixtures import make_states
+from ha_simulator import SimulatorProcess
+from ha_state_cache import StateIndex
+from intent_router import IntentRouter
+
+
+def load_corpus(path: str) -> list[str]:
+    lines = Path(path).read_text().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def main(args):
+    corpus = load_corpus(args.corpus)
+    start = time.perf_counter()
+    router = IntentRouter(StateIndex(make_states(args.entities)))
+    build_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for utterance in corpus:
+            router.match(utterance)
+    match_us = (time.perf_counter() - start) / (args.repeat * len(corpus)) * 1e6
+    print(f"index build: {build_ms:.1f}ms for {args.entities} entities, match: {match_us:.1f}us/utterance")
+
+    server = SimulatorProcess(entities=args.entities, latency_ms=args.latency_ms)
+    os.environ["ASPIRE_API_URL"] = f"{server.url}/api"
+    import aspire_tools
+    routed, fell_through, replies = [], [], {}
+    try:
+        for _ in range(args.repeat):
+            for utterance in corpus:
+                start = time.perf_counter()
+                reply = await aspire_tools.fast_path(utterance)
+                elapsed = (time.perf_counter() - start) * 1000
+                (routed if reply is not None else fell_through).append((utterance, elapsed, reply))
+                replies[utterance] = reply
+        await aspire_tools.close_client()
+    finally:
+        server.stop()
+
+    if args.verbose:
+        for utterance, reply in replies.items():
+            print(f"  {utterance!r:<50} -> {(reply or 'LLM')[:70]}")
+    saved = len(routed) * args.model_requests_per_turn
+    print(f"{len(corpus)} utterances x {args.repeat}: {len(routed)} routed, {len(fell_through)} to the LLM "
+          f"({len(routed) / (len(routed) + len(fell_through)):.0%} routed)")
+    if routed:
+        timings = [t for _, t, _ in routed]
+        print(f"fast path latency: p50={statistics.median(timings):.1f}ms p95={percentile(timings, 0.95):.1f}ms "
+              f"max={max(timings):.1f}ms (HA latency {args.latency_ms}ms)")
+    if fell_through:
+        timings = [t for _, t, _ in fell_through]
+        print(f"fall-through overhead: p50={statistics.median(timings):.2f}ms")
+    print(f"model requests saved: {saved} "
+          f"(~{saved * args.model_latency_ms / 1000:.1f}s at {args.model_latency_ms:.0f}ms per request)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=str(Path(__file__).parent / "intent_corpus.txt"))
+    parser.add_argument("--entities", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--model-requests-per-turn", type=int, default=2)
+    parser.add_argument("--model-latency-ms", type=float, default=800.0)
+    parser.add_argument("--verbose", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+"""
+Measure response size and JSON encoding time of `search` responses on a synthetic house:
+the full state list versus typical filtered agent queries, then the proxy's ways of
+producing the full-list response (time, peak allocated memory, compressed size).
+
+Usage:
+    python bench_search.py --entities 10000
+"""
+import argparse
+import gzip
+import json
+import time
+import tracemalloc
+from ha_fixtures import make_states
+from ha_json import RawJSON, dumps, encode_response, orjson
+from ha_search import query
+from ha_state_cache import StateCache, StateIndex
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+QUERIES = {
+    "lights (id+state)": {"domain": "light", "attributes": []},
+    "lights on": {"domain": "light", "state": "on", "attributes": ["friendly_name"]},
+    "kitchen glob": {"entity_id": "light.kitchen_*", "attributes": ["friendly_name"]},
+    "first page of 20": {"limit": 20, "attributes": []},
+}
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def peak_kib(fn) -> float:
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def full_list_paths(states: list[dict]) -> dict:
+    """Ways to answer an unfiltered search, given HA's /api/states body as bytes."""
+    upstream = json.dumps(states).encode()
+    envelope = {"jsonrpc": "2.0", "id": 1}
+    cache = StateCache(None)
+    cache.index = StateIndex(states)
+    cache.version = 1
+    cache.encoded()
+    return {
+        "decode + re-encode": lambda: json.dumps(dict(envelope, result=json.loads(upstream))).encode(),
+        "raw pass-through": lambda: encode_response(dict(envelope, result=RawJSON(upstream))),
+        "cached encoding": lambda: encode_response(dict(envelope, result=RawJSON(cache.encoded()))),
+    }
+
+
+def main(args):
+    index = StateIndex(make_states(args.entities))
+    ms, body = timed(lambda: json.dumps(index.all()), args.repeat)
+    print(f"{'full state list':<20} {len(body):>10} bytes  {ms:8.3f} ms")
+    for label, params in QUERIES.items():
+        ms, body = timed(lambda: json.dumps(query(index, params)), args.repeat)
+        print(f"{label:<20} {len(body):>10} bytes  {ms:8.3f} ms")
+
+    print(f"\nfull state list response paths (encoder: {'orjson' if orjson else 'json'})")
+    for label, fn in full_list_paths(index.all()).items():
+        ms, body = timed(fn, args.repeat)
+        print(f"{label:<20} {len(body):>10} bytes  {ms:8.3f} ms  peak {peak_kib(fn):9.1f} KiB")
+    body = dumps(index.all())
+    ms, packed = timed(lambda: gzip.compress(body, 6), args.repeat)
+    print(f"{'gzip -6':<20} {len(packed):>10} bytes  {ms:8.3f} ms")
+    if brotli is not None:
+        ms, packed = timed(lambda: brotli.compress(body, quality=4), args.repeat)
+        print(f"{'brotli q4':<20} {len(packed):>10} bytes  {ms:8.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entities", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,112 @@
+"""
+Measure what each read-only tool puts into the model's context, before and after result
+shaping (tool_shaping.py): tokens, bytes, and the latency of one agent step that calls the
+tool, plus an estimate of the model's prompt-processing time for those tokens.
+
+The "before" tools are the previous implementations (full id lists, raw HA JSON). The model
+is a pydantic-ai FunctionModel and HA is the local simulator.
+
+Usage:
+    python bench_tool_output.py --entities 2000 --latency-ms 5
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import time
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import FunctionModel
+from pydantic_ai.tools import Tool
+from ha_fixtures import make_states
+from ha_simulator import SimulatorProcess
+from tool_shaping import count_tokens
+
+
+def raw_tools(tools):
+    """The unshaped tool implementations, on the same client and entity store."""
+    async def list_entities() -> list[str]:
+        return await tools.STORE.entity_ids()
+
+    async def list_entities_by_domain(domain: str) -> list[str]:
+        return await tools.STORE.by_domain(domain)
+
+    async def filter_entities_by_state(domain: str, state: str) -> list[str]:
+        return await tools.STORE.by_state(domain, state)
+
+    async def get_state(entity_id: str) -> dict:
+        resp = await tools.get_client().get(f"/states/{entity_id}")
+        resp.raise_for_status()
+        return resp.json()
+
+    async def show_entity_attributes(entity_id: str) -> dict:
+        resp = await tools.get_client().get(f"/states/{entity_id}")
+        return resp.json().get("attributes", {})
+
+    return [Tool(f) for f in (list_entities, list_entities_by_domain, filter_entities_by_state, get_state, show_entity_attributes)]
+
+
+def one_call_model(tool_name, args, returned):
+    """Calls `tool_name` once, records what came back, then answers."""
+    def respond(messages, info):
+        if len(messages) == 1:
+            return ModelResponse(parts=[ToolCallPart(tool_name, args)])
+        for part in messages[-1].parts:
+            if isinstance(part, ToolReturnPart):
+                returned.append(part.model_response_str())
+        return ModelResponse(parts=[TextPart("done")])
+    return FunctionModel(respond)
+
+
+async def measure(tools, tool_name, args, repeat):
+    timings, returned = [], []
+    agent = Agent(one_call_model(tool_name, args, returned), tools=tools)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # the tools' own debug prints
+            await agent.run("go")
+        timings.append((time.perf_counter() - start) * 1000)
+    return returned[-1], min(timings)
+
+
+async def main(args):
+    os.environ["AGENT_CACHE"] = "0"  # measure the work, not memoized repeats
+    server = SimulatorProcess(entities=args.entities, latency_ms=args.latency_ms)
+    os.environ["ASPIRE_API_URL"] = f"{server.url}/api"
+    import aspire_tools
+    states = make_states(args.entities)
+    light = next(s["entity_id"] for s in states if s["entity_id"].startswith("light."))
+    climate = next(s["entity_id"] for s in states if s["entity_id"].startswith("climate."))
+    cases = [
+        ("list_entities", {}),
+        ("list_entities_by_domain", {"domain": "light"}),
+        ("filter_entities_by_state", {"domain": "light", "state": "on"}),
+        ("get_state", {"entity_id": light}),
+        ("get_state", {"entity_id": climate}),
+        ("show_entity_attributes", {"entity_id": climate}),
+    ]
+    shaped_tools = [t for t in aspire_tools.HA_TOOLS if t.name in {name for name, _ in cases}]
+    print(f"{args.entities} entities, budget {aspire_tools.TOOL_TOKEN_BUDGET} tokens, "
+          f"prefill estimate at {args.prefill_tokens_per_s:.0f} tokens/s")
+    print(f"{'tool':<26} {'':>6} {'tokens':>8} {'bytes':>9} {'step ms':>8} {'+prefill ms':>12}")
+    try:
+        for name, call_args in cases:
+            for label, tools in (("before", raw_tools(aspire_tools)), ("after", shaped_tools)):
+                text, ms = await measure(tools, name, call_args, args.repeat)
+                tokens = count_tokens(text)
+                prefill = tokens / args.prefill_tokens_per_s * 1000
+                print(f"{name:<26} {label:>6} {tokens:>8} {len(text.encode()):>9} {ms:>8.1f} {ms + prefill:>12.1f}")
+        await aspire_tools.close_client()
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entities", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--prefill-tokens-per-s", type=float, default=5000.0,
+                        help="model prompt-processing rate used for the end-to-end estimate")
+    asyncio.run(main(parser.parse_args()))
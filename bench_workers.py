@@ -0,0 +1,140 @@
+"""
+Throughput of the HTTP proxy versus its worker count (ha_mcp_proxy.py --workers N).
+
+For each worker count a fresh proxy is started against one ha_simulator.py HA stand-in and driven
+closed-loop (every client sends its next request as soon as the previous one returns) from
+several client processes, so the load generator is not the bottleneck. Alongside throughput and
+latency it reports what the proxy cost HA: open websocket subscriptions and /api/states fetches,
+which stay at one however many workers there are.
+
+Usage:
+    python bench_workers.py --workers 1,2,4 --entities 2000 --duration 10 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import httpx
+from ha_simulator import SimulatorProcess, free_port
+from load_mcp_proxy import PROXY, parse_mix, percentile, request_factory, wait_for_port
+
+DEFAULT_MIX = "search_full=1,search_filtered=3,search_page=2"
+
+
+async def _client(url, concurrency, duration, mix, entities, seed):
+    builders = request_factory(entities, seed)
+    kinds = parse_mix(mix, builders)
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+        async def loop(n):
+            nonlocal errors
+            i = n
+            while time.perf_counter() < deadline:
+                method, params = builders[kinds[i % len(kinds)]]()
+                i += concurrency
+                start = time.perf_counter()
+                try:
+                    resp = await client.post(url, json={"jsonrpc": "2.0", "id": i, "method": method, "params": params})
+                    resp.raise_for_status()
+                    if "error" in resp.json():
+                        errors += 1
+                        continue
+                except (httpx.HTTPError, ValueError):
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(loop(n) for n in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(args):
+    return asyncio.run(_client(*args))
+
+
+async def sim_stats(url) -> dict:
+    async with httpx.AsyncClient(timeout=5) as client:
+        stats = (await client.get(f"{url}/_sim/stats")).json()
+    calls = {f"{c['method']} {c['path']}": c["count"] for c in stats["calls"]}
+    return {"websockets": stats["subscribers"], "states_fetches": calls.get("GET /api/states", 0)}
+
+
+def run_one(workers, sim, args) -> dict:
+    port = free_port()
+    env = dict(os.environ, HA_URL=sim.url, HA_TOKEN="bench", PORT=str(port),
+               MCP_SHARED_DIR=str(Path(args.shared_dir) / f"w{workers}-{port}"))
+    proxy = subprocess.Popen([sys.executable, PROXY, "--workers", str(workers)], env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        url = f"http://127.0.0.1:{port}/mcp"
+        httpx.post(url, json={"jsonrpc": "2.0", "id": 0, "method": "search", "params": {"limit": 1}}, timeout=30)
+        time.sleep(args.warmup)
+        before = asyncio.run(sim_stats(sim.url))
+        per_client = max(1, args.concurrency // args.clients)
+        jobs = [(url, per_client, args.duration, args.mix, args.entities, seed) for seed in range(args.clients)]
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(client_process, jobs)
+        elapsed = time.perf_counter() - start
+        after = asyncio.run(sim_stats(sim.url))
+    finally:
+        proxy.terminate()
+        proxy.wait(timeout=20)
+    latencies = [t * 1000 for lat, _ in results for t in lat]
+    return {
+        "workers": workers,
+        "requests": len(latencies),
+        "errors": sum(e for _, e in results),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.5), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0,
+        "ha_websockets": after["websockets"],
+        "ha_states_fetches": after["states_fetches"] - before["states_fetches"],
+    }
+
+
+def main(args):
+    counts = [int(w) for w in args.workers.split(",")]
+    sim = SimulatorProcess(entities=args.entities, latency_ms=args.latency_ms, event_rate=args.event_rate)
+    rows = []
+    try:
+        print(f"{args.entities} entities, {args.event_rate} events/s, mix {args.mix}, "
+              f"{args.concurrency} clients over {args.clients} processes, {os.cpu_count()} CPUs")
+        print(f"{'workers':>7} {'rps':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'HA ws':>6} {'states fetches':>15}")
+        for workers in counts:
+            row = run_one(workers, sim, args)
+            rows.append(row)
+            print(f"{row['workers']:>7} {row['throughput_rps']:>9} {row['p50_ms']:>8} {row['p99_ms']:>8} "
+                  f"{row['errors']:>7} {row['ha_websockets']:>6} {row['ha_states_fetches']:>15}")
+    finally:
+        sim.stop()
+    if args.json:
+        Path(args.json).write_text(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--entities", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--event-rate", type=float, default=20.0, help="simulated state changes per second")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=64, help="requests in flight across all clients")
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="comma-separated kind=weight (see load_mcp_proxy.py)")
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--shared-dir", default=os.path.join(tempfile.gettempdir(), "bench_workers"))
+    parser.add_argument("--json", help="also write the results to this file")
+    main(parser.parse_args())
@@ -1,45 +1,189 @@
+"""
+Health and latency checks for the SSE MCP servers in mcp_config.json.
+
+Every server is probed concurrently. A probe measures the TCP/TLS connect time, the time to the
+first SSE event and, for Home Assistant servers, the round trip of a REST call on a warm
+connection; the SSE stream is closed as soon as its first event arrives.
+
+Usage:
+    python check_mcp_servers.py                      # one sweep, exit status 1 if any server is down
+    python check_mcp_servers.py --watch --interval 10 --report mcp_latency.json
+"""
+import argparse
+import asyncio
 import json
 import os
-import requests
+import statistics
+import sys
+import time
+from collections import deque
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Optional
+import httpx
+from ha_instance import MCP_SSE_SUFFIX
+from load_mcp_proxy import percentile
 
 CONFIG_PATH = Path(__file__).parent / "mcp_config.json"
+METRICS = ("connect_ms", "first_event_ms", "rest_ms")
 
 
-def load_config():
-    with open(CONFIG_PATH, "r") as f:
+def load_config(path=CONFIG_PATH):
+    with open(path, "r") as f:
         return json.load(f)
 
 
-def check_http_sse_server(name, env):
-    url = env.get("SSE_URL")
-    token = env.get("API_ACCESS_TOKEN")
-    if not url:
-        print(f"[SKIP] {name}: No SSE_URL defined.")
-        return
+def sse_servers(config) -> dict[str, dict]:
+    return {name: cfg.get("env", {}) for name, cfg in config.get("mcpServers", {}).items()
+            if cfg.get("env", {}).get("SSE_URL")}
+
+
+def _ms(start: float, end: Optional[float] = None) -> float:
+    return round(((end or time.perf_counter()) - start) * 1000, 2)
+
+
+async def probe(name: str, env: dict, timeout: float) -> dict:
+    """One sample for one server; never raises."""
+    url = env["SSE_URL"]
     headers = {"Accept": "text/event-stream"}
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
-    print(f"[CHECK] {name}: {url}")
+    if env.get("API_ACCESS_TOKEN"):
+        headers["Authorization"] = f"Bearer {env['API_ACCESS_TOKEN']}"
+    result = {"name": name, "url": url, "ok": False, "status": None,
+              "connect_ms": None, "first_event_ms": None, "rest_ms": None, "error": None}
+    marks = {}
+
+    async def trace(event, info):
+        marks.setdefault(event, time.perf_counter())
+
+    start = time.perf_counter()
     try:
-        resp = requests.get(url, headers=headers, stream=True, timeout=8)
-        if resp.status_code == 200:
-            print(f"  [OK] Status 200. SSE endpoint reachable.")
-        else:
-            print(f"  [FAIL] Status {resp.status_code}. Response: {resp.text[:100]}")
-    except Exception as e:
-        print(f"  [ERROR] Could not connect: {e}")
+        async with httpx.AsyncClient(timeout=timeout, headers=headers) as client:
+            async with client.stream("GET", url, extensions={"trace": trace}) as resp:
+                result["status"] = resp.status_code
+                connected = marks.get("connection.start_tls.complete") or marks.get("connection.connect_tcp.complete")
+                if connected and "connection.connect_tcp.started" in marks:
+                    result["connect_ms"] = _ms(marks["connection.connect_tcp.started"], connected)
+                if resp.status_code != 200:
+                    result["error"] = f"HTTP {resp.status_code}"
+                    return result
+                async for line in resp.aiter_lines():
+                    if line.startswith(("event:", "data:")):
+                        result["first_event_ms"] = _ms(start)
+                        break
+            if url.endswith(MCP_SSE_SUFFIX):
+                api = url[:-len(MCP_SSE_SUFFIX)] + "/api/"
+                (await client.get(api)).raise_for_status()  # opens a connection for the timed call
+                rest_start = time.perf_counter()
+                (await client.get(api)).raise_for_status()
+                result["rest_ms"] = _ms(rest_start)
+        result["ok"] = result["first_event_ms"] is not None
+        if not result["ok"]:
+            result["error"] = "stream ended before the first event"
+    except (httpx.HTTPError, OSError) as e:
+        result["error"] = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+    return result
+
+
+async def sweep(servers: dict[str, dict], timeout: float) -> list[dict]:
+    """Probe every server at once; a probe that overruns `timeout` counts as down."""
+    async def bounded(name, env):
+        try:
+            return await asyncio.wait_for(probe(name, env, timeout), timeout)
+        except asyncio.TimeoutError:
+            return {"name": name, "url": env["SSE_URL"], "ok": False, "status": None,
+                    **{m: None for m in METRICS}, "error": f"no first event within {timeout:g}s"}
+    return await asyncio.gather(*(bounded(name, env) for name, env in servers.items()))
+
+
+# --- Reports ---
+def summarize(samples: deque) -> dict:
+    """Availability and latency percentiles over one server's rolling window."""
+    summary = {"samples": len(samples),
+               "availability": round(sum(s["ok"] for s in samples) / len(samples), 4) if samples else None,
+               "last_error": next((s["error"] for s in reversed(samples) if s["error"]), None)}
+    for metric in METRICS:
+        values = [s[metric] for s in samples if s[metric] is not None]
+        quantiles = {f"p{round(q * 100)}": percentile(values, q) if values else None for q in (0.5, 0.95, 0.99)}
+        summary[metric] = {**quantiles, "max": max(values, default=None),
+                           "mean": round(statistics.fmean(values), 2) if values else None}
+    return summary
+
+
+def _cell(value) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def print_sweep(results: list[dict]):
+    print(f"{'server':<24} {'status':<6} {'connect ms':>10} {'1st event ms':>12} {'REST ms':>8}  error")
+    for r in results:
+        status = "OK" if r["ok"] else "DOWN"
+        print(f"{r['name']:<24} {status:<6} {_cell(r['connect_ms']):>10} {_cell(r['first_event_ms']):>12} "
+              f"{_cell(r['rest_ms']):>8}  {r['error'] or ''}")
+
+
+def print_report(report: dict):
+    print(f"{report['updated']}  window {report['window']} samples, every {report['interval']:g}s")
+    print(f"{'server':<24} {'avail':>7} {'n':>5} {'connect p50/p99':>16} {'1st event p50/p99':>18} "
+          f"{'REST p50/p99':>14}  last error")
+    for name, s in report["servers"].items():
+        avail = "-" if s["availability"] is None else f"{s['availability'] * 100:.1f}%"
+        cols = [f"{_cell(s[m]['p50'])}/{_cell(s[m]['p99'])}" for m in METRICS]
+        print(f"{name:<24} {avail:>7} {s['samples']:>5} {cols[0]:>16} {cols[1]:>18} {cols[2]:>14}  {s['last_error'] or ''}")
+
+
+def write_report(path: str, report: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp, path)
+
+
+async def watch(servers: dict[str, dict], args):
+    """Sample every `interval` seconds, keeping the last `window` samples per server."""
+    history = {name: deque(maxlen=args.window) for name in servers}
+    clear = sys.stdout.isatty()
+    while True:
+        started = time.monotonic()
+        for result in await sweep(servers, args.timeout):
+            history[result["name"]].append(result)
+        report = {"updated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                  "interval": args.interval, "window": args.window,
+                  "servers": {name: summarize(samples) for name, samples in history.items()}}
+        if args.report:
+            write_report(args.report, report)
+        if clear:
+            print("\033[2J\033[H", end="")
+        print_report(report)
+        await asyncio.sleep(max(0.0, args.interval - (time.monotonic() - started)))
 
 
 def main():
-    config = load_config()
-    servers = config.get("mcpServers", {})
-    for name, server_cfg in servers.items():
-        env = server_cfg.get("env", {})
-        if env.get("SSE_URL"):
-            check_http_sse_server(name, env)
-        else:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default=str(CONFIG_PATH))
+    parser.add_argument("--timeout", type=float, default=8.0, help="seconds per probe")
+    parser.add_argument("--watch", action="store_true", help="sample continuously")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between sweeps in --watch")
+    parser.add_argument("--window", type=int, default=360, help="samples per server in the rolling report")
+    parser.add_argument("--report", help="JSON report file, rewritten after every sweep in --watch")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    servers = sse_servers(config)
+    for name in config.get("mcpServers", {}):
+        if name not in servers:
             print(f"[INFO] {name}: No SSE_URL found, cannot check HTTP status (likely a local process or CLI tool).")
+    if not servers:
+        return
+    if args.watch:
+        try:
+            asyncio.run(watch(servers, args))
+        except KeyboardInterrupt:
+            pass
+        return
+    results = asyncio.run(sweep(servers, args.timeout))
+    print_sweep(results)
+    sys.exit(0 if all(r["ok"] for r in results) else 1)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,150 @@
+"""
+Bulk actions for the agent: one tool call that turns on/off, toggles or sets many entities.
+
+Targets are explicit entity ids or a selector (domain, area words, current state) resolved on the
+entity index. They are grouped by domain into multi-entity service calls of at most
+`max_entities` each, and the calls run concurrently, at most `concurrency` at a time. The result
+lists the entities per outcome (new state, or the error), bounded to a token budget.
+"""
+import asyncio
+from typing import Awaitable, Callable, Optional
+import httpx
+from ha_state_cache import StateIndex
+from intent_router import normalize
+from tool_shaping import count_tokens
+
+ACTIONS = ("turn_on", "turn_off", "toggle", "set_value")
+# (domain, action) -> (service domain, service, data key for `value`); other switchable domains
+# use their own domain and the action as the service.
+SERVICES = {
+    ("cover", "turn_on"): ("cover", "open_cover", None),
+    ("cover", "turn_off"): ("cover", "close_cover", None),
+    ("lock", "turn_on"): ("lock", "lock", None),
+    ("lock", "turn_off"): ("lock", "unlock", None),
+    ("group", "turn_on"): ("homeassistant", "turn_on", None),
+    ("group", "turn_off"): ("homeassistant", "turn_off", None),
+    ("group", "toggle"): ("homeassistant", "toggle", None),
+    ("input_number", "set_value"): ("input_number", "set_value", "value"),
+    ("climate", "set_value"): ("climate", "set_temperature", "temperature"),
+    ("fan", "set_value"): ("fan", "set_percentage", "percentage"),
+    ("light", "set_value"): ("light", "turn_on", "brightness_pct"),
+    ("cover", "set_value"): ("cover", "set_cover_position", "position"),
+}
+SWITCHABLE = {"light", "switch", "fan", "input_boolean", "automation", "media_player", "climate",
+              "cover", "lock", "scene", "script", "group"}
+# Without a domain, a selector ("everything in the garage") only picks these.
+SELECTOR_DOMAINS = ("light", "switch", "fan", "input_boolean")
+# Security and automation domains are only acted on when named entity by entity, never by selector.
+PROTECTED_DOMAINS = {"lock", "alarm_control_panel", "automation"}
+ServiceCall = Callable[[str, str, dict], Awaitable]
+
+
+def service_for(domain: str, action: str) -> Optional[tuple[str, str, Optional[str]]]:
+    """The service (domain, service, value field) that performs `action` on `domain`, or None if it has none."""
+    if (domain, action) in SERVICES:
+        return SERVICES[(domain, action)]
+    if action == "set_value" or domain not in SWITCHABLE:
+        return None
+    if domain == "scene" and action != "turn_on":
+        return None
+    if domain in {"lock", "group"}:  # no lock.toggle; groups only have their mapped services
+        return None
+    return domain, action, None
+
+
+def select(index: StateIndex, domain: Optional[str] = None, area: Optional[str] = None,
+           state: Optional[str] = None) -> list[str]:
+    """Entity ids matching every given selector; `area` words must all appear in the entity's name or id.
+    Without a domain only SELECTOR_DOMAINS are matched, and PROTECTED_DOMAINS never are."""
+    if domain in PROTECTED_DOMAINS:
+        return []
+    if domain and state is not None:
+        candidates = index.domain_state(domain, state)
+    elif domain:
+        candidates = index.domain(domain)
+    else:
+        candidates = {e: s for d in SELECTOR_DOMAINS for e, s in index.domain(d).items()}
+    words = set(normalize(area).split()) if area else set()
+    matches = []
+    for entity_id, s in candidates.items():
+        if state is not None and s.get("state") != state:
+            continue
+        if words:
+            name = normalize(f"{s.get('attributes', {}).get('friendly_name') or ''} {entity_id.split('.', 1)[1]}")
+            if not words <= set(name.split()):
+                continue
+        matches.append(entity_id)
+    return sorted(matches)
+
+
+def plan(entity_ids: list[str], action: str, value: Optional[float], index: StateIndex,
+         max_entities: int) -> tuple[list[tuple[str, str, dict]], dict[str, str]]:
+    """Service calls (domain, service, data) for the targets, and the targets skipped, with why."""
+    groups: dict[tuple[str, str, Optional[str]], list[str]] = {}
+    skipped = {}
+    for entity_id in dict.fromkeys(entity_ids):
+        domain = entity_id.split(".", 1)[0]
+        target = service_for(domain, action)
+        if index.get(entity_id) is None:
+            skipped[entity_id] = "unknown entity"
+        elif target is None:
+            skipped[entity_id] = f"{domain} does not support {action}"
+        else:
+            groups.setdefault(target, []).append(entity_id)
+    calls = []
+    for (domain, service, field), ids in groups.items():
+        extra = {field: value} if field else {}
+        for start in range(0, len(ids), max_entities):
+            calls.append((domain, service, dict(extra, entity_id=ids[start:start + max_entities])))
+    return calls, skipped
+
+
+async def execute(calls: list[tuple[str, str, dict]], call: ServiceCall, concurrency: int) -> dict[str, str]:
+    """Run the calls, at most `concurrency` at once; every target's outcome (its new state, or the error)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    outcomes: dict[str, str] = {}
+
+    async def run(domain, service, data):
+        async with semaphore:
+            try:
+                changed = await call(domain, service, data)
+            except httpx.HTTPStatusError as e:
+                error = f"error: HTTP {e.response.status_code}"
+                outcomes.update(dict.fromkeys(data["entity_id"], error))
+                return
+            except httpx.HTTPError as e:
+                error = f"error: {type(e).__name__}"
+                outcomes.update(dict.fromkeys(data["entity_id"], error))
+                return
+        states = {s.get("entity_id"): s.get("state") for s in changed or [] if isinstance(s, dict)}
+        # HA only returns the states that changed; an entity already in the target state is "ok".
+        outcomes.update({entity_id: states.get(entity_id) or "ok" for entity_id in data["entity_id"]})
+
+    await asyncio.gather(*(run(*c) for c in calls))
+    return outcomes
+
+
+def summarize(action: str, outcomes: dict[str, str], skipped: dict[str, str], calls: int, budget: int) -> dict:
+    """Entities per outcome; each list is cut (with `more`) once the result would exceed `budget` tokens."""
+    by_outcome: dict[str, list[str]] = {}
+    for entity_id, outcome in sorted(outcomes.items()):
+        by_outcome.setdefault(outcome, []).append(entity_id)
+    for entity_id, reason in sorted(skipped.items()):
+        by_outcome.setdefault(f"skipped: {reason}", []).append(entity_id)
+    failed = sum(1 for o in outcomes.values() if o.startswith("error"))
+    result = {"action": action, "targets": len(outcomes), "service_calls": calls,
+              "succeeded": len(outcomes) - failed, "failed": failed, "skipped": len(skipped), "results": {}}
+    remaining = budget - count_tokens(result) - 16
+    for outcome, ids in by_outcome.items():
+        shown = []
+        for entity_id in ids:
+            cost = count_tokens(entity_id) + 2
+            if remaining - cost < 0 and shown:
+                break
+            shown.append(entity_id)
+            remaining -= cost
+        entry = {"entity_ids": shown}
+        if len(shown) < len(ids):
+            entry["more"] = len(ids) - len(shown)
+        result["results"][outcome] = entry
+    return result
@@ -0,0 +1,52 @@
+"""Shared, pooled HTTP client for talking to the Home Assistant REST API."""
+import os
+import httpx
+
+
+def http2_available() -> bool:
+    """True when the optional `h2` package is installed (httpx needs it for HTTP/2)."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def client_limits() -> httpx.Limits:
+    """Keep-alive pool limits, configurable via env."""
+    return httpx.Limits(
+        max_connections=int(os.getenv("HA_POOL_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("HA_POOL_MAX_KEEPALIVE", "10")),
+        keepalive_expiry=float(os.getenv("HA_POOL_KEEPALIVE_EXPIRY", "30")),
+    )
+
+
+def client_timeout() -> httpx.Timeout:
+    """Default timeouts; individual calls may override them."""
+    return httpx.Timeout(
+        float(os.getenv("HA_TIMEOUT", "10")),
+        connect=float(os.getenv("HA_CONNECT_TIMEOUT", "5")),
+    )
+
+
+def use_http2() -> bool:
+    """HA_HTTP2=auto (default) enables HTTP/2 only when `h2` is importable."""
+    setting = os.getenv("HA_HTTP2", "auto").lower()
+    if setting == "auto":
+        return http2_available()
+    return setting in {"1", "true", "yes", "on"} and http2_available()
+
+
+def build_client(base_url: str, token: str | None, event_hooks: dict | None = None) -> httpx.AsyncClient:
+    """Create one long-lived AsyncClient; callers own it and must `aclose()` it."""
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        limits=client_limits(),
+        timeout=client_timeout(),
+        http2=use_http2(),
+        event_hooks=event_hooks,
+    )
@@ -0,0 +1,134 @@
+"""Coalescing of Home Assistant service calls that only differ in their target entities."""
+import asyncio
+import json
+from typing import Awaitable, Callable, Optional
+
+ServiceCall = Callable[[str, str, dict], Awaitable]
+
+# Services whose effect is the same however often they run, so merging or sharing calls is safe.
+# Anything else (toggle, increment, notify.*, script.*, button presses, ...) always goes upstream as sent.
+IDEMPOTENT_SERVICES = {"turn_on", "turn_off", "open_cover", "close_cover", "stop_cover",
+                       "open_valve", "close_valve", "select_option"}
+NEVER_MERGED_DOMAINS = {"script", "notify", "tts", "persistent_notification", "shell_command", "rest_command"}
+# Relative changes that repeat their effect on every call (light.turn_on brightness_step, ...).
+RELATIVE_DATA = {"brightness_step", "brightness_step_pct", "color_temp_step"}
+
+
+def idempotent(domain: str, service: str, data: dict) -> bool:
+    """True when running the call twice (or as part of a merged call) has the same effect as once."""
+    if domain in NEVER_MERGED_DOMAINS or RELATIVE_DATA & data.keys():
+        return False
+    return service in IDEMPOTENT_SERVICES or service.startswith("set_")
+
+
+def _entity_ids(data: dict) -> Optional[list[str]]:
+    """The call's entity_id(s) as a list, or None when it can't be merged (absent, or `all`)."""
+    value = data.get("entity_id")
+    if isinstance(value, str) and value != "all":
+        return [e.strip() for e in value.split(",") if e.strip()]
+    if isinstance(value, list) and value and all(isinstance(e, str) for e in value):
+        return value
+    return None
+
+
+def _key(*parts) -> str:
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+class _Group:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.entity_ids: dict[str, None] = {}
+        self.future = loop.create_future()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class ServiceCoalescer:
+    """
+    Sits in front of a `call(domain, service, data)` coroutine.
+
+    * Calls with the same domain, service and non-entity data that arrive within
+      `window` seconds become one upstream call with the combined entity_id list;
+      each caller gets back only the changed states of its own entities.
+    * A call identical to one already in flight shares that call's result.
+
+    Only idempotent calls (see `idempotent`) are merged or shared; the rest pass straight through.
+    """
+
+    def __init__(self, call: ServiceCall, window: float = 0.01, max_entities: int = 100):
+        self._call = call
+        self.window = window
+        self.max_entities = max_entities
+        self._groups: dict[str, _Group] = {}
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.requests = 0
+        self.upstream_calls = 0
+        self.merged = 0
+        self.deduplicated = 0
+        self.passed_through = 0
+
+    async def call(self, domain: str, service: str, data: Optional[dict] = None):
+        data = data or {}
+        self.requests += 1
+        if not idempotent(domain, service, data):
+            self.passed_through += 1
+            return await self._upstream(domain, service, data)
+        key = _key(domain, service, data)
+        if key in self._in_flight:
+            self.deduplicated += 1
+            return await asyncio.shield(self._in_flight[key])
+        future = asyncio.ensure_future(self._dispatch(domain, service, data))
+        self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _dispatch(self, domain: str, service: str, data: dict):
+        entity_ids = _entity_ids(data)
+        if entity_ids is None or self.window <= 0:
+            return await self._upstream(domain, service, data)
+        rest = {k: v for k, v in data.items() if k != "entity_id"}
+        group_key = _key(domain, service, rest)
+        group = self._groups.get(group_key)
+        if group is None:
+            group = self._groups[group_key] = _Group(asyncio.get_running_loop())
+            group.timer = asyncio.get_running_loop().call_later(
+                self.window, self._flush, group_key, domain, service, rest)
+        else:
+            self.merged += 1
+        group.entity_ids.update(dict.fromkeys(entity_ids))
+        future = group.future
+        if len(group.entity_ids) >= self.max_entities:
+            group.timer.cancel()
+            self._flush(group_key, domain, service, rest)
+        result = await asyncio.shield(future)
+        if isinstance(result, list):
+            mine = set(entity_ids)
+            return [s for s in result if isinstance(s, dict) and s.get("entity_id") in mine]
+        return result
+
+    def _flush(self, group_key: str, domain: str, service: str, rest: dict):
+        group = self._groups.pop(group_key, None)
+        if group is None:
+            return
+        data = dict(rest, entity_id=list(group.entity_ids))
+
+        async def run():
+            try:
+                group.future.set_result(await self._upstream(domain, service, data))
+            except Exception as e:
+                group.future.set_exception(e)
+
+        asyncio.ensure_future(run())
+
+    async def _upstream(self, domain: str, service: str, data: dict):
+        self.upstream_calls += 1
+        return await self._call(domain, service, data)
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "requests": self.requests,
+            "upstream_calls": self.upstream_calls,
+            "merged": self.merged,
+            "deduplicated": self.deduplicated,
+            "passed_through": self.passed_through,
+        }
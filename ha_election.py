@@ -0,0 +1,62 @@
+"""
+Startup of the proxied instances, and leader election when several HTTP workers share them.
+
+With MCP_WORKERS > 1, one worker holds the leader lock and runs the event streams and state
+caches; the others serve search from its published snapshots (see ha_shared) and take over
+when the leader's lock is released.
+"""
+import asyncio
+import logging
+import os
+from typing import Optional
+from ha_instance import HAInstance
+from ha_shared import LeaderLock, Snapshot
+
+SNAPSHOT_INTERVAL = float(os.getenv("MCP_SNAPSHOT_INTERVAL_MS", "100")) / 1000
+# How often a follower checks whether the leader is gone.
+LEADER_POLL = float(os.getenv("MCP_LEADER_POLL", "1"))
+
+
+class Election:
+    def __init__(self, instances: dict[str, HAInstance], shared_dir: str):
+        self.instances = instances
+        self.shared_dir = shared_dir
+        self.leader_lock: Optional[LeaderLock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _snapshots(self) -> dict[str, Snapshot]:
+        os.makedirs(self.shared_dir, exist_ok=True)
+        return {slug: Snapshot(self.shared_dir, slug) for slug in self.instances}
+
+    async def _await_leadership(self, snapshots):
+        while not self.leader_lock.try_acquire():
+            await asyncio.sleep(LEADER_POLL)
+        logging.info(f"Worker {os.getpid()} took over as leader")
+        for slug, instance in self.instances.items():
+            await instance.promote(snapshots[slug], SNAPSHOT_INTERVAL)
+
+    async def start(self, shared: bool = False):
+        """Start every instance; `shared` (multi-worker HTTP) elects one leader via LeaderLock."""
+        if not shared:
+            for instance in self.instances.values():
+                await instance.start()
+            return
+        snapshots = self._snapshots()
+        self.leader_lock = LeaderLock(os.path.join(self.shared_dir, "leader.lock"))
+        if self.leader_lock.try_acquire():
+            logging.info(f"Worker {os.getpid()} is the leader")
+            for slug, instance in self.instances.items():
+                await instance.start(snapshots[slug], SNAPSHOT_INTERVAL)
+        else:
+            for slug, instance in self.instances.items():
+                await instance.follow(snapshots[slug], SNAPSHOT_INTERVAL)
+            self._task = asyncio.create_task(self._await_leadership(snapshots))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.gather(*(i.stop() for i in self.instances.values()))
+        if self.leader_lock is not None:
+            self.leader_lock.release()
@@ -0,0 +1,92 @@
+"""Short-lived, indexed cache of Home Assistant entity states shared by the agent's tools."""
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+from ha_state_cache import StateIndex
+
+
+class EntityStore:
+    """
+    Holds one /api/states snapshot for `ttl` seconds so that several tool calls in
+    the same agent turn share a single download. Mutating tools call `invalidate()`
+    so the next read sees their effect.
+    """
+
+    def __init__(self, fetch_states: Callable[[], Awaitable[list[dict]]], ttl: float = 5.0):
+        self.fetch_states = fetch_states
+        self.ttl = ttl
+        self.fetches = 0
+        self.fetches_avoided = 0
+        self._index: Optional[StateIndex] = None
+        self._latest: Optional[StateIndex] = None
+        self._fingerprint: Optional[int] = None
+        self._fetched_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._generation = 0
+
+    def _fresh(self) -> bool:
+        return self._index is not None and time.monotonic() - self._fetched_at < self.ttl
+
+    async def index(self, force: bool = False) -> StateIndex:
+        """The current snapshot, fetching a new one if it expired (or `force`).
+        Concurrent callers during a fetch share it instead of starting their own."""
+        if not force and self._fresh():
+            self.fetches_avoided += 1
+            return self._index
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._fetch())
+        elif not force:
+            self.fetches_avoided += 1
+        return await asyncio.shield(self._refresh_task)
+
+    async def _fetch(self) -> StateIndex:
+        generation = self._generation
+        index = StateIndex(await self.fetch_states())
+        self.fetches += 1
+        self._latest = index
+        # Don't keep a snapshot that started before an invalidate().
+        if generation == self._generation:
+            self._index = index
+            self._fingerprint = hash(tuple((e, s.get("last_updated")) for e, s in index.states.items()))
+            self._fetched_at = time.monotonic()
+        return index
+
+    async def fingerprint(self) -> int:
+        """Identifies the current states (entity ids and last_updated); equal across
+        snapshots whose states didn't change."""
+        index = await self.index()
+        # A snapshot fetched across an invalidate() is returned but not kept; never reuse for it.
+        return self._fingerprint if index is self._index else hash(index)
+
+    async def latest(self) -> StateIndex:
+        """The most recent snapshot even if expired or invalidated, for callers that need
+        entity names rather than current states. Only fetches if none was ever loaded."""
+        if self._latest is not None:
+            return self._latest
+        return await self.index()
+
+    async def refresh(self) -> StateIndex:
+        return await self.index(force=True)
+
+    def invalidate(self):
+        self._index = None
+        self._generation += 1
+
+    # --- Queries (O(result) on the indexes) ---
+    async def entity_ids(self) -> list[str]:
+        return list((await self.index()).states)
+
+    async def by_domain(self, domain: str) -> list[str]:
+        return list((await self.index()).domain(domain))
+
+    async def by_state(self, domain: str, state: str) -> list[str]:
+        return list((await self.index()).domain_state(domain, state))
+
+    def stats(self) -> dict:
+        return {
+            "entities": len(self._index) if self._index is not None else 0,
+            "ttl_seconds": self.ttl,
+            "fetches": self.fetches,
+            "fetches_avoided": self.fetches_avoided,
+            "age_seconds": round(time.monotonic() - self._fetched_at, 3) if self._index is not None else None,
+        }
@@ -0,0 +1,100 @@
+"""Home Assistant websocket event subscription with automatic reconnect."""
+import asyncio
+import json
+import logging
+import random
+from typing import Awaitable, Callable, Iterable, Optional
+import websockets
+
+EventHandler = Callable[[dict], Awaitable[None] | None]
+Hook = Callable[[], Awaitable[None] | None]
+
+
+def websocket_url(base_url: str) -> str:
+    """http://host:8123 -> ws://host:8123/api/websocket (https -> wss)."""
+    base = base_url.rstrip("/")
+    if base.startswith("https://"):
+        base = "wss://" + base[len("https://"):]
+    elif base.startswith("http://"):
+        base = "ws://" + base[len("http://"):]
+    return f"{base}/api/websocket"
+
+
+async def _maybe_await(value):
+    if asyncio.iscoroutine(value):
+        await value
+
+
+class EventStream:
+    """
+    One websocket connection to HA subscribed to `event_types`.
+    `on_connect` runs after every (re)subscription, so callers can resync state;
+    `on_disconnect` runs whenever the connection drops.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        token: Optional[str],
+        event_types: Iterable[str],
+        on_event: EventHandler,
+        on_connect: Optional[Hook] = None,
+        on_disconnect: Optional[Hook] = None,
+        heartbeat: float = 30.0,
+        max_backoff: float = 30.0,
+    ):
+        self.url = websocket_url(base_url)
+        self.token = token
+        self.event_types = list(event_types)
+        self.on_event = on_event
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.heartbeat = heartbeat
+        self.max_backoff = max_backoff
+        self.connected = False
+        self.reconnects = 0
+
+    async def _authenticate(self, ws):
+        msg = json.loads(await ws.recv())
+        if msg.get("type") == "auth_required":
+            await ws.send(json.dumps({"type": "auth", "access_token": self.token}))
+            msg = json.loads(await ws.recv())
+        if msg.get("type") != "auth_ok":
+            raise ConnectionError(f"HA websocket auth failed: {msg}")
+
+    async def _subscribe(self, ws):
+        for msg_id, event_type in enumerate(self.event_types, start=1):
+            await ws.send(json.dumps({"id": msg_id, "type": "subscribe_events", "event_type": event_type}))
+            msg = json.loads(await ws.recv())
+            if not msg.get("success"):
+                raise ConnectionError(f"HA websocket subscribe to {event_type} failed: {msg}")
+
+    async def _session(self):
+        async with websockets.connect(self.url, max_size=None, ping_interval=self.heartbeat) as ws:
+            await self._authenticate(ws)
+            await self._subscribe(ws)
+            self.connected = True
+            logging.info(f"Subscribed to HA events {self.event_types} at {self.url}")
+            await _maybe_await(self.on_connect() if self.on_connect else None)
+            async for raw in ws:
+                msg = json.loads(raw)
+                if msg.get("type") == "event":
+                    await _maybe_await(self.on_event(msg["event"]))
+
+    async def run(self):
+        """Stay subscribed until cancelled, reconnecting with jittered exponential backoff."""
+        backoff = 1.0
+        while True:
+            try:
+                await self._session()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"HA websocket error: {e}")
+            if self.connected:
+                self.connected = False
+                backoff = 1.0
+                await _maybe_await(self.on_disconnect() if self.on_disconnect else None)
+            self.reconnects += 1
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.0))
+            backoff = min(backoff * 2, self.max_backoff)
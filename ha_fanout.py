@@ -0,0 +1,202 @@
+"""Fan-out of HA state changes from the proxy's one upstream event subscription to many filtered subscribers."""
+import asyncio
+import itertools
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from typing import Optional
+from ha_search import _glob_domain, _GLOB_CHARS
+
+_MISSING = object()
+# Subscription ids are unique across every FanOut in the process (one per HA instance).
+_ids = itertools.count(1)
+
+
+def _as_list(value) -> list[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(",") if v.strip()]
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return value
+    raise ValueError("subscription filters must be a string or a list of strings")
+
+
+def state_diff(data: dict) -> dict:
+    """A compact diff of one state_changed event: the state transition and changed attributes."""
+    old, new = data.get("old_state") or {}, data.get("new_state")
+    diff = {"entity_id": data.get("entity_id"), "old_state": old.get("state")}
+    if new is None:
+        diff["removed"] = True
+        return diff
+    old_attrs, new_attrs = old.get("attributes") or {}, new.get("attributes") or {}
+    diff["state"] = new.get("state")
+    diff["attributes"] = {k: v for k, v in new_attrs.items() if old_attrs.get(k, _MISSING) != v}
+    removed = [k for k in old_attrs if k not in new_attrs]
+    if removed:
+        diff["removed_attributes"] = removed
+    diff["last_updated"] = new.get("last_updated")
+    return diff
+
+
+def _merge(older: dict, newer: dict) -> dict:
+    """Coalesce two diffs of the same entity into one spanning both."""
+    merged = dict(newer, old_state=older.get("old_state"))
+    if "attributes" in older and "attributes" in newer:
+        merged["attributes"] = {**older["attributes"], **newer["attributes"]}
+    removed = set(older.get("removed_attributes", [])) | set(newer.get("removed_attributes", []))
+    removed -= set(merged.get("attributes", {}))
+    if removed:
+        merged["removed_attributes"] = sorted(removed)
+    return merged
+
+
+class Subscriber:
+    """
+    One downstream subscription with a bounded queue of pending diffs, keyed by entity.
+    A further change to an entity that is still queued is merged into its pending diff;
+    when `max_pending` distinct entities are queued the oldest is dropped and counted,
+    and the next delivery tells the client how many it lost.
+    """
+
+    def __init__(self, sub_id: int, entity_ids: list[str], domains: list[str], max_pending: int):
+        self.id = sub_id
+        self.entity_ids = [e for e in entity_ids if not _GLOB_CHARS & set(e)]
+        self.patterns = [e for e in entity_ids if _GLOB_CHARS & set(e)]
+        self.domains = domains
+        self.max_pending = max_pending
+        self.pending: OrderedDict[str, dict] = OrderedDict()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self._dropped_unreported = 0
+        self.resync = False
+
+    def push(self, diff: dict):
+        entity_id = diff["entity_id"]
+        if entity_id in self.pending:
+            self.pending[entity_id] = _merge(self.pending.pop(entity_id), diff)
+            self.coalesced += 1
+        else:
+            if len(self.pending) >= self.max_pending:
+                self.pending.popitem(last=False)
+                self.dropped += 1
+                self._dropped_unreported += 1
+            self.pending[entity_id] = diff
+        self.ready.set()
+
+    def request_resync(self):
+        """Upstream events may have been missed; the client should re-read current state."""
+        self.resync = True
+        self.ready.set()
+
+    async def next_batch(self) -> Optional[dict]:
+        """Wait for and take everything pending; None once the subscription is closed."""
+        while not (self.pending or self.resync or self.closed):
+            self.ready.clear()
+            await self.ready.wait()
+        if self.closed:
+            return None
+        batch = {"subscription": self.id, "changes": list(self.pending.values())}
+        if self._dropped_unreported:
+            batch["dropped"] = self._dropped_unreported
+        if self.resync:
+            batch["resync"] = True
+        self.delivered += len(self.pending)
+        self.pending.clear()
+        self._dropped_unreported = 0
+        self.resync = False
+        return batch
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    def stats(self) -> dict:
+        return {"id": self.id, "entity_ids": self.entity_ids + self.patterns, "domains": self.domains,
+                "pending": len(self.pending), "delivered": self.delivered,
+                "coalesced": self.coalesced, "dropped": self.dropped}
+
+
+class FanOut:
+    """Routes each state_changed event to matching subscribers, looked up by entity and domain."""
+
+    def __init__(self, max_pending: int = 1000):
+        self.max_pending = max_pending
+        self.subscribers: dict[int, Subscriber] = {}
+        self._by_entity: dict[str, set[Subscriber]] = {}
+        self._by_domain: dict[str, set[Subscriber]] = {}
+        self._patterns: set[Subscriber] = set()
+        self._everything: set[Subscriber] = set()
+        self.events = 0
+        self.deliveries = 0
+
+    def subscribe(self, entity_id=None, domain=None, max_pending: Optional[int] = None) -> Subscriber:
+        """Subscribe to changes of the given entity_ids/globs and domains (all entities if neither)."""
+        entity_ids, domains = _as_list(entity_id), _as_list(domain)
+        if max_pending is not None and (type(max_pending) is not int or max_pending < 1):
+            raise ValueError("max_pending must be a positive integer")
+        sub = Subscriber(next(_ids), entity_ids, domains, max_pending or self.max_pending)
+        self.subscribers[sub.id] = sub
+        for e in sub.entity_ids:
+            self._by_entity.setdefault(e, set()).add(sub)
+        for d in sub.domains:
+            self._by_domain.setdefault(d, set()).add(sub)
+        for pattern in sub.patterns:
+            # Globs with a literal domain only need to be tried against that domain's events.
+            d = _glob_domain(pattern)
+            (self._by_domain.setdefault(d, set()) if d else self._patterns).add(sub)
+        if not (entity_ids or domains):
+            self._everything.add(sub)
+        return sub
+
+    def unsubscribe(self, sub_id: int) -> bool:
+        sub = self.subscribers.pop(sub_id, None)
+        if sub is None:
+            return False
+        for index in (self._by_entity, self._by_domain):
+            for key in [k for k, subs in index.items() if sub in subs]:
+                index[key].discard(sub)
+                if not index[key]:
+                    del index[key]
+        self._patterns.discard(sub)
+        self._everything.discard(sub)
+        sub.close()
+        return True
+
+    def _matches(self, sub: Subscriber, entity_id: str, domain: str) -> bool:
+        return (not (sub.entity_ids or sub.domains or sub.patterns) or entity_id in sub.entity_ids
+                or domain in sub.domains or any(fnmatchcase(entity_id, p) for p in sub.patterns))
+
+    def publish(self, event: dict):
+        if not self.subscribers:
+            return
+        data = event.get("data", {})
+        entity_id = data.get("entity_id")
+        if not entity_id:
+            return
+        self.events += 1
+        domain = entity_id.split(".", 1)[0]
+        candidates = (self._everything | self._by_entity.get(entity_id, set())
+                      | self._by_domain.get(domain, set()) | self._patterns)
+        diff = None
+        for sub in candidates:
+            if self._matches(sub, entity_id, domain):
+                diff = diff or state_diff(data)
+                sub.push(diff)
+                self.deliveries += 1
+
+    def resync(self):
+        for sub in self.subscribers.values():
+            sub.request_resync()
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "events": self.events,
+            "deliveries": self.deliveries,
+            "pending": sum(len(s.pending) for s in self.subscribers.values()),
+            "coalesced": sum(s.coalesced for s in self.subscribers.values()),
+            "dropped": sum(s.dropped for s in self.subscribers.values()),
+        }
@@ -0,0 +1,64 @@
+"""Synthetic Home Assistant entity states and services, shared by ha_simulator and the benchmarks."""
+import random
+from datetime import datetime, timezone
+
+DOMAINS = {
+    "light": ["turn_on", "turn_off", "toggle"],
+    "switch": ["turn_on", "turn_off", "toggle"],
+    "fan": ["turn_on", "turn_off", "set_percentage"],
+    "cover": ["open_cover", "close_cover", "stop_cover"],
+    "sensor": [],
+    "binary_sensor": [],
+    "input_number": ["set_value", "increment", "decrement"],
+    "climate": ["set_temperature", "set_hvac_mode"],
+    "scene": ["turn_on"],
+}
+AREAS = ["Kitchen", "Living Room", "Bedroom", "Outside", "Garage", "Office"]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def make_states(count: int, seed: int = 0) -> list[dict]:
+    """Deterministic synthetic entity states spread across DOMAINS and AREAS."""
+    rng = random.Random(seed)
+    domains = list(DOMAINS)
+    states = []
+    for i in range(count):
+        domain = domains[i % len(domains)]
+        area = AREAS[(i // len(domains)) % len(AREAS)]
+        name = f"{area} {domain.replace('_', ' ').title()} {i}"
+        attributes = {"friendly_name": name, "icon": f"mdi:{domain}", "supported_features": rng.randint(0, 63)}
+        if domain == "sensor":
+            state = f"{rng.uniform(15, 30):.1f}"
+            attributes.update({"unit_of_measurement": "°C", "device_class": "temperature"})
+        elif domain == "input_number":
+            state = str(rng.randint(0, 100))
+            attributes.update({"min": 0, "max": 100, "step": 1, "mode": "slider"})
+        elif domain == "climate":
+            state = rng.choice(["heat", "cool", "off"])
+            attributes.update({"temperature": 21, "current_temperature": 20.5, "hvac_modes": ["heat", "cool", "off"]})
+        elif domain == "cover":
+            state = rng.choice(["open", "closed"])
+        elif domain == "scene":
+            state = _now()
+        else:
+            state = rng.choice(["on", "off"])
+        ts = _now()
+        states.append({
+            "entity_id": f"{domain}.{area.lower().replace(' ', '_')}_{domain}_{i}",
+            "state": state,
+            "attributes": attributes,
+            "last_changed": ts,
+            "last_updated": ts,
+            "context": {"id": f"{i:026d}", "parent_id": None, "user_id": None},
+        })
+    return states
+
+
+def make_services() -> list[dict]:
+    return [
+        {"domain": domain, "services": {s: {"name": s.replace("_", " "), "fields": {}} for s in services}}
+        for domain, services in DOMAINS.items() if services
+    ]
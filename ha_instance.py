@@ -0,0 +1,277 @@
+"""
+One upstream Home Assistant as seen by ha_mcp_proxy: its pooled client, state cache, service
+registry, service call coalescer and state change fan-out, kept current by one event stream.
+"""
+import asyncio
+import json
+import logging
+import re
+from typing import Optional
+import httpx
+from ha_client import build_client
+from ha_coalesce import ServiceCoalescer
+from ha_events import EventStream
+from ha_fanout import FanOut
+from ha_json import RawJSON
+from ha_resilience import CircuitBreaker, CircuitOpenError, ResilientUpstream
+from ha_search import is_filtered, query
+from ha_services import ServiceRegistry
+from ha_shared import SharedStateCache, Snapshot, SnapshotPublisher, snapshot_events
+from ha_state_cache import StateCache, StateIndex
+from proxy_metrics import (
+    UPSTREAM_IN_FLIGHT, UPSTREAM_LATENCY, UPSTREAM_REQUESTS, UPSTREAM_RESPONSE_BYTES, track, upstream_path_label,
+)
+
+MCP_SSE_SUFFIX = "/mcp_server/sse"
+
+
+def slugify(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+
+def instances_from_config(path) -> list[tuple[str, str, Optional[str]]]:
+    """
+    (name, base_url, token) of every Home Assistant in an mcp_config.json: the servers whose
+    SSE_URL is HA's `/mcp_server/sse` endpoint (or that set HA_URL in their env).
+    """
+    with open(path) as f:
+        servers = json.load(f).get("mcpServers", {})
+    found = []
+    for name, server in servers.items():
+        env = server.get("env") or {}
+        url = env.get("HA_URL")
+        if url is None and env.get("SSE_URL", "").endswith(MCP_SSE_SUFFIX):
+            url = env["SSE_URL"][:-len(MCP_SSE_SUFFIX)]
+        if url:
+            found.append((name, url.rstrip("/"), env.get("API_ACCESS_TOKEN")))
+    return found
+
+
+def config_url(path, name: str) -> Optional[str]:
+    """Base URL of the Home Assistant called `name` in an mcp_config.json, if it is listed."""
+    try:
+        return next((url for n, url, _ in instances_from_config(path) if n == name), None)
+    except OSError:
+        return None
+
+
+class HAInstance:
+    def __init__(self, name: str, url: str, token: Optional[str], state_cache: bool = True,
+                 max_staleness: float = 30.0, services_ttl: float = 300.0, coalesce_window: float = 0.01,
+                 subscriber_queue: int = 1000, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.slug = slugify(name)
+        self.url = url
+        self.token = token
+        self.cache_enabled = state_cache
+        self.max_staleness = max_staleness
+        self.client: Optional[httpx.AsyncClient] = None
+        self.upstream = ResilientUpstream(breaker)
+        self.state_cache: Optional[StateCache] = None
+        # The service registry is cached until a service_registered/service_removed event or its TTL.
+        self.services = ServiceRegistry(lambda: self.rest_call("/api/services", raw=True), ttl=services_ttl)
+        # call_service requests differing only in entity_id within the window share one upstream call.
+        self.coalescer = ServiceCoalescer(
+            lambda domain, service, data: self.rest_call(f"/api/services/{domain}/{service}", method="POST", data=data),
+            window=coalesce_window,
+        )
+        self.fanout = FanOut(max_pending=subscriber_queue)
+        self._event_task: Optional[asyncio.Task] = None
+        self._connected_before = False
+        self.connects = 0
+        # Multi-worker mode (see ha_shared): the leader publishes snapshots, followers read them.
+        self.role = "standalone"
+        self._shared_task: Optional[asyncio.Task] = None
+
+    def __repr__(self):
+        return f"HAInstance({self.name!r}, {self.url!r})"
+
+    # --- Shared upstream client ---
+    def get_client(self) -> httpx.AsyncClient:
+        # One pooled client per instance, so calls reuse keep-alive connections.
+        if self.client is None:
+            self.client = build_client(self.url, self.token)
+        return self.client
+
+    async def close_client(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def rest_call(self, path, method="GET", data=None, timeout=None, raw=False):
+        """Call the HA REST API on the shared client, through the route's resilience policy
+        (see ha_resilience); `timeout` (seconds) overrides the route's timeout. With `raw`, the
+        response body is returned undecoded as RawJSON for pass-through. Failures come back as
+        {"error": ...}."""
+        client = self.get_client()
+        label = upstream_path_label(path)
+        status = "error"
+        try:
+            with track(UPSTREAM_LATENCY, UPSTREAM_IN_FLIGHT, {"instance": self.slug}, instance=self.slug,
+                       method=method, path=label):
+                try:
+                    resp = await self.upstream.request(client, method, path, data, timeout)
+                except CircuitOpenError:
+                    status = "circuit_open"
+                    raise
+            status = str(resp.status_code)
+            UPSTREAM_RESPONSE_BYTES.observe(len(resp.content), instance=self.slug, path=label)
+            resp.raise_for_status()
+            return RawJSON(resp.content) if raw else resp.json()
+        except Exception as e:
+            logging.error(f"HA REST error ({self.name}): {e}")
+            return {"error": str(e)}
+        finally:
+            UPSTREAM_REQUESTS.inc(instance=self.slug, method=method, path=label, status=status)
+
+    # --- Event stream ---
+    def _fan_out(self, event):
+        # A failing subscriber must not break the shared upstream stream.
+        try:
+            self.fanout.publish(event)
+        except Exception as e:
+            logging.error(f"Fan-out error ({self.name}): {e!r}")
+
+    def _on_event(self, event):
+        event_type = event.get("event_type")
+        if event_type == "state_changed":
+            if self.state_cache is not None:
+                self.state_cache.apply_event(event)
+            self._fan_out(event)
+        elif event_type in ServiceRegistry.EVENT_TYPES:
+            self.services.invalidate()
+
+    def _on_connect(self):
+        # Registry and state events may have been missed while disconnected.
+        self.connects += 1
+        self.services.invalidate()
+        if self._connected_before:
+            self.fanout.resync()
+        self._connected_before = True
+        if self.state_cache is not None:
+            self.state_cache.on_connect()
+
+    def _on_disconnect(self):
+        if self.state_cache is not None:
+            self.state_cache.on_disconnect()
+
+    async def start(self, snapshot: Optional[Snapshot] = None, interval: float = 0.1):
+        """Subscribe to HA events; with `snapshot`, also publish the state cache to follower workers."""
+        self.get_client()
+        if self._event_task is not None:
+            return
+        if self.cache_enabled:
+            self.state_cache = StateCache(lambda: self.rest_call("/api/states"), self.max_staleness)
+        event_types = ["state_changed", *ServiceRegistry.EVENT_TYPES]
+        stream = EventStream(self.url, self.token, event_types, self._on_event,
+                             on_connect=self._on_connect, on_disconnect=self._on_disconnect)
+        self._event_task = asyncio.create_task(stream.run())
+        if snapshot is not None and self.state_cache is not None:
+            self.role = "leader"
+            self._shared_task = asyncio.create_task(self._publish(SnapshotPublisher(snapshot), interval))
+
+    async def follow(self, snapshot: Snapshot, interval: float = 0.1):
+        """Serve states from the leader's snapshot instead of subscribing to HA."""
+        self.get_client()
+        self.role = "follower"
+        self.state_cache = SharedStateCache(snapshot, lambda: self.rest_call("/api/states"), self.max_staleness)
+        self._shared_task = asyncio.create_task(self._follow(interval))
+
+    async def _publish(self, publisher: SnapshotPublisher, interval: float):
+        while True:
+            publisher.tick(self.state_cache, self.connects, self.services.generation)
+            await asyncio.sleep(interval)
+
+    async def _follow(self, interval: float):
+        cache = self.state_cache
+        connects = registry = None
+        while True:
+            if self.fanout.subscribers:
+                # Subscribers get the changes between consecutive snapshots.
+                before = cache.index if cache.ready else None
+                if cache.sync() and before is not None:
+                    for event in snapshot_events(before, cache.index):
+                        self._fan_out(event)
+            else:
+                cache.sync()
+            if connects is not None and cache.leader_connects != connects:
+                # The leader reconnected: registry changes and events may have been missed.
+                self.services.invalidate()
+                self.fanout.resync()
+            elif registry is not None and cache.leader_registry != registry:
+                # The leader saw service_registered/service_removed (or dropped its registry).
+                self.services.invalidate()
+            connects, registry = cache.leader_connects, cache.leader_registry
+            await asyncio.sleep(interval)
+
+    async def _stop_shared(self):
+        if self._shared_task is not None:
+            self._shared_task.cancel()
+            await asyncio.gather(self._shared_task, return_exceptions=True)
+            self._shared_task = None
+
+    async def promote(self, snapshot: Snapshot, interval: float = 0.1):
+        """A follower whose leader went away takes over the event stream and publishing."""
+        await self._stop_shared()
+        await self.start(snapshot, interval)
+
+    async def stop(self):
+        await self._stop_shared()
+        if self._event_task is not None:
+            self._event_task.cancel()
+            await asyncio.gather(self._event_task, return_exceptions=True)
+            self._event_task = None
+        self.role = "standalone"
+        self.state_cache = None
+        self.services.invalidate()
+        await self.close_client()
+
+    # --- Reads ---
+    def _serves_stale(self) -> bool:
+        """While the breaker is open, a cache that is too stale still beats failing."""
+        if self.state_cache is not None and self.state_cache.ready and self.upstream.breaker.state != "closed":
+            self.upstream.stale_served += 1
+            return True
+        return False
+
+    async def get_index(self):
+        """Indexed entity states: from the cache when it is fresh, otherwise one (shared) upstream fetch.
+        Returns the upstream error dict unchanged when HA could not be reached."""
+        if self.state_cache is not None:
+            index = self.state_cache.lookup()
+            if index is not None:
+                return index
+            result = await self.state_cache.refresh()
+            if isinstance(result, list):
+                return self.state_cache.index
+            return self.state_cache.index if self._serves_stale() else result
+        result = await self.rest_call("/api/states")
+        return StateIndex(result) if isinstance(result, list) else result
+
+    async def search(self, params):
+        """Full state list when called without filters, else a filtered/paginated page (see ha_search).
+        The full list is passed through pre-encoded: the cache's encoding, or the raw upstream bytes."""
+        if is_filtered(params):
+            index = await self.get_index()
+            return query(index, params) if isinstance(index, StateIndex) else index
+        if self.state_cache is None:
+            return await self.rest_call("/api/states", raw=True)
+        encoded = self.state_cache.lookup_encoded()
+        if encoded is None:
+            result = await self.state_cache.refresh()
+            if not (isinstance(result, list) or self._serves_stale()):
+                return result
+            encoded = self.state_cache.encoded()
+        return RawJSON(encoded)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "role": self.role,
+            "state_cache": self.state_cache.stats() if self.state_cache else None,
+            "services": self.services.stats(),
+            "coalescer": self.coalescer.stats(),
+            "upstream": self.upstream.stats(),
+            "subscriptions": self.fanout.stats(),
+        }
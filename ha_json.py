@@ -0,0 +1,45 @@
+"""JSON encoding for proxy responses: orjson when installed, pre-encoded pass-through payloads."""
+import json
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+class RawJSON:
+    """An already-encoded JSON value (e.g. upstream bytes) that is spliced into responses verbatim."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def decode(self):
+        return json.loads(self.data)
+
+
+def raw_object(members: dict) -> RawJSON:
+    """A JSON object whose RawJSON members are spliced in without decoding."""
+    parts = [dumps(str(k)) + b":" + (v.data if isinstance(v, RawJSON) else dumps(v)) for k, v in members.items()]
+    return RawJSON(b"{" + b",".join(parts) + b"}")
+
+
+def encode_response(response) -> bytes:
+    """Encode one JSON-RPC response object, or a batch list of them."""
+    if isinstance(response, list):
+        return b"[" + b",".join(encode_response(item) for item in response) + b"]"
+    result = response.get("result")
+    if isinstance(result, RawJSON):
+        envelope = {k: v for k, v in response.items() if k != "result"}
+        return dumps(envelope)[:-1] + b',"result":' + result.data + b"}"
+    return dumps(response)
@@ -1,118 +1,274 @@
 import os
-import sys
-import json
 import asyncio
 import logging
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
 from typing import Optional
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-import httpx
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
+import ha_stdio
+from ha_election import Election
+from ha_instance import HAInstance, instances_from_config
+from ha_json import encode_response, raw_object
+from ha_resilience import CircuitBreaker
+from ha_routing import InstanceRouter
+from ha_rpc import INVALID_PARAMS, InvalidParams, check_params, mcp_error, mcp_response, mcp_result
+from ha_search import is_filtered
+from ha_streaming import COMPRESS_MIN_BYTES, encoded_response, stream_upstream
+from ha_subscriptions import StdioSubscriptions, sse_subscription
+from proxy_metrics import (
+    MCP_IN_FLIGHT, MCP_LATENCY, MCP_METHODS_IN_FLIGHT, MCP_REQUESTS, MCP_RESPONSE_BYTES, REGISTRY,
+    labeled_stats_gauges, track,
+)
 
 # Load environment variables
 load_dotenv()
 
 HA_URL = os.getenv("HA_URL", "http://localhost:8123")
 HA_TOKEN = os.getenv("HA_TOKEN")
+# Without HA_URL, every Home Assistant listed in this file is proxied (see ha_instance.instances_from_config).
+HA_CONFIG = os.getenv("HA_CONFIG", str(Path(__file__).parent / "mcp_config.json"))
 PORT = int(os.getenv("PORT", "8081"))
+# Max entries of one JSON-RPC batch dispatched at the same time.
+BATCH_CONCURRENCY = int(os.getenv("MCP_BATCH_CONCURRENCY", "8"))
 
-HEADERS = {"Authorization": f"Bearer {HA_TOKEN}", "Content-Type": "application/json"}
-
-app = FastAPI()
 logging.basicConfig(level=logging.INFO)
 
-# --- MCP Protocol Handler ---
-def mcp_response(result, id=None):
-    return {"jsonrpc": "2.0", "result": result, "id": id}
+# --- Home Assistant instances ---
+# Each instance has its own pooled client, state cache, service registry, coalescer and fan-out,
+# kept current by its own websocket event stream. `search` is answered from the state cache.
+STATE_CACHE_ENABLED = os.getenv("HA_STATE_CACHE", "1").lower() not in {"0", "false", "no", "off"}
 
-def mcp_error(message, id=None):
-    return {"jsonrpc": "2.0", "error": {"message": message}, "id": id}
+def load_instances() -> dict[str, HAInstance]:
+    """HA_URL/HA_TOKEN as the single instance "default" when HA_URL is set, else every HA in HA_CONFIG."""
+    configured = []
+    if not os.getenv("HA_URL") and os.path.exists(HA_CONFIG):
+        configured = instances_from_config(HA_CONFIG)
+    if not configured:
+        configured = [("default", HA_URL, HA_TOKEN)]
+    instances = {}
+    for name, url, token in configured:
+        instance = HAInstance(
+            name, url, token,
+            state_cache=STATE_CACHE_ENABLED,
+            max_staleness=float(os.getenv("HA_STATE_CACHE_MAX_STALENESS", "30")),
+            services_ttl=float(os.getenv("HA_SERVICES_TTL", "300")),
+            coalesce_window=float(os.getenv("HA_COALESCE_WINDOW_MS", "10")) / 1000,
+            subscriber_queue=int(os.getenv("MCP_SUBSCRIBER_QUEUE", "1000")),
+            breaker=CircuitBreaker(int(os.getenv("HA_BREAKER_FAILURES", "5")), float(os.getenv("HA_BREAKER_RESET", "10"))),
+        )
+        instances[instance.slug] = instance
+    return instances
 
-async def ha_rest_call(path, method="GET", data=None):
-    url = f"{HA_URL}{path}"
-    async with httpx.AsyncClient() as client:
-        try:
-            if method == "GET":
-                resp = await client.get(url, headers=HEADERS)
-            elif method == "POST":
-                resp = await client.post(url, headers=HEADERS, json=data)
-            else:
-                resp = await client.request(method, url, headers=HEADERS, json=data)
-            resp.raise_for_status()
-            return resp.json()
-        except Exception as e:
-            logging.error(f"HA REST error: {e}")
-            return {"error": str(e)}
+INSTANCES = load_instances()
+ROUTER = InstanceRouter(INSTANCES)
+DEFAULT_INSTANCE = ROUTER.default
+logging.info(f"Proxying Home Assistant instances: {', '.join(f'{i.slug}={i.url}' for i in INSTANCES.values())}")
 
-# --- FastAPI HTTP MCP endpoint ---
-@app.post("/mcp")
-async def mcp_http(request: Request):
-    payload = await request.json()
+# --- Multiple workers ---
+# With MCP_WORKERS > 1 (HTTP only), one worker leads and the others follow its snapshots (see ha_election).
+WORKERS = int(os.getenv("MCP_WORKERS", "1"))
+SHARED_DIR = os.getenv("MCP_SHARED_DIR") or os.path.join(tempfile.gettempdir(), f"ha_mcp_proxy-{PORT}")
+election = Election(INSTANCES, SHARED_DIR)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await election.start(shared=WORKERS > 1 and STATE_CACHE_ENABLED)
+    yield
+    await election.stop()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_BYTES)
+
+# --- MCP Protocol Handler ---
+METHODS = {"search", "call_service", "list_services", "cache_stats", "coalescer_stats", "services_stats",
+           "subscribe", "unsubscribe", "subscriptions_stats", "instances", "upstream_stats"}
+
+async def handle_request(payload):
+    """Dispatch one JSON-RPC request object and return the response object."""
     method = payload.get("method")
-    params = payload.get("params", {})
-    req_id = payload.get("id")
+    label = method if method in METHODS else "unknown"
+    response = None
+    try:
+        with track(MCP_LATENCY, MCP_METHODS_IN_FLIGHT, {"method": label}, method=label):
+            response = await _dispatch(method, payload.get("params"), payload.get("id"))
+        return response
+    finally:
+        MCP_REQUESTS.inc(method=label, status="ok" if response and "error" not in response else "error")
+
+def _subscriptions_stats(instance):
+    return dict(instance.fanout.stats(), subscriptions=[s.stats() for s in instance.fanout.subscribers.values()])
+
+async def _dispatch(method, params, req_id):
+    try:
+        return await _dispatch_method(method, check_params(params), req_id)
+    except InvalidParams as e:
+        return mcp_error(f"Invalid params: {e}", req_id, INVALID_PARAMS)
+    except ValueError as e:
+        return mcp_error(str(e), req_id)
+
+async def _dispatch_method(method, params, req_id):
     if method == "search":
-        # Example: list all states
-        result = await ha_rest_call("/api/states")
-        return JSONResponse(mcp_response(result, req_id))
+        return mcp_result(await ROUTER.search(params), req_id)
     elif method == "call_service":
         domain = params.get("domain")
         service = params.get("service")
-        service_data = params.get("service_data", {})
         if not (domain and service):
-            return JSONResponse(mcp_error("Missing domain/service", req_id))
-        result = await ha_rest_call(f"/api/services/{domain}/{service}", method="POST", data=service_data)
-        return JSONResponse(mcp_response(result, req_id))
+            return mcp_error("Missing domain/service", req_id)
+        if not (isinstance(domain, str) and isinstance(service, str)):
+            raise InvalidParams("params 'domain' and 'service' must be strings")
+        return mcp_result(await ROUTER.call_service(domain, service, params), req_id)
     elif method == "list_services":
-        # List all available Home Assistant services
-        result = await ha_rest_call("/api/services")
-        return JSONResponse(mcp_response(result, req_id))
+        # All available Home Assistant services, or one domain's slice
+        domain = params.get("domain")
+        if domain is not None and not isinstance(domain, str):
+            raise InvalidParams("param 'domain' must be a string")
+        if ROUTER.fans_out(params):
+            services = await ROUTER.per_instance(
+                lambda i: i.services.domain(domain) if domain else i.services.get_encoded())
+            return mcp_response(raw_object(services), req_id)
+        instance = ROUTER.get(params)
+        result = await instance.services.domain(domain) if domain else await instance.services.get_encoded()
+        return mcp_result(result, req_id)
+    elif method == "instances":
+        return mcp_response([{"instance": slug, "name": i.name, "url": i.url, "role": i.role, "pid": os.getpid()}
+                             for slug, i in INSTANCES.items()], req_id)
+    elif method == "cache_stats":
+        return mcp_response(ROUTER.stats(params, lambda i: i.state_cache.stats() if i.state_cache else None), req_id)
+    elif method == "coalescer_stats":
+        return mcp_response(ROUTER.stats(params, lambda i: i.coalescer.stats()), req_id)
+    elif method == "subscriptions_stats":
+        return mcp_response(ROUTER.stats(params, _subscriptions_stats), req_id)
+    elif method in ("subscribe", "unsubscribe"):
+        # Only the stdio transport can push notifications; it handles these before dispatch.
+        return mcp_error(f"{method} needs a streaming transport: use GET /subscribe (SSE) or --stdio", req_id)
+    elif method == "services_stats":
+        return mcp_response(ROUTER.stats(params, lambda i: i.services.stats()), req_id)
+    elif method == "upstream_stats":
+        return mcp_response(ROUTER.stats(params, lambda i: i.upstream.stats()), req_id)
     else:
-        return JSONResponse(mcp_error("Unknown method", req_id))
+        return mcp_error("Unknown method", req_id)
+
+async def handle_batch(batch):
+    """Run a JSON-RPC batch concurrently (at most BATCH_CONCURRENCY at once); responses keep request order.
+    A failing entry yields an error response for that entry only."""
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_entry(entry):
+        if not isinstance(entry, dict):
+            return mcp_error("Invalid Request")
+        async with sem:
+            try:
+                return await handle_request(entry)
+            except Exception as e:
+                logging.error(f"Batch entry {entry.get('method')} failed: {e}")
+                return mcp_error(f"Internal error: {e}", entry.get("id"))
+
+    return await asyncio.gather(*(run_entry(entry) for entry in batch))
+
+async def handle_payload(payload):
+    """Dispatch a single JSON-RPC request object or a batch array."""
+    if isinstance(payload, list):
+        return await handle_batch(payload) if payload else mcp_error("Invalid Request: empty batch")
+    if not isinstance(payload, dict):
+        return mcp_error("Invalid Request")
+    return await handle_request(payload)
+
+def payload_label(payload) -> str:
+    """Method label for transport-level metrics: the method name, or `batch`."""
+    if isinstance(payload, list):
+        return "batch"
+    method = payload.get("method") if isinstance(payload, dict) else None
+    return method if method in METHODS else "unknown"
+
+# --- FastAPI HTTP MCP endpoint ---
+@app.post("/mcp")
+async def mcp_http(request: Request):
+    MCP_IN_FLIGHT.inc(transport="http")
+    try:
+        try:
+            payload = await request.json()
+        except ValueError as e:
+            return JSONResponse(mcp_error(f"Parse error: {e}"))
+        if (instance := _streams_upstream(payload)) is not None:
+            return await stream_upstream(instance, "/api/states", payload.get("id"))
+        body = encode_response(await handle_payload(payload))
+        MCP_RESPONSE_BYTES.observe(len(body), method=payload_label(payload))
+        return encoded_response(body, request.headers.get("accept-encoding", ""))
+    finally:
+        MCP_IN_FLIGHT.dec(transport="http")
+
+def _streams_upstream(payload) -> Optional[HAInstance]:
+    """Unfiltered single-instance `search` with the state cache off: the instance whose bytes
+    can be streamed straight through."""
+    if not (isinstance(payload, dict) and payload.get("method") == "search"):
+        return None
+    params = payload.get("params") or {}
+    if not isinstance(params, dict) or is_filtered(params) or ROUTER.fans_out(params):
+        return None
+    try:
+        instance = ROUTER.get(params)
+    except ValueError:
+        return None  # reported by the regular dispatch
+    return instance if instance.state_cache is None else None
+
+def _component_metrics():
+    lines = labeled_stats_gauges("ha_coalescer", "instance", {s: i.coalescer.stats() for s, i in INSTANCES.items()})
+    lines += labeled_stats_gauges("ha_services", "instance", {s: i.services.stats() for s, i in INSTANCES.items()})
+    lines += labeled_stats_gauges("ha_fanout", "instance", {s: i.fanout.stats() for s, i in INSTANCES.items()})
+    lines += labeled_stats_gauges("ha_upstream", "instance", {s: i.upstream.stats() for s, i in INSTANCES.items()})
+    lines += labeled_stats_gauges("ha_state_cache", "instance",
+                                  {s: i.state_cache.stats() for s, i in INSTANCES.items() if i.state_cache is not None})
+    return lines
+
+REGISTRY.add_collector(_component_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/subscribe")
+async def subscribe_sse(request: Request, entity_id: Optional[str] = None, domain: Optional[str] = None,
+                        max_pending: Optional[str] = None, instance: Optional[str] = None):
+    """
+    Server-sent events of state diffs for the given entity_ids/globs and domains (comma-separated;
+    everything if neither) on one instance (default: the first). Each `state_changed` event
+    carries every diff pending for this client.
+    """
+    return sse_subscription(ROUTER, entity_id, domain, max_pending, instance)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    def stats(instance):
+        return instance.state_cache.stats() if instance.state_cache else {"enabled": False}
+    if len(INSTANCES) == 1:
+        return JSONResponse(stats(DEFAULT_INSTANCE))
+    return JSONResponse({slug: stats(i) for slug, i in INSTANCES.items()})
 
 
 # --- Stdio MCP mode ---
 async def mcp_stdio():
-    logging.info("MCP stdio mode started. Send JSON-RPC requests via stdin.")
-    loop = asyncio.get_event_loop()
-    while True:
-        line = await loop.run_in_executor(None, sys.stdin.readline)
-        if not line:
-            break
-        try:
-            payload = json.loads(line)
-            method = payload.get("method")
-            params = payload.get("params", {})
-            req_id = payload.get("id")
-            if method == "search":
-                result = await ha_rest_call("/api/states")
-                response = mcp_response(result, req_id)
-            elif method == "call_service":
-                domain = params.get("domain")
-                service = params.get("service")
-                service_data = params.get("service_data", {})
-                if not (domain and service):
-                    response = mcp_error("Missing domain/service", req_id)
-                else:
-                    result = await ha_rest_call(f"/api/services/{domain}/{service}", method="POST", data=service_data)
-                    response = mcp_response(result, req_id)
-            elif method == "list_services":
-                result = await ha_rest_call("/api/services")
-                response = mcp_response(result, req_id)
-            else:
-                response = mcp_error("Unknown method", req_id)
-            print(json.dumps(response), flush=True)
-        except Exception as e:
-            print(json.dumps(mcp_error(f"Parse error: {e}")), flush=True)
+    await election.start()
+    try:
+        await ha_stdio.serve(handle_payload, payload_label, StdioSubscriptions(ROUTER))
+    finally:
+        await election.stop()
 
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--stdio", action="store_true", help="Run in stdio mode (for MCP clients)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="HTTP worker processes (MCP_WORKERS)")
     args = parser.parse_args()
     if args.stdio:
         asyncio.run(mcp_stdio())
     else:
         import uvicorn
-        uvicorn.run("ha_mcp_proxy:app", host="0.0.0.0", port=PORT, reload=False)
+        # Workers are separate processes that re-import this module; they read these from the env.
+        os.environ["MCP_WORKERS"] = str(args.workers)
+        os.environ["MCP_SHARED_DIR"] = SHARED_DIR
+        uvicorn.run("ha_mcp_proxy:app", host="0.0.0.0", port=PORT, reload=False, workers=args.workers)
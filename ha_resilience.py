@@ -0,0 +1,181 @@
+"""
+Upstream resilience for calls to Home Assistant: per-route timeouts, jittered retries for GETs,
+a circuit breaker that fails fast while HA is down, and optional hedging of /api/states.
+"""
+import asyncio
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Optional
+import httpx
+
+# Gateway errors while HA restarts behind a reverse proxy; worth another try for a GET.
+RETRYABLE_STATUS = {502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """The call failed without an HTTP response (connect error, timeout, or the breaker is open)."""
+
+
+class CircuitOpenError(UpstreamError):
+    """Rejected without calling HA because the breaker is open."""
+
+
+@dataclass
+class RoutePolicy:
+    timeout: float
+    retries: int = 0
+    hedge_after: float = 0.0  # seconds; 0 disables hedging
+
+
+# Per-route timeouts (seconds) and retries; see route_policy.
+STATES_TIMEOUT = float(os.getenv("HA_STATES_TIMEOUT", "10"))
+GET_TIMEOUT = float(os.getenv("HA_GET_TIMEOUT", "5"))
+SERVICE_TIMEOUT = float(os.getenv("HA_SERVICE_TIMEOUT", "10"))
+RETRIES = int(os.getenv("HA_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("HA_RETRY_BACKOFF_MS", "100")) / 1000
+# Send a second /api/states request when the first has not answered after this long (0: never).
+HEDGE_STATES_AFTER = float(os.getenv("HA_HEDGE_STATES_MS", "0")) / 1000
+
+
+def route_policy(method: str, path: str) -> RoutePolicy:
+    """Timeouts and retries per route; only idempotent GETs are retried or hedged."""
+    if method == "GET" and path == "/api/states":
+        return RoutePolicy(STATES_TIMEOUT, RETRIES, HEDGE_STATES_AFTER)
+    if method == "GET":
+        return RoutePolicy(GET_TIMEOUT, RETRIES)
+    return RoutePolicy(SERVICE_TIMEOUT)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for `reset_timeout`
+    seconds. Then it is half-open: one probe call is let through per `reset_timeout`; a success
+    closes the breaker, a failure opens it again.
+    """
+
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._open = False
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._probe_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if not self._open:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < self.reset_timeout else "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        if state == "half_open" and (self._probe_at is None or now - self._probe_at >= self.reset_timeout):
+            self._probe_at = now
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self._open = False
+        self.failures = 0
+        self._probe_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._open or self.failures >= self.failure_threshold:
+            if not self._open:
+                self.opens += 1
+            self._open = True
+            self.opened_at = time.monotonic()
+            self._probe_at = None
+
+    def stats(self) -> dict:
+        state = self.state
+        return {"state": state, "state_code": self.STATES[state], "consecutive_failures": self.failures,
+                "opens": self.opens, "rejected": self.rejected}
+
+
+class ResilientUpstream:
+    """Sends requests for one HA instance through its breaker with the route's timeout, retries and hedging."""
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None, backoff: float = RETRY_BACKOFF, max_backoff: float = 2.0):
+        self.breaker = breaker or CircuitBreaker()
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.stale_served = 0
+
+    async def request(self, client: httpx.AsyncClient, method: str, path: str, data=None,
+                      timeout: Optional[float] = None) -> httpx.Response:
+        """The response (possibly a 4xx/5xx), or UpstreamError when no usable response came back."""
+        policy = route_policy(method, path)
+        timeout = policy.timeout if timeout is None else timeout
+        attempts = policy.retries + 1
+        error: Optional[UpstreamError] = None
+        for attempt in range(attempts):
+            if attempt:
+                # Full jitter, so clients retrying after the same outage don't arrive together.
+                self.retries += 1
+                await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1))))
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"circuit open: HA unavailable, retrying in at most {self.breaker.reset_timeout:g}s")
+            try:
+                if policy.hedge_after:
+                    resp = await self._hedged(client, method, path, data, timeout, policy.hedge_after)
+                else:
+                    resp = await self._send(client, method, path, data, timeout)
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                error = UpstreamError(f"{type(e).__name__}: {e}" if str(e) else type(e).__name__)
+                continue
+            # Only gateway errors mean HA itself is unreachable; a 500 is one handler failing (e.g. a
+            # flaky device's service call) and must not open the breaker for the whole instance.
+            if resp.status_code in RETRYABLE_STATUS:
+                self.breaker.record_failure()
+                if attempt < attempts - 1:
+                    continue
+            else:
+                self.breaker.record_success()
+            return resp
+        raise error
+
+    async def _send(self, client, method, path, data, timeout) -> httpx.Response:
+        return await client.request(method, path, json=data, timeout=timeout)
+
+    async def _hedged(self, client, method, path, data, timeout, delay) -> httpx.Response:
+        """Send a second copy if the first hasn't answered within `delay`; the first good response wins."""
+        first = asyncio.ensure_future(self._send(client, method, path, data, timeout))
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+            self.hedges += 1
+            second = asyncio.ensure_future(self._send(client, method, path, data, timeout))
+            pending.add(second)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code < 500:
+                        self.hedge_wins += task is second
+                        return task.result()
+            return task.result()  # both failed: the last one's response or exception
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return dict({f"breaker_{k}": v for k, v in self.breaker.stats().items()},
+                    retries=self.retries, hedges=self.hedges, hedge_wins=self.hedge_wins,
+                    stale_served=self.stale_served)
@@ -0,0 +1,139 @@
+"""
+Routing of proxy requests across the configured Home Assistant instances: the `instance` param,
+`<instance>:<entity_id>` prefixes, and fan-out of search and stats when several are configured.
+"""
+import asyncio
+from ha_instance import HAInstance
+from ha_json import raw_object
+from ha_rpc import InvalidParams
+from ha_search import is_filtered, validate
+
+
+class InstanceRouter:
+    def __init__(self, instances: dict[str, HAInstance]):
+        self.instances = instances
+        # Requests without an `instance` param or entity prefix go to the first instance.
+        self.default = next(iter(instances.values()))
+
+    def get(self, params) -> HAInstance:
+        """The instance named by the `instance` param (name or slug), else the default one."""
+        name = params.get("instance")
+        if name is None:
+            return self.default
+        if not isinstance(name, str):
+            raise InvalidParams("param 'instance' must be a string")
+        instance = self.instances.get(name) or next((i for i in self.instances.values() if i.name == name), None)
+        if instance is None:
+            raise ValueError(f"Unknown instance '{name}'; choose from {', '.join(self.instances)}")
+        return instance
+
+    def split_entity(self, entity_id: str, default: HAInstance) -> tuple[HAInstance, str]:
+        """`<instance>:<entity_id>` routes one entity to that instance; unprefixed ids go to `default`."""
+        if not isinstance(entity_id, str):
+            raise InvalidParams("service_data 'entity_id' must be a string or a list of strings")
+        prefix, sep, rest = entity_id.partition(":")
+        if not sep:
+            return default, entity_id
+        if prefix not in self.instances:
+            raise ValueError(f"Unknown instance '{prefix}' in entity_id '{entity_id}'")
+        return self.instances[prefix], rest
+
+    def fans_out(self, params) -> bool:
+        return len(self.instances) > 1 and params.get("instance") is None
+
+    async def per_instance(self, fn) -> dict:
+        """{slug: await fn(instance)} for every instance, run concurrently."""
+        results = await asyncio.gather(*(fn(i) for i in self.instances.values()))
+        return dict(zip(self.instances, results))
+
+    def stats(self, params, fn):
+        """One instance's stats, or {slug: stats} for all of them."""
+        if self.fans_out(params):
+            return {slug: fn(i) for slug, i in self.instances.items()}
+        return fn(self.get(params))
+
+    def unsubscribe(self, sub_id) -> bool:
+        # Subscription ids are unique across instances.
+        return any(i.fanout.unsubscribe(sub_id) for i in self.instances.values())
+
+    async def search(self, params):
+        """`search` on one instance, or on every instance at once when several are configured
+        and no `instance` param is given (see search_all)."""
+        if not self.fans_out(params):
+            return await self.get(params).search(params)
+        if not is_filtered(params):
+            # Full state lists keyed by instance, each spliced in pre-encoded.
+            return raw_object(await self.per_instance(lambda i: i.search(params)))
+        return await self.search_all(params)
+
+    async def search_all(self, params):
+        """
+        Filtered search across instances, ordered by (instance, entity_id). Each entity carries an
+        `instance` field and `next_cursor` is `<instance>:<entity_id>`. Instances that fail are
+        reported under `errors` instead of failing the whole search.
+        """
+        validate(params)
+        cursor = params.get("cursor")
+        slugs = list(self.instances)
+        start, cursors = 0, {}
+        if cursor is not None:
+            slug, sep, entity_id = cursor.partition(":")
+            if not sep or slug not in self.instances:
+                raise ValueError("search param 'cursor' must be '<instance>:<entity_id>' across instances")
+            start, cursors[slug] = slugs.index(slug), entity_id
+        queried = slugs[start:]
+        pages = await asyncio.gather(*(self.instances[s].search(dict(params, cursor=cursors.get(s)))
+                                       for s in queried))
+        limit = params.get("limit")
+        entities, errors, matched, last = [], {}, 0, None
+        for slug, page in zip(queried, pages):
+            if "entities" not in page:
+                errors[slug] = page.get("error", page)
+                continue
+            matched += page["count"] + page["remaining"]
+            for entity in page["entities"]:
+                if limit is not None and len(entities) >= limit:
+                    break
+                entities.append(dict(entity, instance=slug))
+                last = f"{slug}:{entity['entity_id']}"
+        result = {"entities": entities, "count": len(entities), "remaining": matched - len(entities),
+                  "next_cursor": last if matched > len(entities) else None}
+        if errors:
+            result["errors"] = errors
+        return result
+
+    async def call_service(self, domain, service, params):
+        """
+        Group the target entities by instance (`instance` param or `<instance>:` prefixes) and call
+        each instance concurrently. With one instance the result is HA's; otherwise {slug: result}.
+        """
+        default = self.get(params)
+        service_data = params.get("service_data", {})
+        if not isinstance(service_data, dict):
+            raise InvalidParams("param 'service_data' must be an object")
+        targets = service_data.get("entity_id")
+        ids = [targets] if isinstance(targets, str) else targets or []
+        if not isinstance(ids, list):
+            raise InvalidParams("service_data 'entity_id' must be a string or a list of strings")
+        groups: dict[str, list[str]] = {}
+        for entity_id in ids:
+            instance, entity_id = self.split_entity(entity_id, default)
+            groups.setdefault(instance.slug, []).append(entity_id)
+        if not groups:
+            groups[default.slug] = []
+        # Unknown services are rejected before any instance is called.
+        for error in await asyncio.gather(*(self.instances[slug].services.validate(domain, service)
+                                            for slug in groups)):
+            if error:
+                raise ValueError(error)
+
+        async def call(slug, entity_ids):
+            data = dict(service_data)
+            if entity_ids:
+                data["entity_id"] = entity_ids[0] if isinstance(targets, str) else entity_ids
+            return await self.instances[slug].coalescer.call(domain, service, data)
+
+        results = await asyncio.gather(*(call(slug, entity_ids) for slug, entity_ids in groups.items()))
+        if len(groups) == 1:
+            return results[0]
+        return dict(zip(groups, results))
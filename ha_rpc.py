@@ -0,0 +1,32 @@
+"""JSON-RPC 2.0 envelopes and parameter errors shared by ha_mcp_proxy's transports."""
+
+# JSON-RPC 2.0 error code for malformed method parameters.
+INVALID_PARAMS = -32602
+
+
+class InvalidParams(ValueError):
+    """A request's params have the wrong shape or types."""
+
+
+def check_params(params) -> dict:
+    if params is None:
+        return {}
+    if not isinstance(params, dict):
+        raise InvalidParams("'params' must be an object")
+    return params
+
+
+def mcp_response(result, id=None):
+    return {"jsonrpc": "2.0", "result": result, "id": id}
+
+
+def mcp_error(message, id=None, code=None):
+    error = {"message": message} if code is None else {"code": code, "message": message}
+    return {"jsonrpc": "2.0", "error": error, "id": id}
+
+
+def mcp_result(result, id=None):
+    """A response for an upstream result; HA failures ({"error": ...}) become JSON-RPC errors."""
+    if isinstance(result, dict) and "error" in result:
+        return mcp_error(f"Home Assistant request failed: {result['error']}", id)
+    return mcp_response(result, id)
@@ -0,0 +1,79 @@
+"""Server-side filtering, projection and pagination for the `search` JSON-RPC method."""
+import heapq
+from fnmatch import fnmatchcase
+from typing import Optional
+from ha_state_cache import StateIndex
+
+SEARCH_PARAMS = {"domain", "entity_id", "state", "attributes", "cursor", "limit"}
+_GLOB_CHARS = set("*?[")
+
+
+def is_filtered(params: dict) -> bool:
+    """A `search` without any of SEARCH_PARAMS keeps the legacy full-list response."""
+    return bool(params) and any(key in params for key in SEARCH_PARAMS)
+
+
+def _glob_domain(pattern: str) -> Optional[str]:
+    """The literal domain of an entity_id glob such as `light.kitchen_*`, if it has one."""
+    domain, sep, _ = pattern.partition(".")
+    if sep and not _GLOB_CHARS & set(domain):
+        return domain
+    return None
+
+
+def _project(state: dict, attributes: Optional[list]) -> dict:
+    if attributes is None:
+        return state
+    attrs = state.get("attributes", {})
+    projected = {"entity_id": state["entity_id"], "state": state.get("state")}
+    if attributes:
+        projected["attributes"] = {key: attrs[key] for key in attributes if key in attrs}
+    return projected
+
+
+def validate(params: dict):
+    """Raise ValueError for malformed search params."""
+    for key in ("domain", "entity_id", "state", "cursor"):
+        if key in params and params[key] is not None and not isinstance(params[key], str):
+            raise ValueError(f"search param '{key}' must be a string")
+    attributes = params.get("attributes")
+    if attributes is not None and not (isinstance(attributes, list) and all(isinstance(a, str) for a in attributes)):
+        raise ValueError("search param 'attributes' must be a list of attribute names")
+    limit = params.get("limit")
+    if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 1):
+        raise ValueError("search param 'limit' must be a positive integer")
+
+
+def query(index: StateIndex, params: dict) -> dict:
+    """
+    Filter `index` by domain, entity_id glob and state; project attributes; paginate.
+    Results are ordered by entity_id and `next_cursor` is the last entity_id returned
+    (pass it back as `cursor` for the next page).
+    """
+    validate(params)
+    pattern = params.get("entity_id")
+    domain = params.get("domain") or (_glob_domain(pattern) if pattern else None)
+    state = params.get("state")
+    if params.get("domain") and pattern and _glob_domain(pattern) not in (None, params["domain"]):
+        candidates = {}
+    elif domain and state is not None:
+        candidates = index.domain_state(domain, state)
+    else:
+        candidates = index.domain(domain) if domain else index.states
+    cursor = params.get("cursor")
+    matches = [
+        entity_id for entity_id, s in candidates.items()
+        if (cursor is None or entity_id > cursor)
+        and (state is None or s.get("state") == state)
+        and (pattern is None or fnmatchcase(entity_id, pattern))
+    ]
+    limit = params.get("limit")
+    page = heapq.nsmallest(limit, matches) if limit and limit < len(matches) else sorted(matches)
+    more = len(page) < len(matches)
+    attributes = params.get("attributes")
+    return {
+        "entities": [_project(candidates[entity_id], attributes) for entity_id in page],
+        "count": len(page),
+        "remaining": len(matches) - len(page),
+        "next_cursor": page[-1] if more else None,
+    }
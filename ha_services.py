@@ -0,0 +1,120 @@
+"""Cached Home Assistant service registry, indexed by domain."""
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+from ha_json import RawJSON, dumps
+
+
+class ServiceRegistry:
+    """
+    Holds the /api/services payload until it is invalidated by a
+    `service_registered`/`service_removed` event or `ttl` seconds pass.
+    An unknown service triggers one refetch per `refetch_interval` before it is rejected,
+    since events can be missed (e.g. while the websocket is down).
+    """
+
+    EVENT_TYPES = ("service_registered", "service_removed")
+
+    def __init__(self, fetch_services: Callable[[], Awaitable], ttl: float = 300.0, refetch_interval: float = 10.0):
+        self.fetch_services = fetch_services
+        self.ttl = ttl
+        self.refetch_interval = refetch_interval
+        self.services: Optional[list[dict]] = None
+        self.encoded: Optional[RawJSON] = None
+        self.by_domain: dict[str, dict] = {}
+        self.fetches = 0
+        self.hits = 0
+        self.rejected = 0
+        self.refetches = 0
+        self._refetched_at = float("-inf")
+        # Bumped on every invalidation; published to follower workers (see ha_shared).
+        self.generation = 0
+        self._loaded_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _fresh(self) -> bool:
+        return self.services is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def load(self, services: list[dict], encoded: Optional[RawJSON] = None):
+        self.services = services
+        self.encoded = encoded or RawJSON(dumps(services))
+        self.by_domain = {entry["domain"]: entry.get("services", {}) for entry in services}
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self, *_):
+        self.services = None
+        self.generation += 1
+
+    async def get(self):
+        """The full registry, or the upstream error dict if it could not be fetched."""
+        if self._fresh():
+            self.hits += 1
+            return self.services
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._fetch())
+        return await asyncio.shield(self._refresh_task)
+
+    async def _fetch(self):
+        # `fetch_services` may return the upstream bytes as RawJSON; they are kept for pass-through.
+        result = await self.fetch_services()
+        self.fetches += 1
+        if isinstance(result, RawJSON):
+            raw, result = result, result.decode()
+            if isinstance(result, list):
+                self.load(result, raw)
+        elif isinstance(result, list):
+            self.load(result)
+        return result
+
+    async def get_encoded(self):
+        """The full registry pre-encoded for pass-through, or the upstream error dict."""
+        result = await self.get()
+        return self.encoded if isinstance(result, list) else result
+
+    async def domain(self, domain: str):
+        """The registry slice for one domain, in /api/services shape (empty if unknown)."""
+        result = await self.get()
+        if not isinstance(result, list):
+            return result
+        services = self.by_domain.get(domain)
+        return [{"domain": domain, "services": services}] if services is not None else []
+
+    def _unknown(self, domain: str, service: str) -> Optional[str]:
+        if domain not in self.by_domain:
+            return f"Unknown service domain: {domain}"
+        if service not in self.by_domain[domain]:
+            return f"Unknown service: {domain}.{service}"
+        return None
+
+    async def validate(self, domain: str, service: str) -> Optional[str]:
+        """An error message for an unknown domain/service, else None.
+        Calls are let through when the registry itself can't be loaded."""
+        if not isinstance(await self.get(), list):
+            return None
+        error = self._unknown(domain, service)
+        if error is None:
+            return None
+        if time.monotonic() - self._refetched_at >= self.refetch_interval:
+            # The copy may be stale; ask HA once more before rejecting.
+            self._refetched_at = time.monotonic()
+            self.refetches += 1
+            self.services = None
+        if self.services is None or (self._refresh_task is not None and not self._refresh_task.done()):
+            if not isinstance(await self.get(), list):
+                return None
+            error = self._unknown(domain, service)
+        if error is not None:
+            self.rejected += 1
+        return error
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.services is not None,
+            "domains": len(self.by_domain),
+            "ttl_seconds": self.ttl,
+            "fetches": self.fetches,
+            "hits": self.hits,
+            "rejected_calls": self.rejected,
+            "refetches": self.refetches,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 3) if self.services is not None else None,
+        }
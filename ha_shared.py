@@ -0,0 +1,195 @@
+"""
+State snapshots shared between ha_mcp_proxy worker processes.
+
+One worker, the leader, holds an flock on `leader.lock` and runs every instance's event stream
+and state cache. It publishes each cache version as an encoded snapshot file, replaced
+atomically, and bumps a sequence number in a small mmap'd header. The other workers (followers)
+check the header on each lookup and reload the snapshot only when the sequence has moved, so
+they make no websocket connections and no /api/states calls of their own.
+"""
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Awaitable, Callable, Optional
+from ha_json import RawJSON
+from ha_state_cache import StateCache, StateIndex
+
+# seq, time of the leader's last heartbeat (wall clock), the leader's staleness then, connects,
+# and the generation of the leader's service registry (bumped on service_registered/removed)
+_HEADER = struct.Struct("<QddQQ")
+
+
+class LeaderLock:
+    """A non-blocking exclusive flock; the OS releases it when the holder exits."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        if self.fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+class Snapshot:
+    """`<name>.states.json` plus its mmap'd `<name>.header` in `directory`."""
+
+    def __init__(self, directory: str, name: str):
+        self.path = os.path.join(directory, f"{name}.states.json")
+        header_path = os.path.join(directory, f"{name}.header")
+        fd = os.open(header_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < _HEADER.size:
+                os.ftruncate(fd, _HEADER.size)
+            self.header = mmap.mmap(fd, _HEADER.size)
+        finally:
+            os.close(fd)
+
+    def read_header(self) -> tuple[int, float, float, int, int]:
+        return _HEADER.unpack_from(self.header)
+
+    def write_header(self, seq: int, staleness: float, connects: int, registry: int = 0):
+        _HEADER.pack_into(self.header, 0, seq, time.time(), staleness, connects, registry)
+
+    def publish(self, data: bytes, staleness: float, connects: int, registry: int = 0) -> int:
+        """Replace the snapshot file, then bump the sequence so followers reload it."""
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+        seq = self.read_header()[0] + 1
+        self.write_header(seq, staleness, connects, registry)
+        return seq
+
+    def load(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        self.header.close()
+
+
+class SnapshotPublisher:
+    """Leader side: publish the cache's encoding when its version changes, heartbeat otherwise."""
+
+    def __init__(self, snapshot: Snapshot):
+        self.snapshot = snapshot
+        self.published_version = -1
+        self.publishes = 0
+
+    def tick(self, cache: StateCache, connects: int, registry: int = 0):
+        if not cache.ready:
+            return
+        if cache.version != self.published_version:
+            self.snapshot.publish(cache.encoded(), cache.staleness(), connects, registry)
+            self.published_version = cache.version
+            self.publishes += 1
+        else:
+            seq = self.snapshot.read_header()[0]
+            self.snapshot.write_header(seq, cache.staleness(), connects, registry)
+
+
+class SharedStateCache(StateCache):
+    """
+    Follower side: a StateCache whose contents come from the leader's snapshot. The encoded
+    bytes are served as published; the index is only decoded when a filtered search needs it.
+    When the snapshot is older than `max_staleness` (e.g. the leader is gone) lookups miss and
+    `refresh` falls back to fetching upstream like a standalone cache.
+    """
+
+    def __init__(self, snapshot: Snapshot, fetch_states: Callable[[], Awaitable], max_staleness: float = 30.0):
+        self.snapshot = snapshot
+        self.seq: Optional[int] = None
+        self.loads = 0
+        self.leader_connects = 0
+        self.leader_registry = 0
+        self._raw: Optional[bytes] = None
+        self._shared_at = 0.0
+        self._shared_staleness = float("inf")
+        super().__init__(fetch_states, max_staleness)
+
+    @property
+    def index(self) -> StateIndex:
+        if self._raw is not None:
+            self._index = StateIndex(RawJSON(self._raw).decode())
+            self._raw = None
+        return self._index
+
+    @index.setter
+    def index(self, value: StateIndex):
+        self._index = value
+        self._raw = None
+
+    def sync(self) -> bool:
+        """Pick up a newer snapshot, if one was published; True when the contents changed."""
+        seq, at, staleness, connects, registry = self.snapshot.read_header()
+        self._shared_at, self._shared_staleness = at, staleness
+        self.leader_connects, self.leader_registry = connects, registry
+        if seq == self.seq or not seq:
+            return False
+        try:
+            data = self.snapshot.load()
+        except OSError as e:
+            logging.error(f"Shared state snapshot unreadable: {e}")
+            return False
+        self.seq = seq
+        self.loads += 1
+        self.index = StateIndex()
+        self._raw = data
+        self._encoded = data
+        self.version += 1
+        self._encoded_version = self.version
+        self.ready = True
+        self.last_refresh = time.monotonic()
+        return True
+
+    def staleness(self) -> float:
+        if self.seq is None:
+            return super().staleness()
+        return self._shared_staleness + max(0.0, time.time() - self._shared_at)
+
+    def lookup(self) -> Optional[StateIndex]:
+        self.sync()
+        return super().lookup()
+
+    def lookup_encoded(self) -> Optional[bytes]:
+        self.sync()
+        return super().lookup_encoded()
+
+    def on_connect(self):
+        pass
+
+    def stats(self) -> dict:
+        return dict(super().stats(), role="follower", snapshot_seq=self.seq, snapshot_loads=self.loads)
+
+
+def snapshot_events(old: StateIndex, new: StateIndex) -> list[dict]:
+    """`state_changed` events that turn `old` into `new`, for followers' subscribers."""
+    events = []
+    for entity_id, state in new.states.items():
+        previous = old.get(entity_id)
+        if previous is None or previous.get("last_updated") != state.get("last_updated"):
+            events.append({"event_type": "state_changed",
+                           "data": {"entity_id": entity_id, "old_state": previous, "new_state": state}})
+    for entity_id, previous in old.states.items():
+        if entity_id not in new.states:
+            events.append({"event_type": "state_changed",
+                           "data": {"entity_id": entity_id, "old_state": previous, "new_state": None}})
+    return events
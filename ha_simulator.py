@@ -0,0 +1,267 @@
+"""
+Local Home Assistant stand-in for offline benchmarks and load tests.
+Serves a synthetic /api/states, /api/services, service calls and the
+websocket event API (`state_changed` events are emitted for service calls,
+and optionally for random sensor updates at `--event-rate` per second), plus
+an /mcp_server/sse endpoint that answers like HA's MCP server handshake.
+
+REST latency, jitter and injected failures (error responses or hung requests)
+are configurable. Upstream call counts and bytes per path are served at GET /_sim/stats,
+and POST /_sim/config changes the latency/failure settings of a running simulator.
+
+Usage:
+    python ha_simulator.py --entities 500 --latency-ms 2 --jitter-ms 1 --error-rate 0.01 --port 8123
+"""
+import asyncio
+import copy
+import random
+from collections import Counter
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from ha_fixtures import _now, make_services, make_states
+
+
+def path_label(path: str) -> str:
+    """Collapse per-entity and per-service paths for call counting."""
+    if path.startswith("/api/states/"):
+        return "/api/states/{entity_id}"
+    if path.startswith("/api/services/"):
+        return "/api/services/{domain}/{service}"
+    return path
+
+
+def create_app(entities: int = 200, latency_ms: float = 0.0, seed: int = 0, jitter_ms: float = 0.0,
+               error_rate: float = 0.0, error_status: int = 500, hang_rate: float = 0.0,
+               event_rate: float = 0.0) -> FastAPI:
+    """
+    `error_rate` of REST requests fail with `error_status`, `hang_rate` never answer (until the
+    client gives up), and the rest are delayed by `latency_ms` plus up to `jitter_ms`.
+    """
+    states = {s["entity_id"]: s for s in make_states(entities, seed)}
+    services = make_services()
+    rng = random.Random(seed)
+    config = {"latency_ms": latency_ms, "jitter_ms": jitter_ms, "error_rate": error_rate,
+              "error_status": error_status, "hang_rate": hang_rate, "event_rate": event_rate}
+    calls: Counter = Counter()
+    bytes_in: Counter = Counter()
+    bytes_out: Counter = Counter()
+    subscribers: dict[WebSocket, dict[str, int]] = {}
+
+    async def churn():
+        """Random sensor updates at config["event_rate"] per second."""
+        sensors = [e for e in states if e.startswith("sensor.")]
+        while True:
+            rate = config["event_rate"]
+            if not rate or not sensors:
+                await asyncio.sleep(0.1)
+                continue
+            await asyncio.sleep(1 / rate)
+            state = states[rng.choice(sensors)]
+            old = copy.deepcopy(state)
+            state["state"] = f"{rng.uniform(15, 30):.1f}"
+            state["last_changed"] = state["last_updated"] = _now()
+            await fire("state_changed", {"entity_id": state["entity_id"], "old_state": old, "new_state": copy.deepcopy(state)})
+
+    @asynccontextmanager
+    async def lifespan(app):
+        task = asyncio.create_task(churn())
+        yield
+        task.cancel()
+
+    app = FastAPI(lifespan=lifespan)
+
+    async def fire(event_type: str, data: dict):
+        event = {"event_type": event_type, "data": data, "origin": "LOCAL", "time_fired": _now()}
+        for ws, subs in list(subscribers.items()):
+            for sub_id in [i for t, i in subs.items() if t in (event_type, None)]:
+                try:
+                    await ws.send_json({"id": sub_id, "type": "event", "event": event})
+                except Exception:
+                    subscribers.pop(ws, None)
+
+    @app.middleware("http")
+    async def inject(request: Request, call_next):
+        if not request.url.path.startswith(("/api/", "/mcp_server/")):
+            return await call_next(request)
+        key = (request.method, path_label(request.url.path))
+        calls[key] += 1
+        bytes_in[key] += int(request.headers.get("content-length") or 0)
+        roll = rng.random()
+        if roll < config["hang_rate"]:
+            await asyncio.sleep(3600)
+        delay = config["latency_ms"] + rng.uniform(0, config["jitter_ms"])
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if roll < config["hang_rate"] + config["error_rate"]:
+            calls[("injected", f"HTTP {config['error_status']}")] += 1
+            return JSONResponse({"message": "Injected failure"}, status_code=config["error_status"])
+        response = await call_next(request)
+        bytes_out[key] += int(response.headers.get("content-length") or 0)  # streams are not counted
+        return response
+
+    @app.get("/_sim/stats")
+    async def sim_stats():
+        return {"config": config, "subscribers": len(subscribers),
+                "calls": [{"method": m, "path": p, "count": n, "bytes_in": bytes_in[(m, p)],
+                           "bytes_out": bytes_out[(m, p)]} for (m, p), n in sorted(calls.items())]}
+
+    @app.post("/_sim/config")
+    async def sim_config(request: Request):
+        """Update latency/failure settings; `{"reset_stats": true}` also clears the call counts."""
+        changes = await request.json()
+        if changes.pop("reset_stats", False):
+            calls.clear()
+            bytes_in.clear()
+            bytes_out.clear()
+        config.update({k: v for k, v in changes.items() if k in config})
+        return config
+
+    @app.get("/api/")
+    async def api_root():
+        return {"message": "API running."}
+
+    @app.get("/mcp_server/sse")
+    async def mcp_sse():
+        """The MCP SSE handshake: an `endpoint` event, then keep-alive comments."""
+        async def events():
+            yield f"event: endpoint\ndata: /mcp_server/messages/{rng.getrandbits(64):016x}\n\n"
+            while True:
+                await asyncio.sleep(15)
+                yield ": ping\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/api/states")
+    async def get_states():
+        return list(states.values())
+
+    @app.get("/api/states/{entity_id}")
+    async def get_state(entity_id: str):
+        if entity_id not in states:
+            raise HTTPException(status_code=404, detail="Entity not found.")
+        return states[entity_id]
+
+    @app.get("/api/services")
+    async def get_services():
+        return services
+
+    @app.post("/api/services/{domain}/{service}")
+    async def call_service(domain: str, service: str, request: Request):
+        data = await request.json() if await request.body() else {}
+        ids = data.get("entity_id", [])
+        ids = [ids] if isinstance(ids, str) else ids
+        changed = []
+        for entity_id in ids:
+            state = states.get(entity_id)
+            if state is None:
+                continue
+            old = copy.deepcopy(state)
+            if service in {"turn_on", "turn_off"}:
+                state["state"] = service[5:]
+            elif service == "set_value" and "value" in data:
+                state["state"] = str(data["value"])
+            state["last_changed"] = state["last_updated"] = _now()
+            changed.append(state)
+            await fire("state_changed", {"entity_id": entity_id, "old_state": old, "new_state": copy.deepcopy(state)})
+        return changed
+
+    @app.websocket("/api/websocket")
+    async def websocket(ws: WebSocket):
+        await ws.accept()
+        await ws.send_json({"type": "auth_required", "ha_version": "simulator"})
+        auth = await ws.receive_json()
+        if auth.get("type") != "auth" or not auth.get("access_token"):
+            await ws.send_json({"type": "auth_invalid", "message": "Invalid access token"})
+            await ws.close()
+            return
+        await ws.send_json({"type": "auth_ok", "ha_version": "simulator"})
+        subscribers[ws] = {}
+        try:
+            while True:
+                msg = await ws.receive_json()
+                if msg.get("type") == "subscribe_events":
+                    subscribers[ws][msg.get("event_type")] = msg["id"]
+                    await ws.send_json({"id": msg["id"], "type": "result", "success": True, "result": None})
+                elif msg.get("type") == "ping":
+                    await ws.send_json({"id": msg["id"], "type": "pong"})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            subscribers.pop(ws, None)
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_in_thread(app: FastAPI, port: int):
+    """Run `app` under uvicorn in a daemon thread; returns the uvicorn Server (set should_exit to stop)."""
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+class SimulatorProcess:
+    """Run the simulator in a child process, so benchmarks don't share a GIL with it.
+    `options` are create_app() keyword arguments (jitter_ms, error_rate, ...)."""
+
+    def __init__(self, entities: int = 200, latency_ms: float = 0.0, port: int | None = None, **options):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        args = [f"--{k.replace('_', '-')}={v}" for k, v in options.items()]
+        self.proc = subprocess.Popen(
+            [sys.executable, __file__, "--entities", str(entities), "--latency-ms", str(latency_ms),
+             "--port", str(self.port), "--log-level", "warning", *args],
+        )
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=0.2).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        self.stop()
+        raise RuntimeError("HA simulator did not start")
+
+    def stop(self):
+        self.proc.terminate()
+        self.proc.wait(timeout=10)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entities", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of REST requests that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="fraction of REST requests that never answer")
+    parser.add_argument("--event-rate", type=float, default=0.0, help="random sensor state_changed events per second")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    app = create_app(args.entities, args.latency_ms, args.seed, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                     error_status=args.error_status, hang_rate=args.hang_rate, event_rate=args.event_rate)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level=args.log_level)
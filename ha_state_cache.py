@@ -0,0 +1,204 @@
+"""In-memory copy of Home Assistant entity states, kept current by `state_changed` events."""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Iterable, Optional
+from ha_json import dumps
+
+
+class StateIndex:
+    """Entity states keyed by entity_id, with secondary indexes by domain and by (domain, state)."""
+
+    def __init__(self, states: Iterable[dict] = ()):
+        self.states: dict[str, dict] = {}
+        self.by_domain: dict[str, dict[str, dict]] = {}
+        self.by_domain_state: dict[tuple[str, str], dict[str, dict]] = {}
+        for state in states:
+            self.put(state)
+
+    def __len__(self):
+        return len(self.states)
+
+    @staticmethod
+    def _discard(index: dict, key, entity_id: str):
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.pop(entity_id, None)
+            if not bucket:
+                del index[key]
+
+    def put(self, state: dict):
+        entity_id = state["entity_id"]
+        domain = entity_id.split(".", 1)[0]
+        previous = self.states.get(entity_id)
+        if previous is not None:
+            self._discard(self.by_domain_state, (domain, previous.get("state")), entity_id)
+        self.states[entity_id] = state
+        self.by_domain.setdefault(domain, {})[entity_id] = state
+        self.by_domain_state.setdefault((domain, state.get("state")), {})[entity_id] = state
+
+    def remove(self, entity_id: str):
+        previous = self.states.pop(entity_id, None)
+        if previous is None:
+            return
+        domain = entity_id.split(".", 1)[0]
+        self._discard(self.by_domain, domain, entity_id)
+        self._discard(self.by_domain_state, (domain, previous.get("state")), entity_id)
+
+    def get(self, entity_id: str) -> Optional[dict]:
+        return self.states.get(entity_id)
+
+    def domain(self, domain: str) -> dict[str, dict]:
+        return self.by_domain.get(domain, {})
+
+    def domain_state(self, domain: str, state: str) -> dict[str, dict]:
+        return self.by_domain_state.get((domain, state), {})
+
+    def all(self) -> list[dict]:
+        return list(self.states.values())
+
+
+class StateCache:
+    """
+    Seeded from /api/states, then updated from websocket `state_changed` events.
+    While the event stream is down the cache is served for at most `max_staleness`
+    seconds after the last full refresh; after that lookups miss and go upstream.
+    """
+
+    def __init__(self, fetch_states: Callable[[], Awaitable], max_staleness: float = 30.0):
+        self.fetch_states = fetch_states
+        self.max_staleness = max_staleness
+        self.index = StateIndex()
+        self.ready = False
+        self.live = False
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.events = 0
+        self.gaps = 0
+        self.last_refresh = 0.0
+        self.last_event = 0.0
+        self.offline_since = time.monotonic()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._pending: Optional[list[dict]] = None
+        self._encoded: Optional[bytes] = None
+        self._encoded_version = -1
+
+    # --- Freshness ---
+    def staleness(self) -> float:
+        """Seconds the cache may have been missing updates (0 while subscribed)."""
+        if self.live:
+            return 0.0
+        return time.monotonic() - max(self.offline_since, self.last_refresh)
+
+    def on_connect(self):
+        # Resync in the background so events keep flowing (and queue up) during the fetch.
+        self.live = True
+        asyncio.ensure_future(self.refresh())
+
+    def on_disconnect(self):
+        self.live = False
+        self.offline_since = time.monotonic()
+
+    # --- Full refresh ---
+    def seed(self, states: list[dict]):
+        self.index = StateIndex(states)
+        self.ready = True
+        self.version += 1
+        self.last_refresh = time.monotonic()
+
+    async def refresh(self):
+        """Reload every state from upstream; concurrent callers share one fetch. Returns the raw result."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh())
+        return await asyncio.shield(self._refresh_task)
+
+    async def _refresh(self):
+        # Events that arrive while the snapshot is in flight are replayed on top of it.
+        self._pending = []
+        try:
+            result = await self.fetch_states()
+            if isinstance(result, list):
+                self.seed(result)
+                self.refreshes += 1
+            else:
+                logging.error(f"State cache refresh failed: {result}")
+            pending, self._pending = self._pending, None
+            for event in pending:
+                self.apply_event(event)
+            return result
+        finally:
+            self._pending = None
+
+    # --- Incremental updates ---
+    def apply_event(self, event: dict):
+        """Apply one `state_changed` event; a mismatch with the cached old_state triggers a full refresh."""
+        if self._pending is not None:
+            self._pending.append(event)
+            return
+        data = event.get("data", {})
+        entity_id = data.get("entity_id")
+        if not entity_id:
+            return
+        self.events += 1
+        self.last_event = time.monotonic()
+        old, new = data.get("old_state"), data.get("new_state")
+        current = self.index.get(entity_id)
+        if current is not None and new is not None and current.get("last_updated", "") >= new.get("last_updated", ""):
+            return
+        if old is not None and (current is None or current.get("last_updated") != old.get("last_updated")):
+            self.gaps += 1
+            logging.warning(f"State cache gap detected at {entity_id}; scheduling full refresh")
+            asyncio.ensure_future(self.refresh())
+        if new is None:
+            self.index.remove(entity_id)
+        else:
+            self.index.put(new)
+        self.version += 1
+
+    # --- Reads ---
+    def fresh(self) -> bool:
+        return self.ready and self.staleness() <= self.max_staleness
+
+    def lookup(self) -> Optional[StateIndex]:
+        """The cached index, or None (a miss) when the cache is empty or too stale."""
+        if self.fresh():
+            self.hits += 1
+            return self.index
+        self.misses += 1
+        return None
+
+    def lookup_encoded(self) -> Optional[bytes]:
+        """Like lookup, but the full state list as JSON (see encoded)."""
+        if self.fresh():
+            self.hits += 1
+            return self.encoded()
+        self.misses += 1
+        return None
+
+    def encoded(self) -> bytes:
+        """The full state list as JSON, encoded at most once per cache version."""
+        if self._encoded_version != self.version:
+            self._encoded = dumps(self.index.all())
+            self._encoded_version = self.version
+        return self._encoded
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        lookups = self.hits + self.misses
+        return {
+            "entities": len(self.index),
+            "ready": self.ready,
+            "live": self.live,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "refreshes": self.refreshes,
+            "events": self.events,
+            "gaps": self.gaps,
+            "staleness_seconds": round(self.staleness(), 3),
+            "seconds_since_refresh": round(now - self.last_refresh, 3) if self.ready else None,
+            "seconds_since_event": round(now - self.last_event, 3) if self.last_event else None,
+        }
@@ -0,0 +1,87 @@
+"""
+The proxy's stdio transport: newline-delimited JSON-RPC on stdin/stdout, pipelined so that
+responses are written as they complete and clients correlate them by id.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+from ha_json import encode_response
+from ha_rpc import mcp_error
+from ha_subscriptions import StdioSubscriptions
+from proxy_metrics import MCP_IN_FLIGHT, MCP_REQUESTS, MCP_RESPONSE_BYTES, REGISTRY
+
+# Max stdio requests being processed at once; stdin is not read while the limit is reached.
+STDIO_MAX_INFLIGHT = int(os.getenv("MCP_STDIO_MAX_INFLIGHT", "16"))
+STDIO_LINE_LIMIT = 16 * 1024 * 1024
+
+
+def dump_metrics(*_):
+    """Write the /metrics exposition to stderr (stdout carries the protocol)."""
+    sys.stderr.write(REGISTRY.render())
+    sys.stderr.flush()
+
+
+async def _stdin_readline(loop):
+    """A readline coroutine on a native asyncio stream, falling back to a thread for non-pipe stdin."""
+    reader = asyncio.StreamReader(limit=STDIO_LINE_LIMIT)
+    try:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    except (ValueError, OSError):
+        # e.g. stdin redirected from a regular file, which pipe transports refuse
+        return lambda: loop.run_in_executor(None, sys.stdin.readline)
+    return reader.readline
+
+
+async def _handle(line, sem, handle_payload, payload_label, subscriptions: StdioSubscriptions):
+    label, payload = "unknown", None
+    MCP_IN_FLIGHT.inc(transport="stdio")
+    try:
+        payload = json.loads(line)
+        label = payload_label(payload)
+        if isinstance(payload, dict) and payload.get("method") in ("subscribe", "unsubscribe"):
+            response = subscriptions.handle(payload)
+            MCP_REQUESTS.inc(method=label, status="ok" if "error" not in response else "error")
+        else:
+            response = await handle_payload(payload)
+    except json.JSONDecodeError as e:
+        response = mcp_error(f"Parse error: {e}")
+    except Exception as e:
+        logging.error(f"stdio request failed: {e!r}")
+        response = mcp_error(f"Internal error: {e}", payload.get("id") if isinstance(payload, dict) else None)
+    finally:
+        sem.release()
+        MCP_IN_FLIGHT.dec(transport="stdio")
+    body = encode_response(response).decode()
+    MCP_RESPONSE_BYTES.observe(len(body), method=label)
+    print(body, flush=True)
+
+
+async def serve(handle_payload, payload_label, subscriptions: StdioSubscriptions):
+    """Answer requests from stdin until EOF; `handle_payload` dispatches everything but subscriptions."""
+    logging.info("MCP stdio mode started. Send JSON-RPC requests via stdin.")
+    loop = asyncio.get_event_loop()
+    if hasattr(signal, "SIGUSR1"):
+        loop.add_signal_handler(signal.SIGUSR1, dump_metrics)
+    readline = await _stdin_readline(loop)
+    sem = asyncio.Semaphore(STDIO_MAX_INFLIGHT)
+    in_flight = set()
+    while True:
+        await sem.acquire()
+        try:
+            line = await readline()
+        except ValueError as e:
+            sem.release()
+            print(json.dumps(mcp_error(f"Parse error: {e}")), flush=True)
+            continue
+        if not line:
+            sem.release()
+            break
+        task = asyncio.create_task(_handle(line, sem, handle_payload, payload_label, subscriptions))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    await subscriptions.close()
@@ -0,0 +1,62 @@
+"""HTTP response bodies for ha_mcp_proxy: brotli negotiation and upstream bodies streamed through undecoded."""
+import logging
+import os
+import httpx
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from ha_json import RawJSON, encode_response
+from ha_resilience import RETRYABLE_STATUS, route_policy
+from ha_rpc import mcp_error
+from proxy_metrics import MCP_REQUESTS, UPSTREAM_REQUESTS
+
+# Responses at least this large are compressed (brotli if installed and accepted, else gzip).
+COMPRESS_MIN_BYTES = int(os.getenv("MCP_COMPRESS_MIN_BYTES", "1024"))
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+
+def encoded_response(body: bytes, accept_encoding: str) -> Response:
+    """JSON response, brotli-compressed when negotiated; gzip is left to GZipMiddleware."""
+    if brotli is not None and "br" in accept_encoding and len(body) >= COMPRESS_MIN_BYTES:
+        return Response(brotli.compress(body, quality=4), media_type="application/json",
+                        headers={"Content-Encoding": "br", "Vary": "Accept-Encoding"})
+    return Response(body, media_type="application/json")
+
+
+async def stream_upstream(instance, path, req_id):
+    """Forward an upstream JSON body chunk by chunk inside a JSON-RPC envelope, never decoding it."""
+    client = instance.get_client()
+    breaker = instance.upstream.breaker
+    status = "error"
+    if not breaker.allow():
+        MCP_REQUESTS.inc(method="search", status=status)
+        UPSTREAM_REQUESTS.inc(instance=instance.slug, method="GET", path=path, status="circuit_open")
+        return JSONResponse(mcp_error("Home Assistant request failed: circuit open", req_id))
+    try:
+        request = client.build_request("GET", path, timeout=route_policy("GET", path).timeout)
+        resp = await client.send(request, stream=True)
+    except httpx.HTTPError as e:
+        breaker.record_failure()
+        logging.error(f"HA REST error: {e}")
+        MCP_REQUESTS.inc(method="search", status=status)
+        return JSONResponse(mcp_error(str(e), req_id))
+    (breaker.record_failure if resp.status_code in RETRYABLE_STATUS else breaker.record_success)()
+    UPSTREAM_REQUESTS.inc(instance=instance.slug, method="GET", path=path, status=str(resp.status_code))
+    if resp.status_code != 200:
+        await resp.aclose()
+        MCP_REQUESTS.inc(method="search", status=status)
+        return JSONResponse(mcp_error(f"HA returned {resp.status_code} for {path}", req_id))
+    MCP_REQUESTS.inc(method="search", status="ok")
+
+    async def body():
+        try:
+            yield encode_response({"jsonrpc": "2.0", "id": req_id, "result": RawJSON(b"")})[:-1]
+            async for chunk in resp.aiter_bytes():
+                yield chunk
+            yield b"}"
+        finally:
+            await resp.aclose()
+
+    return StreamingResponse(body(), media_type="application/json")
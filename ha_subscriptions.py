@@ -0,0 +1,84 @@
+"""
+State-change subscriptions over the proxy's streaming transports: server-sent events on HTTP,
+JSON-RPC notifications on stdio. Both drain one FanOut subscriber (see ha_fanout).
+"""
+import asyncio
+import json
+import os
+from fastapi.responses import JSONResponse, StreamingResponse
+from ha_json import encode_response
+from ha_routing import InstanceRouter
+from ha_rpc import INVALID_PARAMS, InvalidParams, check_params, mcp_error, mcp_response
+
+SSE_HEARTBEAT = float(os.getenv("MCP_SSE_HEARTBEAT", "15"))
+
+
+def sse_subscription(router: InstanceRouter, entity_id, domain, max_pending, instance):
+    """A text/event-stream response for one subscriber, or a 400 for bad query params."""
+    try:
+        ha = router.get({"instance": instance})
+        if max_pending is not None:
+            max_pending = int(max_pending) if max_pending.strip().lstrip("-").isdigit() else max_pending
+        sub = ha.fanout.subscribe(entity_id, domain, max_pending)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    async def events():
+        try:
+            yield f"event: subscribed\ndata: {json.dumps({'subscription': sub.id, 'instance': ha.slug})}\n\n"
+            while True:
+                try:
+                    batch = await asyncio.wait_for(sub.next_batch(), SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if batch is None:
+                    return
+                yield f"event: state_changed\ndata: {encode_response(batch).decode()}\n\n"
+        finally:
+            ha.fanout.unsubscribe(sub.id)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+def write_line(message):
+    print(encode_response(message).decode(), flush=True)
+
+
+class StdioSubscriptions:
+    """`subscribe` / `unsubscribe` over stdio, each subscription pumped to stdout by its own task."""
+
+    def __init__(self, router: InstanceRouter):
+        self.router = router
+        self.pumps: dict[int, asyncio.Task] = {}
+
+    async def _pump(self, sub):
+        """Write a subscription's batches as JSON-RPC notifications until it is closed."""
+        while (batch := await sub.next_batch()) is not None:
+            write_line({"jsonrpc": "2.0", "method": "notifications/state_changed", "params": batch})
+
+    def handle(self, payload):
+        req_id = payload.get("id")
+        try:
+            params = check_params(payload.get("params"))
+        except InvalidParams as e:
+            return mcp_error(f"Invalid params: {e}", req_id, INVALID_PARAMS)
+        if payload["method"] == "unsubscribe":
+            sub_id = params.get("subscription")
+            if type(sub_id) is not int:
+                return mcp_error("Invalid params: 'subscription' must be an integer", req_id, INVALID_PARAMS)
+            task = self.pumps.pop(sub_id, None)
+            return mcp_response({"unsubscribed": self.router.unsubscribe(sub_id) and task is not None}, req_id)
+        try:
+            instance = self.router.get(params)
+            sub = instance.fanout.subscribe(params.get("entity_id"), params.get("domain"), params.get("max_pending"))
+        except ValueError as e:
+            return mcp_error(str(e), req_id)
+        self.pumps[sub.id] = asyncio.create_task(self._pump(sub))
+        return mcp_response({"subscription": sub.id, "instance": instance.slug}, req_id)
+
+    async def close(self):
+        for sub_id in list(self.pumps):
+            self.router.unsubscribe(sub_id)
+        await asyncio.gather(*self.pumps.values(), return_exceptions=True)
+        self.pumps.clear()
@@ -0,0 +1,132 @@
+"""
+Deterministic fast path for simple Home Assistant commands.
+
+Utterances such as "turn off the outside lights" or "set kitchen input number 6 to 40"
+are resolved against an index of entity names built from the state snapshot and executed
+directly. Anything that isn't an unambiguous match returns None and goes to the LLM.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+from ha_state_cache import StateIndex
+
+# Spoken domain words -> HA domain. Only domains with turn_on/turn_off services are routed.
+DOMAIN_WORDS = {
+    "light": "light", "lights": "light", "lamp": "light", "lamps": "light",
+    "switch": "switch", "switches": "switch",
+    "fan": "fan", "fans": "fan",
+    "input boolean": "input_boolean", "input booleans": "input_boolean",
+}
+PLURAL_WORDS = {"lights", "lamps", "switches", "fans", "input booleans"}
+SWITCHABLE = set(DOMAIN_WORDS.values())
+FILLER = {"the", "my", "please", "a"}
+
+# Fixed phrases ("good night") only run a scene or script the user mapped them to; see parse_macros.
+MACRO_DOMAINS = {"scene", "script"}
+
+_TURN = [
+    re.compile(r"^(?:turn|switch|put) (?P<action>on|off) (?P<target>.+)$"),
+    re.compile(r"^(?:turn|switch|put) (?P<target>.+) (?P<action>on|off)$"),
+]
+_SET = re.compile(r"^set (?P<target>.+) to (?P<value>-?\d+(?:\.\d+)?)$")
+_IN_AREA = re.compile(r"^(?P<what>.+) in (?:the )?(?P<area>.+)$")
+
+
+def normalize(text: str) -> str:
+    text = re.sub(r"[^a-z0-9. ]+", " ", text.lower().replace("_", " "))
+    words = re.sub(r"(?<!\d)\.|\.(?!\d)", " ", text).split()
+    return " ".join(w for w in words if w not in FILLER)
+
+
+def parse_macros(spec: str) -> dict[str, str]:
+    """`phrase=entity_id` pairs separated by commas -> {normalized phrase: entity_id}.
+    Entries that don't target a scene or script are ignored."""
+    macros = {}
+    for entry in spec.split(","):
+        phrase, _, entity_id = entry.partition("=")
+        entity_id = entity_id.strip()
+        if normalize(phrase) and entity_id.split(".", 1)[0] in MACRO_DOMAINS:
+            macros[normalize(phrase)] = entity_id
+    return macros
+
+
+@dataclass
+class Intent:
+    domain: str
+    service: str
+    entity_ids: list[str]
+    data: dict = field(default_factory=dict)
+
+    def describe(self) -> str:
+        verb = {"scene": "Activated", "script": "Ran"}.get(self.domain) or \
+            {"turn_on": "Turned on", "turn_off": "Turned off"}.get(self.service)
+        if verb:
+            return f"{verb} {', '.join(self.entity_ids)}"
+        return f"Set {', '.join(self.entity_ids)} to {self.data.get('value')}"
+
+
+class IntentRouter:
+    """Name/token index over one StateIndex snapshot; `match()` is pure and O(words)."""
+
+    def __init__(self, index: StateIndex, macros: Optional[dict[str, str]] = None):
+        # Macros whose scene/script doesn't exist in this snapshot fall through to the model.
+        self.macros = {phrase: e for phrase, e in (macros or {}).items() if index.get(e) is not None}
+        self.names: dict[str, list[str]] = {}
+        self.tokens: dict[tuple[str, str], set[str]] = {}
+        self.domains = {d: sorted(index.domain(d)) for d in SWITCHABLE}
+        for entity_id, state in index.states.items():
+            domain, object_id = entity_id.split(".", 1)
+            friendly = state.get("attributes", {}).get("friendly_name") or ""
+            for name in {normalize(friendly), normalize(object_id), normalize(entity_id)}:
+                if name:
+                    self.names.setdefault(name, []).append(entity_id)
+            for token in set(normalize(f"{friendly} {object_id}").split()):
+                self.tokens.setdefault((domain, token), set()).add(entity_id)
+
+    def match(self, utterance: str) -> Optional[Intent]:
+        text = normalize(utterance)
+        if text in self.macros:
+            entity_id = self.macros[text]
+            return Intent(entity_id.split(".", 1)[0], "turn_on", [entity_id])
+        if m := _SET.match(text):
+            entity_ids = self._by_name(m["target"], {"input_number"})
+            if len(entity_ids) == 1:
+                return Intent("input_number", "set_value", entity_ids, {"value": float(m["value"])})
+            return None
+        for pattern in _TURN:
+            if m := pattern.match(text):
+                entity_ids, domain = self._resolve(m["target"])
+                if entity_ids:
+                    return Intent(domain, f"turn_{m['action']}", entity_ids)
+                return None
+        return None
+
+    def _by_name(self, target: str, domains: set[str]) -> list[str]:
+        return [e for e in self.names.get(target, []) if e.split(".", 1)[0] in domains]
+
+    def _resolve(self, target: str) -> tuple[list[str], Optional[str]]:
+        """Entities for a target phrase: an exact entity name, or `[all] <qualifiers> <domain word>`.
+        A singular domain word must match exactly one entity; anything unclear resolves to nothing."""
+        exact = self._by_name(target, SWITCHABLE)
+        if len(exact) == 1:
+            return exact, exact[0].split(".", 1)[0]
+        if m := _IN_AREA.match(target):
+            target = f"{m['area']} {m['what']}"
+        words = target.split()
+        group = "all" in words
+        words = [w for w in words if w != "all"]
+        for size in (2, 1):
+            domain_word = " ".join(words[-size:])
+            if len(words) >= size and domain_word in DOMAIN_WORDS:
+                break
+        else:
+            return [], None
+        domain = DOMAIN_WORDS[domain_word]
+        qualifiers = words[:-size]
+        if qualifiers:
+            entity_ids = sorted(set.intersection(*(self.tokens.get((domain, q), set()) for q in qualifiers)))
+        else:
+            entity_ids = self.domains[domain]
+        if not (group or domain_word in PLURAL_WORDS) and len(entity_ids) != 1:
+            return [], None
+        return entity_ids, domain
@@ -0,0 +1,286 @@
+"""
+Open-loop load generator for ha_mcp_proxy over HTTP or stdio.
+
+Requests are started on a fixed schedule (`--rate` per second for `--duration` seconds)
+whether or not earlier ones have finished, and latency is measured from each request's
+scheduled start, so a proxy that falls behind shows it in the percentiles. By default the
+proxy and an ha_simulator.py HA stand-in are started locally; upstream call counts come from
+the simulator's /_sim/stats.
+
+Usage:
+    python load_mcp_proxy.py --transport http --rate 200 --duration 10 --entities 2000
+    python load_mcp_proxy.py --transport stdio --rate 200 --mix search_filtered=8,call_service=2
+    python load_mcp_proxy.py --proxy-url http://localhost:8081/mcp --ha-url http://localhost:8123
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+import httpx
+from ha_fixtures import make_states
+from ha_simulator import SimulatorProcess, free_port
+
+PROXY = str(Path(__file__).parent / "ha_mcp_proxy.py")
+DEFAULT_MIX = "search_filtered=6,search_page=2,search_full=1,call_service=2,list_services=1"
+
+
+def request_factory(entities: int, seed: int = 0):
+    """Builds the JSON-RPC request for each kind in the mix."""
+    rng = random.Random(seed)
+    lights = [s["entity_id"] for s in make_states(entities) if s["entity_id"].startswith("light.")]
+    builders = {
+        "search_full": lambda: ("search", {}),
+        "search_filtered": lambda: ("search", {"domain": "light", "state": rng.choice(["on", "off"]), "attributes": []}),
+        "search_page": lambda: ("search", {"limit": 20, "attributes": ["friendly_name"]}),
+        "call_service": lambda: ("call_service", {"domain": "light", "service": rng.choice(["turn_on", "turn_off"]),
+                                                  "service_data": {"entity_id": rng.choice(lights)}}),
+        "list_services": lambda: ("list_services", {}),
+        "cache_stats": lambda: ("cache_stats", {}),
+    }
+    return builders
+
+
+def parse_mix(mix: str, builders) -> list[str]:
+    weighted = []
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in builders:
+            raise SystemExit(f"Unknown request kind {name!r}; choose from {', '.join(builders)}")
+        weighted += [name] * int(weight or 1)
+    return weighted
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def wait_for_port(port: int, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+# --- Transports ---
+class HttpTransport:
+    def __init__(self, url: str, max_connections: int):
+        self.url = url
+        self.client = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=max_connections))
+
+    async def send(self, payload: dict) -> dict:
+        resp = await self.client.post(self.url, json=payload)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class StdioTransport:
+    """Pipelines requests over one `ha_mcp_proxy.py --stdio` process, matching responses by id."""
+
+    def __init__(self, env: dict):
+        self.env = env
+        self.pending: dict[int, asyncio.Future] = {}
+
+    async def start(self):
+        self.proc = await asyncio.create_subprocess_exec(
+            sys.executable, PROXY, "--stdio", env=self.env, limit=64 * 1024 * 1024,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        async for line in self.proc.stdout:
+            response = json.loads(line)
+            future = self.pending.pop(response.get("id"), None)
+            if future is not None and not future.done():
+                future.set_result(response)
+
+    async def send(self, payload: dict) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        self.pending[payload["id"]] = future
+        self.proc.stdin.write(json.dumps(payload).encode() + b"\n")
+        await self.proc.stdin.drain()
+        return await future
+
+    async def close(self):
+        self.proc.stdin.close()
+        try:
+            await asyncio.wait_for(self.proc.wait(), 10)
+        except asyncio.TimeoutError:
+            self.proc.kill()
+        self.reader.cancel()
+
+
+# --- Run ---
+async def upstream_calls(ha_url: str) -> dict:
+    try:
+        async with httpx.AsyncClient(timeout=5) as client:
+            stats = (await client.get(f"{ha_url}/_sim/stats")).json()
+    except (httpx.HTTPError, ValueError):
+        return {}
+    return {f"{c['method']} {c['path']}": c["count"] for c in stats["calls"]}
+
+
+async def drive(transport, args, builders, kinds) -> dict:
+    rng = random.Random(args.seed)
+    ids = itertools.count(1)
+    results: list[tuple[str, float, Optional[str]]] = []  # kind, latency, error message
+    total = int(args.rate * args.duration)
+    in_flight = asyncio.Semaphore(args.max_in_flight)
+    dropped = 0
+
+    async def one(kind: str, scheduled: float):
+        method, params = builders[kind]()
+        payload = {"jsonrpc": "2.0", "id": next(ids), "method": method, "params": params}
+        try:
+            response = await transport.send(payload)
+            # Failures, upstream ones included, are JSON-RPC errors: {"error": {"message": ...}}.
+            error = response.get("error")
+            error = None if error is None else str(error.get("message") if isinstance(error, dict) else error)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            in_flight.release()
+        results.append((kind, time.perf_counter() - scheduled, error))
+
+    tasks = []
+    start = time.perf_counter()
+    for i in range(total):
+        scheduled = start + i / args.rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if in_flight.locked():
+            dropped += 1
+            continue
+        await in_flight.acquire()
+        tasks.append(asyncio.create_task(one(rng.choice(kinds), scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    return {"results": results, "elapsed": elapsed, "dropped": dropped, "scheduled": total}
+
+
+def summarize(run: dict, upstream: dict, args) -> dict:
+    results = run["results"]
+    latencies = [t * 1000 for _, t, error in results if error is None]
+    errors = Counter(error[:80] for _, _, error in results if error is not None)
+    report = {
+        "transport": args.transport,
+        "target_rate": args.rate,
+        "duration_s": round(run["elapsed"], 3),
+        "scheduled": run["scheduled"],
+        "completed": len(results),
+        "errors": sum(errors.values()),
+        "error_messages": dict(errors.most_common(5)),
+        "dropped": run["dropped"],
+        "throughput_rps": round(len(results) / run["elapsed"], 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 2),
+            "p90": round(percentile(latencies, 0.90), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "max": round(max(latencies, default=0), 2),
+            "mean": round(statistics.fmean(latencies), 2) if latencies else 0,
+        },
+        "per_kind": {},
+        "upstream_calls": upstream,
+        "upstream_calls_per_request": round(sum(upstream.values()) / len(results), 3) if results else None,
+    }
+    for kind in sorted({k for k, _, _ in results}):
+        timings = [t * 1000 for k, t, error in results if k == kind and error is None]
+        report["per_kind"][kind] = {"count": sum(1 for k, _, _ in results if k == kind),
+                                    "p50": round(percentile(timings, 0.5), 2), "p99": round(percentile(timings, 0.99), 2)}
+    return report
+
+
+def print_report(report: dict):
+    lat = report["latency_ms"]
+    print(f"{report['transport']}: {report['completed']}/{report['scheduled']} requests in {report['duration_s']}s "
+          f"({report['throughput_rps']} rps, target {report['target_rate']}), "
+          f"{report['errors']} errors, {report['dropped']} dropped")
+    print(f"latency ms: p50={lat['p50']} p90={lat['p90']} p99={lat['p99']} max={lat['max']}")
+    for message, count in report["error_messages"].items():
+        print(f"  error x{count}: {message}")
+    for kind, stats in report["per_kind"].items():
+        print(f"  {kind:<16} n={stats['count']:<6} p50={stats['p50']:>8}ms p99={stats['p99']:>8}ms")
+    print(f"upstream calls ({report['upstream_calls_per_request']} per request):")
+    for path, count in sorted(report["upstream_calls"].items()):
+        print(f"  {path:<40} {count}")
+
+
+async def main(args):
+    simulator = None
+    proxy = None
+    ha_url = args.ha_url
+    if ha_url is None:
+        simulator = SimulatorProcess(entities=args.entities, latency_ms=args.latency_ms,
+                                     jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+        ha_url = simulator.url
+    env = dict(os.environ, HA_URL=ha_url, HA_TOKEN=os.environ.get("HA_TOKEN") or "load-test")
+    builders = request_factory(args.entities, args.seed)
+    kinds = parse_mix(args.mix, builders)
+    try:
+        if args.transport == "stdio":
+            transport = StdioTransport(env)
+            await transport.start()
+        else:
+            url = args.proxy_url
+            if url is None:
+                port = free_port()
+                proxy = subprocess.Popen([sys.executable, PROXY], env=dict(env, PORT=str(port)),
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                wait_for_port(port)
+                url = f"http://127.0.0.1:{port}/mcp"
+            transport = HttpTransport(url, args.max_in_flight)
+        # Warm-up: let the proxy load its state cache and service registry before measuring.
+        await transport.send({"jsonrpc": "2.0", "id": 0, "method": "search", "params": {"limit": 1}})
+        await asyncio.sleep(args.warmup)
+        before = await upstream_calls(ha_url)
+        run = await drive(transport, args, builders, kinds)
+        after = await upstream_calls(ha_url)
+        await transport.close()
+    finally:
+        if proxy is not None:
+            proxy.terminate()
+            proxy.wait(timeout=10)
+        if simulator is not None:
+            simulator.stop()
+    upstream = {k: n - before.get(k, 0) for k, n in after.items() if n - before.get(k, 0)}
+    report = summarize(run, upstream, args)
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transport", choices=["http", "stdio"], default="http")
+    parser.add_argument("--rate", type=float, default=100.0, help="requests started per second")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="comma-separated kind=weight")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="requests beyond this are dropped, not queued")
+    parser.add_argument("--entities", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--jitter-ms", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds to wait after the first request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ha-url", help="use this HA (or simulator) instead of starting one")
+    parser.add_argument("--proxy-url", help="use this running proxy's /mcp endpoint (http transport)")
+    parser.add_argument("--json", help="also write the report to this file")
+    asyncio.run(main(parser.parse_args()))
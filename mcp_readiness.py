@@ -0,0 +1,53 @@
+"""Readiness probes for MCP servers: a configured URL or TCP port, else the first SSE event."""
+import asyncio
+import os
+import time
+from typing import Optional
+import httpx
+from check_mcp_servers import probe
+
+PROBE_INTERVAL = float(os.getenv("MCP_PROBE_INTERVAL", "0.5"))
+PROBE_TIMEOUT = float(os.getenv("MCP_PROBE_TIMEOUT", "5"))
+
+
+async def probe_ready(name: str, config: dict, timeout: float = PROBE_TIMEOUT) -> Optional[str]:
+    """None when the server answers its readiness probe, else the reason it does not.
+    Raises LookupError for a server that has no probe (readiness is then time-based)."""
+    ready = config.get("ready", {})
+    env = config.get("env", {})
+    try:
+        if "url" in ready:
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                resp = await client.get(ready["url"])
+            return None if resp.status_code < 500 else f"HTTP {resp.status_code}"
+        if "tcp" in ready:
+            host, port = ready["tcp"].rsplit(":", 1)
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), timeout)
+            writer.close()
+            return None
+    except (httpx.HTTPError, OSError, asyncio.TimeoutError) as e:
+        return f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+    if env.get("SSE_URL"):
+        try:
+            result = await asyncio.wait_for(probe(name, env, timeout), timeout)
+        except asyncio.TimeoutError:
+            return f"no first event within {timeout:g}s"
+        return None if result["ok"] else result["error"]
+    raise LookupError(name)
+
+
+async def wait_until_ready(servers: dict[str, dict], timeout: float) -> dict[str, str]:
+    """Probe `servers` until every one is ready or `timeout` passes; the ones still not ready, with why."""
+    deadline = time.monotonic() + timeout
+    pending = {name: "not probed" for name in servers}
+    while pending:
+        for name, error in zip(list(pending), await asyncio.gather(
+                *(probe_ready(name, servers[name], PROBE_TIMEOUT) for name in pending), return_exceptions=True)):
+            if error is None or isinstance(error, LookupError):
+                del pending[name]
+            else:
+                pending[name] = str(error)
+        if not pending or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(min(PROBE_INTERVAL, max(0.0, deadline - time.monotonic())))
+    return pending
@@ -0,0 +1,256 @@
+"""
+Supervisor for the MCP servers in mcp_config.json.
+
+Every enabled server is started at once. It is ready when its readiness probe passes:
+- a `"ready": {"url": ...}` or `"ready": {"tcp": "host:port"}` entry in its config
+- otherwise, for a server with an SSE_URL, the first SSE event (see mcp_readiness)
+- otherwise, staying up for MCP_READY_GRACE seconds
+Ready servers are probed again every MCP_HEALTH_INTERVAL seconds. A child that exits is
+restarted after an exponential backoff with jitter. The backoff resets once the child has stayed
+up for MCP_RESTART_RESET seconds. Given a command, the supervisor starts it only once the servers
+are ready, and stops them when it exits.
+
+Usage:
+    python mcp_supervisor.py --status-port 8765
+    python mcp_supervisor.py --require "Aspire New" -- python pydantic_al_aspire_agent.py
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+from check_mcp_servers import CONFIG_PATH, load_config
+from ha_instance import slugify
+from mcp_readiness import PROBE_INTERVAL, probe_ready
+
+READY_GRACE = float(os.getenv("MCP_READY_GRACE", "2"))
+HEALTH_INTERVAL = float(os.getenv("MCP_HEALTH_INTERVAL", "10"))
+RESTART_BACKOFF = float(os.getenv("MCP_RESTART_BACKOFF", "0.5"))
+RESTART_MAX_BACKOFF = float(os.getenv("MCP_RESTART_MAX_BACKOFF", "30"))
+RESTART_RESET = float(os.getenv("MCP_RESTART_RESET", "60"))
+
+
+class ManagedServer:
+    """One child process: started, probed, and restarted with backoff until the supervisor stops."""
+
+    def __init__(self, name: str, config: dict, log_dir: Optional[Path] = None):
+        self.name = name
+        self.config = config
+        self.log_dir = log_dir
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.state = "stopped"
+        self.ready = asyncio.Event()
+        self.starts = 0
+        self.restarts = 0
+        self.attempt = 0
+        self.started_at = 0.0
+        self.ready_after: Optional[float] = None
+        self.last_exit: Optional[int] = None
+        self.last_error: Optional[str] = None
+
+    def _set(self, state: str, error: Optional[str] = None):
+        if state != self.state:
+            logging.info(f"[{self.name}] {self.state} -> {state}" + (f": {error}" if error else ""))
+        self.state = state
+        if error:
+            self.last_error = error
+        if state == "ready":
+            self.ready.set()
+        else:
+            self.ready.clear()
+
+    async def _spawn(self):
+        cmd = [self.config["command"], *self.config.get("args", [])]
+        env = dict(os.environ, **self.config.get("env", {}))
+        log = open(self.log_dir / f"{slugify(self.name)}.log", "ab") if self.log_dir else None
+        try:
+            # stdin stays open so stdio servers wait for a client instead of exiting on EOF;
+            # a new session keeps Ctrl+C meant for the supervisor (or its command) away from them.
+            self.proc = await asyncio.create_subprocess_exec(
+                *cmd, env=env, stdin=subprocess.PIPE, stdout=log or subprocess.DEVNULL,
+                stderr=log, start_new_session=True)
+        finally:
+            if log:
+                log.close()
+        self.starts += 1
+        self.started_at = time.monotonic()
+        logging.info(f"[{self.name}] started: PID {self.proc.pid}")
+
+    async def _watch(self):
+        """Probe until ready, then keep checking health while the child runs."""
+        while True:
+            try:
+                error = await probe_ready(self.name, self.config)
+            except LookupError:
+                uptime = time.monotonic() - self.started_at
+                error = None if uptime >= READY_GRACE else "starting"
+            if error is None:
+                if self.state != "ready":
+                    self.ready_after = round(time.monotonic() - self.started_at, 3)
+                self._set("ready")
+            else:
+                # A failing probe on a live child (e.g. HA itself is down) is reported, not restarted.
+                self._set("unhealthy" if self.ready_after is not None else "starting",
+                          error if error != "starting" else None)
+            await asyncio.sleep(HEALTH_INTERVAL if self.state == "ready" else PROBE_INTERVAL)
+
+    async def run(self, stopping: asyncio.Event):
+        while not stopping.is_set():
+            self.ready_after = None
+            self._set("starting")
+            try:
+                await self._spawn()
+            except OSError as e:
+                self._set("backoff", f"{type(e).__name__}: {e}")
+            else:
+                watcher = asyncio.create_task(self._watch())
+                try:
+                    self.last_exit = await self.proc.wait()
+                finally:
+                    watcher.cancel()
+                if stopping.is_set():
+                    break
+                if time.monotonic() - self.started_at >= RESTART_RESET:
+                    self.attempt = 0
+                self._set("backoff", f"exited with status {self.last_exit}")
+            delay = min(RESTART_MAX_BACKOFF, RESTART_BACKOFF * 2 ** self.attempt)
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            self.attempt += 1
+            self.restarts += 1
+            try:
+                await asyncio.wait_for(stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        self._set("stopped")
+
+    async def stop(self, grace: float = 5.0):
+        if self.proc is None or self.proc.returncode is not None:
+            return
+        self.proc.terminate()
+        try:
+            await asyncio.wait_for(self.proc.wait(), grace)
+        except asyncio.TimeoutError:
+            self.proc.kill()
+            await self.proc.wait()
+
+    def status(self) -> dict:
+        running = self.proc is not None and self.proc.returncode is None
+        return {"state": self.state, "pid": self.proc.pid if running else None,
+                "uptime": round(time.monotonic() - self.started_at, 1) if running else None,
+                "ready_after": self.ready_after, "starts": self.starts, "restarts": self.restarts,
+                "last_exit": self.last_exit, "last_error": self.last_error}
+
+
+class Supervisor:
+    def __init__(self, servers: dict[str, dict], log_dir: Optional[Path] = None):
+        self.servers = {name: ManagedServer(name, cfg, log_dir) for name, cfg in servers.items()
+                        if not cfg.get("disabled", False)}
+        for name in servers.keys() - self.servers.keys():
+            logging.info(f"[{name}] disabled, not started")
+        self.stopping = asyncio.Event()
+        self.tasks: list[asyncio.Task] = []
+
+    def start(self):
+        self.tasks = [asyncio.create_task(server.run(self.stopping)) for server in self.servers.values()]
+
+    async def wait_ready(self, names: Optional[list[str]] = None, timeout: float = 60.0) -> list[str]:
+        """Wait until the named servers (default: all) are ready; the names still not ready."""
+        waiting = [self.servers[name] for name in (names or self.servers)]
+        try:
+            await asyncio.wait_for(asyncio.gather(*(s.ready.wait() for s in waiting)), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return [s.name for s in waiting if not s.ready.is_set()]
+
+    def status(self) -> dict:
+        return {name: server.status() for name, server in self.servers.items()}
+
+    async def stop(self):
+        self.stopping.set()
+        await asyncio.gather(*(server.stop() for server in self.servers.values()))
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+async def serve_status(supervisor: Supervisor, port: int) -> asyncio.AbstractServer:
+    """Any GET answers the status as JSON: 200 when every server is ready, 503 otherwise."""
+    async def handle(reader, writer):
+        try:
+            while (await reader.readline()).strip():
+                pass
+            status = supervisor.status()
+            ok = all(s["state"] == "ready" for s in status.values())
+            body = json.dumps({"ready": ok, "servers": status}, indent=2).encode()
+            writer.write(f"HTTP/1.1 {'200 OK' if ok else '503 Service Unavailable'}\r\n"
+                         f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                         f"Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        finally:
+            writer.close()
+    return await asyncio.start_server(handle, "127.0.0.1", port)
+
+
+async def supervise(args) -> int:
+    servers = load_config(args.config).get("mcpServers", {})
+    supervisor = Supervisor(servers, Path(args.log_dir) if args.log_dir else None)
+    unknown = [name for name in args.require or [] if name not in supervisor.servers]
+    if unknown:
+        logging.error(f"Not an enabled server in {args.config}: {', '.join(unknown)}")
+        return 2
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, supervisor.stopping.set)
+    status_server = await serve_status(supervisor, args.status_port) if args.status_port else None
+    supervisor.start()
+    try:
+        started = time.monotonic()
+        not_ready = await supervisor.wait_ready(args.require, args.ready_timeout)
+        if not_ready:
+            logging.error(f"Not ready after {args.ready_timeout:g}s: {', '.join(not_ready)}")
+        else:
+            logging.info(f"Ready in {time.monotonic() - started:.2f}s: {', '.join(args.require or supervisor.servers)}")
+        if args.command:
+            if not_ready:
+                return 1
+            proc = await asyncio.create_subprocess_exec(*args.command)
+            stopped = asyncio.create_task(supervisor.stopping.wait())
+            await asyncio.wait({stopped, asyncio.create_task(proc.wait())}, return_when=asyncio.FIRST_COMPLETED)
+            if proc.returncode is None:
+                proc.terminate()
+            return await proc.wait()
+        await supervisor.stopping.wait()
+        return 0
+    finally:
+        if status_server:
+            status_server.close()
+        await supervisor.stop()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one line per probe otherwise
+    parser = argparse.ArgumentParser(usage="%(prog)s [options] [-- command ...]")
+    parser.add_argument("--config", default=str(CONFIG_PATH))
+    parser.add_argument("--require", action="append", help="server the command waits for (repeatable; default all)")
+    parser.add_argument("--ready-timeout", type=float, default=60.0, help="seconds to wait for readiness")
+    parser.add_argument("--status-port", type=int, help="serve the status as JSON on 127.0.0.1:PORT")
+    parser.add_argument("--log-dir", help="append each server's output to <log-dir>/<server>.log")
+    argv = sys.argv[1:]
+    command = argv[argv.index("--") + 1:] if "--" in argv else []
+    args = parser.parse_args(argv[:argv.index("--")] if "--" in argv else argv)
+    args.command = command
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+    try:
+        sys.exit(asyncio.run(supervise(args)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Minimal Prometheus-style metrics (counters, gauges, histograms) for ha_mcp_proxy."""
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values: dict[tuple, float] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list[str]:
+        return self.header() + [f"{self.name}{_labels(self.label_names, k)} {v}" for k, v in sorted(self.values.items())]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        self.series: dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.series.setdefault(key, [0] * (len(self.buckets) + 2))
+        slot = bisect.bisect_left(self.buckets, value)
+        if slot < len(self.buckets):
+            series[slot] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for key, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), key + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[_Metric] = []
+        self.collectors: list[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]):
+        """`collector` yields extra exposition lines at scrape time."""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+def labeled_stats_gauges(prefix: str, label: str, stats_by_value: dict[str, dict], help: str = "") -> list[str]:
+    """Expose the numeric fields of several components' stats() dicts as gauges named `<prefix>_<field>`,
+    one series per `label` value."""
+    series: dict[str, list[str]] = {}
+    for value, stats in stats_by_value.items():
+        for field, number in stats.items():
+            if isinstance(number, bool):
+                number = int(number)
+            if isinstance(number, (int, float)):
+                series.setdefault(field, []).append(f"{prefix}_{field}{_labels((label,), (value,))} {number}")
+    lines = []
+    for field, samples in series.items():
+        name = f"{prefix}_{field}"
+        lines += [f"# HELP {name} {help or prefix} {field}", f"# TYPE {name} gauge", *samples]
+    return lines
+
+
+REGISTRY = Registry()
+MCP_REQUESTS = REGISTRY.register(Counter("mcp_requests_total", "JSON-RPC requests handled", ("method", "status")))
+MCP_LATENCY = REGISTRY.register(Histogram("mcp_request_duration_seconds", "JSON-RPC request latency", ("method",)))
+MCP_IN_FLIGHT = REGISTRY.register(Gauge("mcp_requests_in_flight", "JSON-RPC payloads being processed per transport", ("transport",)))
+MCP_METHODS_IN_FLIGHT = REGISTRY.register(Gauge("mcp_methods_in_flight", "JSON-RPC requests being processed per method", ("method",)))
+MCP_RESPONSE_BYTES = REGISTRY.register(Histogram("mcp_response_bytes", "Serialized JSON-RPC response size", ("method",), SIZE_BUCKETS))
+UPSTREAM_REQUESTS = REGISTRY.register(Counter("ha_upstream_requests_total", "Requests sent to Home Assistant", ("instance", "method", "path", "status")))
+UPSTREAM_LATENCY = REGISTRY.register(Histogram("ha_upstream_duration_seconds", "Home Assistant request latency", ("instance", "method", "path")))
+UPSTREAM_IN_FLIGHT = REGISTRY.register(Gauge("ha_upstream_in_flight", "Requests to Home Assistant awaiting a response", ("instance",)))
+UPSTREAM_RESPONSE_BYTES = REGISTRY.register(Histogram("ha_upstream_response_bytes", "Home Assistant response size", ("instance", "path"), SIZE_BUCKETS))
+
+
+def upstream_path_label(path: str) -> str:
+    """Collapse per-entity paths so label cardinality stays bounded."""
+    if path.startswith("/api/states/"):
+        return "/api/states/{entity_id}"
+    return path
+
+
+@contextmanager
+def track(latency: Histogram, in_flight: Gauge, in_flight_labels: Optional[dict] = None, **labels):
+    """Time a block into `latency` while counting it in `in_flight`."""
+    in_flight_labels = in_flight_labels or {}
+    in_flight.inc(**in_flight_labels)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        latency.observe(time.perf_counter() - start, **labels)
+        in_flight.dec(**in_flight_labels)
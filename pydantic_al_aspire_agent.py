@@ -1,82 +1,25 @@
 import os
 import json
+import asyncio
+import contextlib
+import signal
+import threading
+from typing import Optional
+import httpx
 from dotenv import load_dotenv
 load_dotenv()
 from pydantic_ai.agent import Agent
-from pydantic_ai.mcp import MCPServerHTTP
-from pathlib import Path
-
-# Load MCP config
-with open(Path(__file__).parent / "mcp_config.json") as f:
-    MCP_CONFIG = json.load(f)["mcpServers"]
-
+from pydantic_ai.messages import ModelResponse, ToolCallPart
 from pydantic_ai.models.openai import OpenAIModel
 from pydantic_ai._cli import cli
-from pydantic_ai.tools import Tool
-import requests
-
-def debug_mcp_events():
-    import sseclient
-    import requests
-    print("[DEBUG] Connecting to MCP SSE endpoint for event debug...")
-    resp = requests.get(
-        "http://192.168.100.101:8123/mcp_server/sse",
-        headers={
-            "Authorization": f"Bearer {os.environ.get('ASPIRE_MCP_TOKEN')}",
-            "Accept": "text/event-stream"
-        },
-        stream=True,
-        timeout=15,
-    )
-    resp.encoding = 'utf-8'
-    try:
-        client = sseclient.SSEClient(resp.iter_content(decode_unicode=True))
-        for i, event in enumerate(client.events()):
-            print(f"[DEBUG] SSE event {i}: type={event.event!r} data={event.data!r}")
-            if i >= 3:
-                break
-    except Exception as e:
-        print("[DEBUG] Exception while reading SSE events:", repr(e))
-    finally:
-        resp.close()
-
-def get_aspire_mcp_server():
-    """Return an MCPServerHTTP instance for Aspire New MCP (SSE transport)."""
-    cfg = MCP_CONFIG["Aspire New"]["env"]
-    token = os.environ.get("ASPIRE_MCP_TOKEN")
-    headers = {"Accept": "text/event-stream"}
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
-    print("[DEBUG] Attempting MCPServerHTTP connection with:")
-    print(f"  URL: {cfg['SSE_URL']}")
-    print(f"  Headers: {headers}")
-    try:
-        server = MCPServerHTTP(
-            url=cfg["SSE_URL"],
-            headers=headers,
-            timeout=15,
-            sse_read_timeout=300,
-        )
-        print("[DEBUG] MCPServerHTTP instance created successfully.")
-        return server
-    except Exception as e:
-        print("[DEBUG] MCPServerHTTP connection failed:", repr(e), type(e), e.args)
-        raise
+import agent_trace
+from aspire_mcp import MCP_CONFIG, connection_lost, get_aspire_mcp_server
+from aspire_tools import CACHE_ENABLED, HA_TOOLS, PROMPT_CACHE, READ_ONLY_TOOLS, STORE, close_client, fast_path, warm_entities
+from intent_router import normalize
+from mcp_readiness import wait_until_ready
 
-def get_context7_mcp_server():
-    """Return an MCPServerHTTP instance for context7 MCP (SSE transport), configurable via .env or mcp_config.json."""
-    url = os.environ.get("CONTEXT7_MCP_SSE_URL")
-    token = os.environ.get("CONTEXT7_MCP_TOKEN")
-    if not url:
-        cfg = MCP_CONFIG.get("context7", {}).get("env", {})
-        url = cfg.get("SSE_URL")
-        token = cfg.get("API_ACCESS_TOKEN")
-    if url:
-        headers = {"Accept": "text/event-stream"}
-        if token:
-            headers["Authorization"] = f"Bearer {token}"
-        return MCPServerHTTP(url=url, headers=headers, timeout=15, sse_read_timeout=300)
-    return None
+# Seconds to wait for the MCP server's readiness probe before the first prompt; 0 skips the wait.
+MCP_READY_TIMEOUT = float(os.environ.get("MCP_READY_TIMEOUT", "30"))
 
 def get_openai_model():
     """Return an OpenAIModel instance using env variables for model and base URL."""
@@ -84,70 +27,6 @@ def get_openai_model():
         model_name=os.environ["OPENAI_MODEL"]
     )
 
-# --- Aspire Home Assistant Tool Functions ---
-
-API_URL = "http://192.168.100.101:8123/api"
-API_TOKEN = os.environ.get("ASPIRE_MCP_TOKEN")
-HEADERS = {"Authorization": f"Bearer {API_TOKEN}", "Content-Type": "application/json"}
-
-def list_entities() -> list[str]:
-    resp = requests.get(f"{API_URL}/states", headers=HEADERS, timeout=10)
-    resp.raise_for_status()
-    return [e["entity_id"] for e in resp.json()]
-
-def list_entities_by_domain(domain: str) -> list[str]:
-    resp = requests.get(f"{API_URL}/states", headers=HEADERS, timeout=10)
-    resp.raise_for_status()
-    return [e["entity_id"] for e in resp.json() if e["entity_id"].startswith(f"{domain}.")]
-
-def filter_entities_by_state(domain: str, state: str) -> list[str]:
-    resp = requests.get(f"{API_URL}/states", headers=HEADERS, timeout=10)
-    resp.raise_for_status()
-    return [e["entity_id"] for e in resp.json() if e["entity_id"].startswith(f"{domain}.") and e["state"] == state]
-
-def show_entity_attributes(entity_id: str) -> dict:
-    resp = requests.get(f"{API_URL}/states/{entity_id}", headers=HEADERS, timeout=10)
-    if resp.status_code != 200:
-        print(f"Entity {entity_id} not found.")
-        return {}
-    data = resp.json()
-    print(json.dumps(data.get("attributes", {}), indent=2, sort_keys=True))
-    return data.get("attributes", {})
-
-
-def list_lights() -> list[str]:
-    """Return a list of all Home Assistant light entities (entity_ids starting with 'light.')."""
-    print("[DEBUG] list_lights tool called")
-    resp = requests.get(f"{API_URL}/states", headers=HEADERS, timeout=10)
-    resp.raise_for_status()
-    return [e["entity_id"] for e in resp.json() if e["entity_id"].startswith("light.")]
-
-def get_state(entity_id: str) -> dict:
-    resp = requests.get(f"{API_URL}/states/{entity_id}", headers=HEADERS, timeout=10)
-    resp.raise_for_status()
-    return resp.json()
-
-def turn_on(entity_id: str) -> str:
-    domain = entity_id.split(".")[0]
-    resp = requests.post(f"{API_URL}/services/{domain}/turn_on", headers=HEADERS, json={"entity_id": entity_id}, timeout=10)
-    resp.raise_for_status()
-    return f"Turned on {entity_id}"
-
-def turn_off(entity_id: str) -> str:
-    domain = entity_id.split(".")[0]
-    resp = requests.post(f"{API_URL}/services/{domain}/turn_off", headers=HEADERS, json={"entity_id": entity_id}, timeout=10)
-    resp.raise_for_status()
-    return f"Turned off {entity_id}"
-
-def set_value(entity_id: str, value: float) -> str:
-    domain = entity_id.split(".")[0]
-    # This example targets input_number; extend for other domains as needed
-    if domain == "input_number":
-        resp = requests.post(f"{API_URL}/services/input_number/set_value", headers=HEADERS, json={"entity_id": entity_id, "value": value}, timeout=10)
-        resp.raise_for_status()
-        return f"Set {entity_id} to {value}"
-    return f"Setting value for domain {domain} is not implemented."
-
 def main():
     """Simple CLI for Aspire MCP server only."""
     try:
@@ -159,35 +38,152 @@ def main():
     if not mcp_aspire:
         print("[ERROR] Could not initialize Aspire MCP server. Check your configuration.")
         return
-    llm = get_openai_model()
-    agent = Agent(
-        model=llm,
+    agent = build_agent(get_openai_model(), [mcp_aspire])
+    with contextlib.suppress(KeyboardInterrupt):  # Ctrl+C where the loop can't take SIGINT itself
+        asyncio.run(run_cli(agent, mcp_aspire))
+
+def build_agent(llm, mcp_servers=()) -> Agent:
+    return Agent(
+        model=agent_trace.TracedModel(llm) if agent_trace.ENABLED else llm,
         name="AspireHomeAssistantAgent",
-        mcp_servers=[mcp_aspire],
-        tools=[
-            Tool(list_entities, name="list_entities", description="List all Home Assistant entities."),
-            Tool(list_lights, name="list_lights", description="List all Home Assistant light entities."),
-            Tool(get_state, name="get_state", description="Get the state of a Home Assistant entity."),
-            Tool(turn_on, name="turn_on", description="Turn on a Home Assistant entity (e.g., light, switch, etc.)."),
-            Tool(turn_off, name="turn_off", description="Turn off a Home Assistant entity (e.g., light, switch, etc.)."),
-            Tool(set_value, name="set_value", description="Set a value for a Home Assistant entity (e.g., input_number, climate, etc.)"),
-            Tool(list_entities_by_domain, name="list_entities_by_domain", description="List all entities of a given domain (e.g., sensor, light, switch)."),
-            Tool(filter_entities_by_state, name="filter_entities_by_state", description="List all entities of a domain in a given state (e.g., all lights that are on)."),
-            Tool(show_entity_attributes, name="show_entity_attributes", description="Show all attributes for a given entity in pretty-printed JSON."),
-        ]
+        mcp_servers=list(mcp_servers),
+        tools=HA_TOOLS,
     )
-    print("Aspire Home Assistant Agent CLI (type 'exit' to quit)")
-    while True:
-        user_input = input("pai ➤ ")
-        if user_input.strip().lower() in {"exit", "quit"}:
-            print("Goodbye!")
-            break
+
+def _read_only(messages) -> bool:
+    """True if the run only called read-only tools (MCP tools count as mutating)."""
+    return all(
+        part.tool_name in READ_ONLY_TOOLS
+        for message in messages if isinstance(message, ModelResponse)
+        for part in message.parts if isinstance(part, ToolCallPart)
+    )
+
+async def answer(agent, prompt: str) -> str:
+    """Run `prompt` through the agent, reusing the answer of an earlier read-only run of the
+    same normalized prompt while the Home Assistant states are unchanged."""
+    fingerprint = None
+    if CACHE_ENABLED:
         try:
-            result = agent.run_sync(user_input)
-            print(result.output)
-        except Exception as e:
-            print(f"[ERROR] {e}")
-            print("[DEBUG] Exception details:", repr(e), type(e), e.args)
+            fingerprint = await STORE.fingerprint()
+        except (httpx.HTTPError, OSError) as e:
+            # HA unreachable: skip the cache rather than fail a prompt the model may answer anyway.
+            print(f"[WARN] Prompt cache skipped, no entity snapshot: {e!r}")
+    if fingerprint is None:
+        agent_trace.annotate(answered_by="model")
+        return (await agent.run(prompt)).output
+    key = (normalize(prompt), fingerprint)
+    output = PROMPT_CACHE.get(key)
+    agent_trace.annotate(answered_by="model" if output is None else "prompt_cache")
+    if output is not None:
+        return output
+    result = await agent.run(prompt)
+    if _read_only(result.new_messages()):
+        PROMPT_CACHE.put(key, result.output)
+    return result.output
+
+async def turn(agent, prompt: str) -> str:
+    """One CLI turn: the intent router's fast path, else the agent; traced as one `turn` span."""
+    try:
+        with agent_trace.span("turn", prompt=prompt):
+            # The entity snapshot is needed by the fast path and, failing that, the model's tools.
+            warm_entities()
+            reply = await fast_path(prompt)
+            if reply is not None:
+                agent_trace.annotate(answered_by="fast_path")
+                return reply
+            return await answer(agent, prompt)
+    finally:
+        agent_trace.flush()
+
+def start_input_reader(loop, prompt: str):
+    """Read stdin lines on a daemon thread, one per call of the returned coroutine (None at EOF).
+    Unlike an executor job, a blocked read never holds up the loop's shutdown."""
+    lines: asyncio.Queue = asyncio.Queue()
+    wanted = threading.Event()
+
+    def read():
+        while True:
+            wanted.wait()
+            wanted.clear()
+            try:
+                line = input(prompt)
+            except EOFError:
+                line = None
+            loop.call_soon_threadsafe(lines.put_nowait, line)
+            if line is None:
+                return
+
+    threading.Thread(target=read, name="cli-input", daemon=True).start()
+
+    async def next_line():
+        wanted.set()
+        return await lines.get()
+    return next_line
+
+async def mcp_session(agent, mcp_server, next_line, retry: Optional[str] = None) -> tuple[bool, Optional[str]]:
+    """
+    Run prompts on one MCP session. Returns (False, None) once the user quits, or (True, prompt)
+    when the connection is lost during a turn: the caller opens a new session and retries that
+    prompt once (`retry`); a prompt that already was a retry is not retried again (None).
+    """
+    lost, again = False, None
+    try:
+        async with agent.run_mcp_servers():
+            await mcp_server.list_tools()
+            while not lost:
+                user_input, retried, retry = retry, retry is not None, None
+                if user_input is None:
+                    user_input = await next_line()
+                    if user_input is None or user_input.strip().lower() in {"exit", "quit"}:
+                        print("Goodbye!")
+                        return False, None
+                try:
+                    print(await turn(agent, user_input))
+                except Exception as e:
+                    if not connection_lost(e):
+                        print(f"[ERROR] {e}")
+                        print("[DEBUG] Exception details:", repr(e), type(e), e.args)
+                        continue
+                    print("[WARN] MCP connection lost; reconnecting" + ("" if retried else " and retrying the prompt"))
+                    lost, again = True, None if retried else user_input
+    except Exception as e:
+        # Closing a session whose connection already broke may fail too.
+        if not (lost and connection_lost(e)):
+            raise
+    return True, again
+
+async def run_cli(agent, mcp_server):
+    """
+    One event loop and one MCP session for the whole CLI session: the SSE connection,
+    the cached tool list and the pooled HA client are reused by every prompt. A session
+    that drops is reopened (listing the tools afresh) and the interrupted prompt retried once.
+    Ctrl+C cancels the session at once, even while waiting for input or a turn.
+    """
+    loop = asyncio.get_running_loop()
+    with contextlib.suppress(NotImplementedError):  # no loop signal handlers on Windows
+        loop.add_signal_handler(signal.SIGINT, asyncio.current_task().cancel)
+    warm_entities()
+    if MCP_READY_TIMEOUT:
+        env = dict(MCP_CONFIG["Aspire New"]["env"])
+        if os.environ.get("ASPIRE_MCP_TOKEN"):
+            env["API_ACCESS_TOKEN"] = os.environ["ASPIRE_MCP_TOKEN"]
+        not_ready = await wait_until_ready({"Aspire New": {"env": env}}, MCP_READY_TIMEOUT)
+        for name, error in not_ready.items():
+            print(f"[WARN] MCP server {name} not ready after {MCP_READY_TIMEOUT:g}s: {error}")
+    print("Aspire Home Assistant Agent CLI (type 'exit' to quit)")
+    next_line = start_input_reader(loop, "pai ➤ ")
+    try:
+        reconnect, retry = True, None
+        while reconnect:
+            reconnect, retry = await mcp_session(agent, mcp_server, next_line, retry)
+    except asyncio.CancelledError:
+        print("\nGoodbye!")
+    except Exception as e:
+        if not connection_lost(e):
+            raise
+        print(f"[ERROR] Could not reconnect to the MCP server: {e!r}")
+    finally:
+        await close_client()
 
 
 if __name__ == "__main__":
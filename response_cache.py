@@ -0,0 +1,77 @@
+"""Size-bounded LRU cache for agent answers and read-only tool results."""
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+from ha_json import dumps
+
+_MISSING = object()
+
+
+def approx_size(value) -> int:
+    """Encoded JSON size of `value`, used as its weight against `max_bytes`."""
+    try:
+        return len(dumps(value))
+    except TypeError:
+        return len(str(value))
+
+
+class LRUCache:
+    """
+    Least-recently-used cache bounded by entry count and by the approximate encoded size
+    of its values. Keys embed the state fingerprint they were computed for, so entries
+    from older states are simply never hit again and age out.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 4 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default=None):
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, value, size: Optional[int] = None):
+        size = approx_size(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self.bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (value, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def clear(self):
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,130 @@
+"""
+OpenAI-compatible chat completions stub that replays scripted model turns, for offline agent
+benchmarks (see bench_agent_turns.py).
+
+A fixture file maps each prompt to the model steps of its turn: a step either calls tools
+(`{"tool_calls": [{"name": ..., "args": {...}}]}`) or answers (`{"content": "..."}`). A request
+is matched on its last user message, and the number of assistant messages after that message
+picks the step. Token usage is counted like tool_shaping.count_tokens, and is returned in
+`usage` as the real API does. Totals are served at GET /_stub/stats.
+
+Usage:
+    python stub_openai.py --fixtures agent_turns.json --latency-ms 300 --port 8400
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import subprocess
+import sys
+import time
+from collections import Counter
+from fastapi import FastAPI, Request, Response
+from ha_simulator import free_port
+from load_mcp_proxy import wait_for_port
+from tool_shaping import count_tokens
+
+
+def load_fixtures(path) -> dict[str, list[dict]]:
+    with open(path) as f:
+        return {turn["prompt"]: turn.get("steps", []) for turn in json.load(f)["turns"]}
+
+
+def _text(content) -> str:
+    if isinstance(content, list):  # content parts
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def create_app(fixtures: dict[str, list[dict]], latency_ms: float = 0.0, token_ms: float = 0.0) -> FastAPI:
+    """Each reply is delayed by `latency_ms` plus `token_ms` per completion token."""
+    app = FastAPI()
+    stats: Counter = Counter()
+    ids = itertools.count(1)
+
+    def reply(messages: list[dict]) -> tuple[dict, str]:
+        users = [i for i, m in enumerate(messages) if m.get("role") == "user"]
+        prompt = _text(messages[users[-1]].get("content")) if users else ""
+        step = sum(m.get("role") == "assistant" for m in messages[users[-1] + 1:]) if users else 0
+        steps = fixtures.get(prompt)
+        if steps is None or step >= len(steps):
+            stats["unscripted"] += 1
+            return {"role": "assistant", "content": f"No scripted step {step} for: {prompt}"}, "stop"
+        scripted = steps[step]
+        if scripted.get("tool_calls"):
+            calls = [{"id": f"call_{next(ids)}", "type": "function",
+                      "function": {"name": c["name"], "arguments": json.dumps(c.get("args", {}))}}
+                     for c in scripted["tool_calls"]]
+            stats["tool_calls"] += len(calls)
+            return {"role": "assistant", "content": None, "tool_calls": calls}, "tool_calls"
+        return {"role": "assistant", "content": scripted.get("content", "")}, "stop"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.body()
+        payload = json.loads(body)
+        message, finish_reason = reply(payload.get("messages", []))
+        prompt_tokens = count_tokens(payload.get("messages", [])) + count_tokens(payload.get("tools", []))
+        completion_tokens = count_tokens(message.get("tool_calls") or message.get("content") or "")
+        delay = latency_ms + token_ms * completion_tokens
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        response = {
+            "id": f"chatcmpl-stub-{next(ids)}", "object": "chat.completion", "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+        encoded = json.dumps(response).encode()
+        stats["requests"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        stats["bytes_in"] += len(body)
+        stats["bytes_out"] += len(encoded)
+        return Response(encoded, media_type="application/json")
+
+    @app.get("/_stub/stats")
+    async def stub_stats():
+        return {key: stats[key] for key in ("requests", "tool_calls", "prompt_tokens", "completion_tokens",
+                                            "bytes_in", "bytes_out", "unscripted")}
+
+    return app
+
+
+class StubModelProcess:
+    """Run the stub in a child process, like ha_simulator.SimulatorProcess."""
+
+    def __init__(self, fixtures: str, latency_ms: float = 0.0, token_ms: float = 0.0, port: int | None = None):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}/v1"
+        self.stats_url = f"http://127.0.0.1:{self.port}/_stub/stats"
+        self.proc = subprocess.Popen(
+            [sys.executable, __file__, "--fixtures", fixtures, "--latency-ms", str(latency_ms),
+             "--token-ms", str(token_ms), "--port", str(self.port), "--log-level", "warning"])
+        try:
+            wait_for_port(self.port)
+        except RuntimeError:
+            self.stop()
+            raise
+
+    def stop(self):
+        self.proc.terminate()
+        self.proc.wait(timeout=10)
+
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixtures", default="agent_turns.json")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay per model request")
+    parser.add_argument("--token-ms", type=float, default=0.0, help="extra delay per completion token")
+    parser.add_argument("--port", type=int, default=8400)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    app = create_app(load_fixtures(args.fixtures), args.latency_ms, args.token_ms)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
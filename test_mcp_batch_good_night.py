@@ -0,0 +1,27 @@
+import requests
+
+url = "http://localhost:8081/mcp"
+outside_lights = ["light.outside_lights", "light.porch_light", "light.awning_light"]
+payload = [
+    {
+        "jsonrpc": "2.0",
+        "method": "call_service",
+        "params": {"domain": "light", "service": "turn_off", "service_data": {"entity_id": entity_id}},
+        "id": i,
+    }
+    for i, entity_id in enumerate(outside_lights, start=1)
+]
+response = requests.post(url, json=payload)
+print("Status code:", response.status_code)
+for item in response.json():
+    print(item["id"], item.get("result", item.get("error")))
+
+# Batch entries run concurrently and unordered, so check the result only after the batch returned.
+check = {
+    "jsonrpc": "2.0",
+    "method": "search",
+    "params": {"domain": "light", "state": "on", "attributes": []},
+    "id": len(payload) + 1,
+}
+item = requests.post(url, json=check).json()
+print("Lights still on:", item.get("result", item.get("error")))
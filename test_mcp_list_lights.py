@@ -4,14 +4,11 @@ url = "http://localhost:8081/mcp"
 payload = {
     "jsonrpc": "2.0",
     "method": "search",
-    "params": {},
+    "params": {"domain": "light", "attributes": []},
     "id": 3
 }
 response = requests.post(url, json=payload)
-result = response.json()["result"]
-
-# Filter for entities that are lights
-lights = [entity for entity in result if entity.get("entity_id", "").startswith("light.")]
+lights = response.json()["result"]["entities"]
 
 print("All light entities:")
 for light in lights:
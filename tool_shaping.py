@@ -0,0 +1,91 @@
+"""
+Compact, size-bounded tool results for the agent.
+
+Entity listings become per-domain counts plus one page of entity ids that fits the token
+budget, with a `next_cursor` to fetch the rest; states drop bookkeeping fields and noisy
+attributes. Token counts use tiktoken when installed, else ~4 characters per token.
+"""
+import json
+from collections import Counter
+from typing import Iterable, Optional
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # optional; not installed or no encoding data available offline
+    _encoding = None
+
+# Attributes that cost tokens without helping the model answer.
+NOISY_ATTRIBUTES = {
+    "icon", "entity_picture", "supported_features", "supported_color_modes", "attribution",
+    "friendly_name", "assumed_state", "editable", "id", "restored", "device_trackers",
+}
+MAX_STRING = 200
+
+
+def count_tokens(value) -> int:
+    text = value if isinstance(value, str) else json.dumps(value, separators=(",", ":"), default=str)
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def entity_page(entity_ids: Iterable[str], budget: int, cursor: Optional[str] = None) -> dict:
+    """Counts per domain plus the sorted entity ids after `cursor` that fit in `budget` tokens."""
+    entity_ids = sorted(entity_ids)
+    result = {"total": len(entity_ids), "by_domain": dict(Counter(e.split(".", 1)[0] for e in entity_ids))}
+    remaining = budget - count_tokens(result) - 16
+    page = []
+    for entity_id in entity_ids:
+        if cursor is not None and entity_id <= cursor:
+            continue
+        cost = count_tokens(entity_id) + 2
+        if remaining - cost < 0 and page:
+            break
+        page.append(entity_id)
+        remaining -= cost
+    result["entity_ids"] = page
+    shown_to = page[-1] if page else cursor
+    rest = sum(1 for e in entity_ids if shown_to is None or e > shown_to)
+    if rest:
+        result["next_cursor"] = shown_to
+        result["remaining"] = rest
+    return result
+
+
+def compact_attributes(attributes: dict) -> dict:
+    shaped = {}
+    for key, value in attributes.items():
+        if key in NOISY_ATTRIBUTES or value is None:
+            continue
+        if isinstance(value, str) and len(value) > MAX_STRING:
+            value = value[:MAX_STRING] + "…"
+        shaped[key] = value
+    return shaped
+
+
+def compact_state(state: dict, budget: Optional[int] = None) -> dict:
+    """entity_id, name, state, last_changed and the useful attributes; no context/last_updated."""
+    attributes = state.get("attributes") or {}
+    shaped = {"entity_id": state.get("entity_id"), "state": state.get("state")}
+    if attributes.get("friendly_name"):
+        shaped["name"] = attributes["friendly_name"]
+    shaped["attributes"] = compact_attributes(attributes)
+    if state.get("last_changed"):
+        shaped["last_changed"] = state["last_changed"]
+    return fit(shaped, budget)
+
+
+def fit(value: dict, budget: Optional[int]) -> dict:
+    """Drop a shaped state's most expensive attributes until it fits in `budget` tokens."""
+    if budget is None or count_tokens(value) <= budget:
+        return value
+    value = dict(value)
+    attributes = dict(value.get("attributes") or {})
+    for key in sorted(attributes, key=lambda k: count_tokens(attributes[k]), reverse=True):
+        if count_tokens(value) <= budget:
+            break
+        attributes.pop(key)
+        value["attributes"] = attributes
+        value["truncated"] = True
+    return value